@@ -0,0 +1,206 @@
+import threading
+import time
+from decimal import Decimal
+
+from engine import _int_or_float
+
+# 维护聚合所需的 car_data 列，全量重建时只读取这些列
+AGGREGATE_COLUMNS = ['car_brand', 'car_model', 'car_type', 'manufacture_year', 'popularity',
+                     'manufacturer_suggested_price', 'city_license_plates']
+
+
+def _number(value):
+    """数据库值转换为 float，空值或无法解析时返回 None（与 pd.to_numeric(errors='coerce') 一致）"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        value = float(value)
+    else:
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+    return None if value != value else value
+
+
+class _Totals:
+    """RunningAggregates 的累加状态，重建时在锁外构建一份新的，完成后整体替换"""
+
+    def __init__(self):
+        self.rows = 0
+        self.attention_sum = 0.0
+        self.total_registrations = 0.0
+        self.city_registrations = {}
+        self.type_registrations = {}
+        self.brand_counts = {}
+        # {年份: [记录数, 关注度总和, 指导价总和, 上牌量]}
+        self.years = {}
+        # 关注度最高的车型 (brand, model, attention)，关注度相同时保留先写入的
+        self.top = None
+
+    def apply(self, record):
+        self.rows += 1
+        attention = _number(record.get('popularity'))
+        self.attention_sum += attention or 0.0
+        brand = record.get('car_brand')
+        self.brand_counts[brand] = self.brand_counts.get(brand, 0) + 1
+        if attention is not None and (self.top is None or attention > self.top[2]):
+            self.top = (brand, record.get('car_model'), attention)
+
+        plates = record.get('city_license_plates')
+        registrations = 0.0
+        if isinstance(plates, dict):
+            for city, count in plates.items():
+                count = _number(count) or 0.0
+                self.city_registrations[city] = self.city_registrations.get(city, 0.0) + count
+                registrations += count
+            car_type = record.get('car_type')
+            self.type_registrations[car_type] = self.type_registrations.get(car_type, 0.0) + registrations
+        self.total_registrations += registrations
+
+        year = _number(record.get('manufacture_year'))
+        if year:
+            stats = self.years.setdefault(int(year), [0, 0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += attention or 0.0
+            stats[2] += _number(record.get('manufacturer_suggested_price')) or 0.0
+            stats[3] += registrations
+
+
+class RunningAggregates:
+    """
+    进程内增量维护的聚合结果：城市上牌量、年份趋势、类型上牌量、品牌车型数、
+    总上牌量、关注度总和与关注度最高的车型。
+
+    insert_data 每写入一批数据就调用 apply 累加增量，读取时直接返回累加结果，
+    不访问 Hive。只有启动后第一次读取或显式调用 rebuild 时才全量扫描 car_data。
+    统计口径与 engine 中基于快照的计算相同，键的顺序为首次出现的顺序。
+
+    重建在锁外扫描并构建新状态，只在替换时短暂持锁，读取和 apply 不会被扫描阻塞。
+    每次 apply / invalidate 都会递增写入版本号；扫描期间版本号变化说明有批次与扫描重叠，
+    无法确定扫描结果是否已包含这些批次，此时丢弃扫描结果重新扫描，避免重复累加。
+    增量只来自本进程的 insert_data，多进程部署时各进程的聚合互不可见。
+
+    Args:
+        max_rebuild_attempts (int): 扫描期间持续有写入时最多扫描的次数。
+    """
+
+    def __init__(self, max_rebuild_attempts=3):
+        self.max_rebuild_attempts = max_rebuild_attempts
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._totals = _Totals()
+        # apply / invalidate 的次数，用于判断重建扫描期间是否有写入
+        self._version = 0
+        self.built = False
+        self.rebuilds = 0
+        self.rebuild_conflicts = 0
+        self.rebuild_time_last = 0.0
+
+    def apply(self, records):
+        """累加一批已成功写入 car_data 的记录（数据库字段格式）；尚未构建时只记录版本号"""
+        with self._lock:
+            self._version += 1
+            if not self.built:
+                return
+            for record in records:
+                self._totals.apply(record)
+
+    def rebuild(self, load_batches):
+        """
+        从 car_data 的全量数据重建，并发调用时串行执行。
+
+        Args:
+            load_batches (Callable[[], Iterable[list[dict]]]): 返回数据库字段格式的记录批次，
+                例如 iter_data_with_filters；扫描期间有写入时会被再次调用。
+
+        Raises:
+            RuntimeError: 连续 max_rebuild_attempts 次扫描期间都有写入。
+        """
+        with self._build_lock:
+            self._rebuild(load_batches)
+
+    def _rebuild(self, load_batches):
+        for _ in range(self.max_rebuild_attempts):
+            started = time.time()
+            with self._lock:
+                version = self._version
+            totals = _Totals()
+            for batch in load_batches():
+                for record in batch:
+                    totals.apply(record)
+            with self._lock:
+                if self._version == version:
+                    self._totals = totals
+                    self.built = True
+                    self.rebuilds += 1
+                    self.rebuild_time_last = time.time() - started
+                    return
+                self.rebuild_conflicts += 1
+        raise RuntimeError(f'重建期间 car_data 持续写入，{self.max_rebuild_attempts} 次扫描均未完成')
+
+    def ensure_built(self, load_batches):
+        """尚未构建时以 load_batches() 的结果全量重建，并发调用时只重建一次"""
+        if self.built:
+            return
+        with self._build_lock:
+            if not self.built:
+                self._rebuild(load_batches)
+
+    def invalidate(self):
+        """无法确定增量时标记失效，下次读取时重建"""
+        with self._lock:
+            self._version += 1
+            self.built = False
+
+    def market_overview(self):
+        """格式与 func.aggregate_market_overview 相同"""
+        with self._lock:
+            totals = self._totals
+            if not totals.rows:
+                return {'total_registrations': 0, 'avg_attention': 0, 'brand_counts': {}, 'top_car': None}
+            top_car = None
+            if totals.top is not None:
+                brand, model, attention = totals.top
+                top_car = {'brand': brand, 'model': model, 'attention': _int_or_float(attention)}
+            return {
+                'total_registrations': _int_or_float(totals.total_registrations),
+                'avg_attention': totals.attention_sum / totals.rows,
+                'brand_counts': dict(totals.brand_counts),
+                'top_car': top_car,
+            }
+
+    def market_trends(self):
+        """格式与 engine.market_trends 相同，按年份升序"""
+        with self._lock:
+            return [{
+                'date': str(year),
+                'registrations': _int_or_float(registrations),
+                'attention': _int_or_float(attention),
+                'avg_price': price_sum / count
+            } for year, (count, attention, price_sum, registrations) in sorted(self._totals.years.items())]
+
+    def city_totals(self):
+        """返回 {城市: 上牌量总和}"""
+        with self._lock:
+            return {city: _int_or_float(count) for city, count in self._totals.city_registrations.items()}
+
+    def type_totals(self, rename=None):
+        """返回 {car_type: 上牌量总和}，格式与 engine.type_registrations 相同"""
+        rename = rename or {}
+        with self._lock:
+            result = {}
+            for car_type, count in self._totals.type_registrations.items():
+                label = rename.get(car_type, car_type)
+                result[label] = result.get(label, 0) + _int_or_float(count)
+            return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built': self.built,
+                'rows': self._totals.rows,
+                'rebuilds': self.rebuilds,
+                'rebuild_conflicts': self.rebuild_conflicts,
+                'rebuild_time_last': self.rebuild_time_last,
+            }
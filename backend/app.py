@@ -1,158 +1,403 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
-import pandas as pd
 import os
 import uuid
-from collections import defaultdict
-from func import read_data_with_filters, insert_data, rand_data_generate
+import base64
+import binascii
+import json
+import time
+import hashlib
+from functools import partial, wraps
+from func import (read_data_with_filters, count_data_with_filters, iter_data_with_filters, insert_data,
+                  iter_rand_data, hive_pool,
+                  aggregate_year_trends, aggregate_price_buckets, aggregate_type_registrations,
+                  aggregate_market_overview, aggregate_city_registrations, summary_city_registrations, summary_year_trends,
+                  summary_type_registrations, running_aggregates)
+from cache import SnapshotCache, get_data_version
+import engine
+from aggregates import AGGREGATE_COLUMNS
+from ingest import stream_excel_to_hive, check_excel, load_batches_into_hive, EmptyUploadError
+from jobs import JobManager, JobQueueFullError
+from json_provider import init_json_provider
+from response_cache import ResponseCache, supported_encodings
+from config import (HIVE_POOL_CONFIG, SNAPSHOT_CACHE_CONFIG, ANALYTICS_CONFIG, UPLOAD_CONFIG, GENERATE_CONFIG, JOB_CONFIG,
+                    RECOMMENDATION_CONFIG, RESPONSE_CACHE_CONFIG, FIELD_MAPPING)
 
 app = Flask(__name__)
 CORS(app)
+# 安装了 orjson 时用它序列化 JSON 响应
+init_json_provider(app)
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# 'hive': 聚合下推到 HiveServer2；'snapshot': 在进程内列式快照上计算
+app.config['ANALYTICS_SOURCE'] = ANALYTICS_CONFIG['source']
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# 字段映射字典（数据库字段 -> 前端字段）
-FIELD_MAPPING = {
-    'car_brand': 'brand',
-    'car_model': 'model',
-    'manufacturer_suggested_price': 'guide_price',
-    'engine_horsepower': 'horsepower',
-    'num_doors': 'doors',
-    'min_reference_price': 'min_price',
-    'popularity': 'attention',
-    'discount_percentage': 'discount',
-    'car_type': 'car_type',
-    #'manufacture_year': 'manufacture_year'
-}
+# 上传等耗时操作在后台线程中执行，接口立即返回任务ID
+job_manager = JobManager(**JOB_CONFIG)
+# 分析接口的响应字节缓存，数据版本号变化时自动清空
+response_cache = ResponseCache(**RESPONSE_CACHE_CONFIG)
 
-# 反转映射（前端字段 -> 数据库字段）
-REVERSE_MAPPING = {v: k for k, v in FIELD_MAPPING.items()}
+def _read_rows(name, filters=None, **query):
+    """读取 car_data 的指定列，失败时抛出异常；query 为 order_by / limit / offset"""
+    if filters:
+        output = read_data_with_filters(filters=filters, name=name, **query)
+    else:
+        output = read_data_with_filters(name=name, **query)
+    if output.get('status') != 'success':
+        raise RuntimeError(output.get('message', '读取数据失败'))
+    return output['data']
+
+
+def convert_car_record(item):
+    """将一行数据库记录转换为前端格式"""
+    car = {}
+    for db_field, front_field in FIELD_MAPPING.items():
+        car[front_field] = item.get(db_field)
+
+    # 添加原始数据中的关键字段（不在映射中）
+    car['city_license_plates'] = item.get('city_license_plates', {})
+    car['manufacture_year'] = item.get('manufacture_year')
+
+    # 处理历史价格
+    history_prices = []
+    if 'historical_price' in item and isinstance(item['historical_price'], dict):
+        for date, price in item['historical_price'].items():
+            history_prices.append({'date': date, 'price': price})
+    car['history_prices'] = history_prices
+
+    # 生成唯一ID（使用品牌+车型）
+    car['id'] = f"{car['brand']}_{car['model']}".replace(" ", "_")
+    car['model_id'] = car['id']
+    return car
 
 
 # 获取数据库数据
+def load_car_data():
+    """从Hive流式读取所有车型数据并转换为前端格式"""
+    cars = []
+    for batch in iter_data_with_filters(name='*'):
+        # 转换字段名和结构，原始批次随后即可释放
+        cars.extend(convert_car_record(item) for item in batch)
+    return tuple(cars)
+
+
+def load_city_data():
+    """从Hive流式读取城市上牌量数据并逐批汇总"""
+    city_registrations = {}
+    for batch in iter_data_with_filters(name='city, city_license_plates'):
+        for item in batch:
+            if not item.get('city_license_plates'):
+                continue
+
+            if isinstance(item['city_license_plates'], dict):
+                for city, count in item['city_license_plates'].items():
+                    city_registrations[city] = city_registrations.get(city, 0) + count
+
+    # 转换为前端格式
+    return city_records(city_registrations)
+
+
+# 进程级快照缓存：所有请求共享同一份只读数据，写入数据后自动刷新
+car_data_cache = SnapshotCache(lambda: engine.CarSnapshot(load_car_data()),
+                               ttl=SNAPSHOT_CACHE_CONFIG['ttl'], name='car_data')
+city_data_cache = SnapshotCache(load_city_data, ttl=SNAPSHOT_CACHE_CONFIG['ttl'], name='city_data')
+
+
+def fetch_car_snapshot():
+    """返回缓存的车型快照，包含行式记录 cars 与列式数组 columns"""
+    return car_data_cache.get()
+
+
 def fetch_car_data():
-    """从Hive获取所有车型数据并转换为前端格式"""
-    raw_data = read_data_with_filters(name='*')['data']
+    """返回缓存的车型数据快照（只读元组）"""
+    return fetch_car_snapshot().cars
 
-    # 转换字段名和结构
-    cars = []
-    for item in raw_data:
-        car = {}
-        for db_field, front_field in FIELD_MAPPING.items():
-            car[front_field] = item.get(db_field)
 
-        # 添加原始数据中的关键字段（不在映射中）
-        car['city_license_plates'] = item.get('city_license_plates', {})
-        car['manufacture_year'] = item.get('manufacture_year')
+def city_records(city_registrations):
+    """{城市: 上牌量} 转换为前端格式的只读元组"""
+    return tuple({'id': city_id, 'city': city, 'registrations': registrations}
+                 for city_id, (city, registrations) in enumerate(city_registrations.items()))
 
-        # 处理历史价格
-        history_prices = []
-        if 'historical_price' in item and isinstance(item['historical_price'], dict):
-            for date, price in item['historical_price'].items():
-                history_prices.append({'date': date, 'price': price})
-        car['history_prices'] = history_prices
 
-        # 生成唯一ID（使用品牌+车型）
-        car['id'] = f"{car['brand']}_{car['model']}".replace(" ", "_")
-        car['model_id'] = car['id']
+def fetch_city_data(snapshot=None):
+    """
+    返回城市上牌量数据（只读元组），summary 模式读汇总表，hive 模式在 Hive 端聚合，
+    memory 模式读增量聚合，否则读缓存的快照；
+    传入车型快照时直接从快照的列式数据汇总，不再单独扫描城市数据。
+    """
+    if use_summary_tables():
+        return city_records(summary_city_registrations())
+    if use_hive_pushdown():
+        return city_records(aggregate_city_registrations())
+    if use_running_aggregates():
+        return city_records(fetch_running_aggregates().city_totals())
+    if snapshot is not None:
+        return city_records(engine.city_registrations(snapshot.columns))
+    return city_data_cache.get()
 
-        cars.append(car)
-    return cars
 
+def fetch_running_aggregates():
+    """返回进程内增量聚合，启动后第一次使用时从 car_data 全量构建"""
+    running_aggregates.ensure_built(lambda: iter_data_with_filters(name=', '.join(AGGREGATE_COLUMNS)))
+    return running_aggregates
 
-def fetch_city_data():
-    """从Hive获取城市上牌量数据"""
-    raw_data = read_data_with_filters(name='city, city_license_plates')['data']
 
-    # 汇总城市数据
-    city_registrations = {}
-    for item in raw_data:
-        if not item.get('city_license_plates'):
-            continue
+def use_running_aggregates():
+    """市场概览、趋势、城市和类型统计是否读取进程内增量聚合"""
+    return app.config['ANALYTICS_SOURCE'] == 'memory'
 
-        if isinstance(item['city_license_plates'], dict):
-            for city, count in item['city_license_plates'].items():
-                city_registrations[city] = city_registrations.get(city, 0) + count
 
-    # 转换为前端格式
-    cities = []
-    for city_id, (city, registrations) in enumerate(city_registrations.items()):
-        cities.append({
-            'id': city_id,
-            'city': city,
-            'registrations': registrations
-        })
-    return cities
-
-
-def fetch_market_trends_data():
-    """从真实数据获取市场趋势数据"""
-    cars = fetch_car_data()
-
-    # 按年份分组
-    year_data = defaultdict(lambda: {
-        'registrations': 0,
-        'attention': 0,
-        'price_sum': 0,
-        'count': 0
-    })
-
-    # 计算各年份的统计数据
-    for car in cars:
-        year = car.get('manufacture_year')
-        if not year:
-            continue
-
-        # 计算该车型的总注册量（所有城市）
-        registrations = 0
-        license_plates = car.get('city_license_plates', {})
-        if isinstance(license_plates, dict):
-            registrations = sum(license_plates.values())
-
-        # 累加数据
-        year_data[year]['registrations'] += registrations
-        year_data[year]['attention'] += car.get('attention', 0)
-        year_data[year]['price_sum'] += car.get('guide_price', 0)
-        year_data[year]['count'] += 1
-
-    # 构建趋势数据
-    trends = []
-    for year, data in sorted(year_data.items()):
-        if data['count'] > 0:
-            trends.append({
-                'date': str(year),
-                'registrations': data['registrations'],
-                'attention': data['attention'],
-                'avg_price': data['price_sum'] / data['count']
-            })
-
-    return trends
-
-
-def fetch_consumer_preferences():
+def use_hive_pushdown():
+    """分析接口是否把筛选和聚合下推到 Hive（summary 模式下没有汇总表的接口同样下推）"""
+    return app.config['ANALYTICS_SOURCE'] in ('hive', 'summary')
+
+
+def use_summary_tables():
+    """城市、年份趋势和类型统计是否读取预计算汇总表"""
+    return app.config['ANALYTICS_SOURCE'] == 'summary'
+
+
+def fetch_market_trends_data(snapshot=None):
+    """从真实数据获取市场趋势数据；snapshot 为快照模式下使用的车型快照，默认取缓存的快照"""
+    if use_running_aggregates():
+        return fetch_running_aggregates().market_trends()
+    if use_summary_tables():
+        return summary_year_trends()
+    if use_hive_pushdown():
+        return aggregate_year_trends()
+    return engine.market_trends((snapshot or fetch_car_snapshot()).columns)
+
+
+def fetch_market_overview(snapshot=None):
+    """返回市场概览，top_car 为包含 brand/model/attention 的字典，无数据时为 None"""
+    if use_running_aggregates():
+        return fetch_running_aggregates().market_overview()
+    if use_hive_pushdown():
+        return aggregate_market_overview()
+    return snapshot_market_overview(snapshot or fetch_car_snapshot())
+
+
+def snapshot_market_overview(snapshot):
+    """在车型快照的列式数据上计算市场概览"""
+    overview = engine.market_overview(snapshot.columns)
+    top_row = overview.pop('top_row')
+    overview['top_car'] = snapshot.cars[top_row] if top_row is not None else None
+    return overview
+
+
+def fetch_price_distribution(edges, snapshot=None):
+    """按 min_price 分桶，返回每个区间的 (count, avg_attention)"""
+    if use_hive_pushdown():
+        return aggregate_price_buckets(edges)
+    return engine.price_distribution((snapshot or fetch_car_snapshot()).columns, edges)
+
+
+# 推荐接口只需要的数据库列
+RECOMMENDATION_COLUMNS = ['car_brand', 'car_model', 'min_reference_price',
+                          'engine_horsepower', 'car_type', 'popularity']
+# 关注度相同时按品牌、车型排序，保证 Hive 分页结果稳定
+RECOMMENDATION_ORDER = 'popularity DESC, car_brand, car_model'
+
+
+def recommendation_filter_spec(filters):
+    """将推荐接口的查询参数转换为 read_data_with_filters 的篩选条件"""
+    spec = {}
+    if filters['brand']:
+        spec['car_brand'] = filters['brand']
+    if filters['car_type']:
+        spec['car_type'] = filters['car_type']
+    price_range = {}
+    if filters['min_price'] is not None:
+        price_range['>='] = filters['min_price']
+    if filters['max_price'] is not None:
+        price_range['<='] = filters['max_price']
+    if price_range:
+        spec['min_reference_price'] = price_range
+    if filters['min_hp'] is not None:
+        spec['engine_horsepower'] = {'>=': filters['min_hp']}
+    if filters['doors'] is not None:
+        spec['num_doors'] = filters['doors']
+    return spec
+
+
+def select_recommended_cars(filters, limit, offset=0):
+    """
+    返回按关注度降序排列的第 offset 到 offset + limit 个车型（前端格式），不查询总数。
+
+    hive 模式下一次读完结果、归还连接后才返回，流式输出期间不占用连接池中的连接。
+    """
+    if use_hive_pushdown():
+        rows = _read_rows(', '.join(RECOMMENDATION_COLUMNS), recommendation_filter_spec(filters),
+                          order_by=RECOMMENDATION_ORDER, limit=limit, offset=offset)
+        return [convert_car_record(item) for item in rows]
+    snapshot = fetch_car_snapshot()
+    rows, _ = engine.top_cars(snapshot.columns, limit, offset, **filters)
+    return [snapshot.cars[row] for row in rows]
+
+
+def fetch_recommended_cars(filters, limit, offset=0):
+    """
+    返回按关注度降序排列的第 offset 到 offset + limit 个车型（前端格式）及满足条件的总数。
+
+    hive 模式下排序和分页通过 ORDER BY ... LIMIT 下推到 Hive，总数另用 COUNT(*) 查询；
+    快照模式下只对前 offset + limit 个候选行排序。
+    """
+    if use_hive_pushdown():
+        spec = recommendation_filter_spec(filters)
+        rows = _read_rows(', '.join(RECOMMENDATION_COLUMNS), spec,
+                          order_by=RECOMMENDATION_ORDER, limit=limit, offset=offset)
+        # 第一页未取满时行数即为总数，不需要再查询
+        if offset == 0 and len(rows) < limit:
+            total = len(rows)
+        else:
+            total = count_data_with_filters(spec)
+        return [convert_car_record(item) for item in rows], total
+    snapshot = fetch_car_snapshot()
+    rows, total = engine.top_cars(snapshot.columns, limit, offset, **filters)
+    return [snapshot.cars[row] for row in rows], total
+
+
+def encode_cursor(offset):
+    """将下一页的偏移量编码为不透明的游标字符串"""
+    return base64.urlsafe_b64encode(json.dumps({'offset': offset}).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析 encode_cursor 生成的游标，返回偏移量；格式错误时抛出 ValueError"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    offset = data.get('offset') if isinstance(data, dict) else None
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise ValueError('Invalid cursor')
+    return offset
+
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_ndjson():
+    """是否以 NDJSON 流式返回：查询参数 stream=1，或 Accept 首选 application/x-ndjson"""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def ndjson_response(rows):
+    """
+    将 rows 逐行序列化为 NDJSON 流式响应，每行一个 JSON 对象。
+
+    rows 可以是生成器，在发送响应时才逐个求值，首字节时间和内存峰值与结果集大小无关。
+    """
+    def generate():
+        for row in rows:
+            yield app.json.dumps(row) + '\n'
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+# 进程启动标识：重启后数据版本号从 0 重新计数，加入 ETag 避免与重启前的 ETag 相同
+_BOOT_ID = uuid.uuid4().hex
+
+
+def response_etag():
+    """
+    根据数据版本号和请求计算 ETag。
+
+    同一数据版本下，同一路径、同一组查询参数和同一返回格式的响应内容相同；
+    insert_data 写入数据后版本号递增，所有 ETag 随之变化。快照按 ttl 刷新以读到
+    其他进程的写入，ETag 也按同样的周期变化。
+    """
+    key = json.dumps([
+        _BOOT_ID,
+        get_data_version(),
+        app.config['ANALYTICS_SOURCE'],
+        int(time.time() // SNAPSHOT_CACHE_CONFIG['ttl']),
+        request.path,
+        sorted(request.args.items(multi=True)),
+        wants_ndjson(),
+    ], ensure_ascii=False)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def etag_cached(view):
+    """
+    分析接口的条件请求装饰器：响应带 ETag，If-None-Match 命中时直接返回 304，不执行 view。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = response_etag()
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        # 弱 ETag：gzip / brotli 等不同压缩编码的响应内容等价，共用同一个 ETag
+        response.set_etag(etag, weak=True)
+        # 允许客户端缓存，但每次使用前都要用 If-None-Match 重新验证
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+
+def response_cached(view):
+    """
+    缓存 view 返回的响应字节，按 Accept-Encoding 返回 gzip / brotli 压缩后的内容。
+
+    缓存键与 ETag 相同（数据版本号、路径、规范化的查询参数和返回格式）；
+    流式响应和非 200 响应不缓存。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not response_cache.enabled:
+            return view(*args, **kwargs)
+        version = get_data_version()
+        key = response_etag()
+        entry = response_cache.get(key)
+        if entry is None:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            entry = response_cache.put(key, response.get_data(), response.mimetype, version)
+
+        encoding = request.accept_encodings.best_match(supported_encodings() + ('identity',), default='identity')
+        data = response_cache.encode(entry, encoding)
+        response = app.response_class(data, mimetype=entry.mimetype)
+        if data is not entry.body:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+    return wrapper
+
+
+# 消费者偏好中将"新能源"替换为"电动汽车"
+PREFERENCE_TYPE_RENAME = {'新能源': '电动汽车'}
+
+
+def fetch_consumer_preferences(snapshot=None):
     """从真实数据获取消费者偏好数据"""
-    cars = fetch_car_data()
+    rename = PREFERENCE_TYPE_RENAME
+    if use_running_aggregates():
+        type_data = fetch_running_aggregates().type_totals(rename=rename)
+    elif use_hive_pushdown():
+        type_data = {}
+        type_registrations = summary_type_registrations() if use_summary_tables() else aggregate_type_registrations()
+        for car_type, count in type_registrations.items():
+            car_type = rename.get(car_type, car_type)
+            type_data[car_type] = type_data.get(car_type, 0) + count
+    else:
+        type_data = engine.type_registrations((snapshot or fetch_car_snapshot()).columns, rename=rename)
+    return preferences_payload(type_data)
 
-    # 计算总注册量
-    total_registrations = 0
-    for car in cars:
-        if 'city_license_plates' in car and isinstance(car['city_license_plates'], dict):
-            total_registrations += sum(car['city_license_plates'].values())
 
+def preferences_payload(type_data):
+    """{车型类型: 上牌量} 转换为各类型的上牌占比"""
+    # 计算总注册量
+    total_registrations = sum(type_data.values())
     if total_registrations == 0:
         return []
 
-    # 按车型类型分组
-    type_data = defaultdict(int)
-    for car in cars:
-        car_type = car.get('car_type', '')
-        # 将"新能源"替换为"电动汽车"
-        if car_type == '新能源':
-            car_type = '电动汽车'
-
-        if 'city_license_plates' in car and isinstance(car['city_license_plates'], dict):
-            type_data[car_type] += sum(car['city_license_plates'].values())
-
     # 构建偏好数据
     preferences = []
     for car_type, count in type_data.items():
@@ -192,112 +437,168 @@ def upload_excel():
         # 保存文件
         file.save(file_path)
 
-        # 尝试解析Excel
+        # 同步校验表头和第一行，空文件和无效文件直接返回400
         try:
-            # 验证Excel文件有效性
-            df = pd.read_excel(file_path)
-
-            # 检查是否为空文件
-            if df.empty:
-                return jsonify({'error': 'Excel file is empty'}), 400
-
-            # 1. 将DataFrame转换为字典列表
-            data_list = df.to_dict(orient='records')
-
-            # 2. 转换字段名：前端字段 -> 数据库字段
-            for record in data_list:
-                # 创建新字典存储转换后的字段
-                converted_record = {}
-
-                # 转换映射字段
-                for front_field, db_field in REVERSE_MAPPING.items():
-                    if front_field in record:
-                        converted_record[db_field] = record[front_field]
-
-                # 添加非映射字段（直接使用数据库字段名）
-                non_mapped_fields = ['city', 'manufacture_year', 'fuel_capacity',
-                                    'historical_price', 'city_license_plates']
-                for field in non_mapped_fields:
-                    if field in record:
-                        converted_record[field] = record[field]
-
-                # 更新原始记录
-                record.clear()
-                record.update(converted_record)
-
-            # 3. 插入数据到Hive
-            #from func import insert_data  # 延迟导入避免循环依赖
-            insert_data(data_list)
-
-            processed_count = len(df)
-
-            # 实际应用中这里会有数据库插入逻辑
-            return jsonify({
-                'status': 'success',
-                'message': f'成功插入{processed_count} 行数到表'
-            }), 200
+            check_excel(file_path)
+        except EmptyUploadError:
+            os.remove(file_path)
+            return jsonify({'error': 'Excel file is empty'}), 400
         except Exception as e:
-            # 捕获Excel解析错误
             app.logger.error(f'Error parsing Excel file: {str(e)}')
+            os.remove(file_path)
             return jsonify({'error': 'Invalid Excel file content'}), 400
-        finally:
-            # 清理上传的文件
-            if os.path.exists(file_path):
-                os.remove(file_path)
+
+        try:
+            job = job_manager.submit('upload_excel', run_upload_job, file_path, description=file.filename)
+        except JobQueueFullError:
+            os.remove(file_path)
+            return jsonify({'error': 'Too many pending jobs'}), 503
+        return jsonify({
+            'status': 'accepted',
+            'job_id': job.id,
+            'status_url': f'/api/v1/jobs/{job.id}'
+        }), 202
     except Exception as e:
         app.logger.error(f'File upload error: {str(e)}')
         return jsonify({'error': 'Internal server error'}), 500
 
-# 新增：随机数据生成API
-'''
+
+def load_status(summary):
+    """根据插入汇总判断任务结果：全部失败为 'error'（任务标记为失败），部分失败为 'partial'"""
+    if not summary['rows_failed']:
+        return 'success'
+    return 'error' if not summary['rows_inserted'] else 'partial'
+
+
+def run_upload_job(job, file_path):
+    """后台任务：按块流式解析、转换字段名并插入Hive，每插入一块更新一次进度"""
+    def progress(summary):
+        job.update_progress(**{k: v for k, v in summary.items() if k not in ('errors', 'rejections')})
+        for message in summary['errors'][len(job.errors):]:
+            job.add_error(message)
+
+    try:
+        summary = stream_excel_to_hive(
+            file_path,
+            insert_fn=insert_data,
+            chunk_size=UPLOAD_CONFIG['chunk_size'],
+            queue_size=UPLOAD_CONFIG['queue_size'],
+            progress=progress
+        )
+    finally:
+        # 清理上传的文件
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    status = load_status(summary)
+    return {
+        'status': status,
+        'message': (f"全部 {summary['rows_failed']} 行插入失败" if status == 'error'
+                    else f"成功插入{summary['rows_inserted']} 行数到表"),
+        'rows_parsed': summary['rows_parsed'],
+        'rows_inserted': summary['rows_inserted'],
+        'rows_rejected': summary['rows_rejected'],
+        'rows_failed': summary['rows_failed'],
+        'rejections': summary['rejections']
+    }
+
+
+@app.route('/api/v1/jobs/<job_id>')
+def get_job(job_id):
+    """查询后台任务的状态、进度（已解析/已插入行数）、吞吐量和错误信息"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+# 新增：随机数据生成API，按块生成并由线程池并发插入，作为后台任务运行
 @app.route('/api/v1/generate/random', methods=['POST'])
 def generate_random_data():
     try:
+        payload = request.get_json(silent=True) or {}
         # 获取请求中的记录数量
-        num_records = request.json.get('num_records', 100)
+        num_records = payload.get('num_records', 100)
+        chunk_size = payload.get('chunk_size', GENERATE_CONFIG['chunk_size'])
+        seed = payload.get('seed')
 
         # 验证记录数量
-        if num_records <= 0:
+        for name, value in (('num_records', num_records), ('chunk_size', chunk_size)):
+            if not isinstance(value, int) or isinstance(value, bool):
+                return jsonify({'error': f'{name} must be an integer'}), 400
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+            return jsonify({'error': 'seed must be an integer'}), 400
+        if num_records <= 0 or chunk_size <= 0:
             return jsonify({'error': 'Number of records must be positive'}), 400
-        if num_records > 10000:
-            return jsonify({'error': 'Number of records cannot exceed 10000'}), 400
-
-        # 生成随机数据
-        random_data = rand_data_generate(num_records)
-
-        # 插入数据到Hive
-        insert_data(random_data)
+        if num_records > GENERATE_CONFIG['max_records']:
+            return jsonify({'error': f"Number of records cannot exceed {GENERATE_CONFIG['max_records']}"}), 400
+        # 每块都要完整生成在内存中，限制单块大小
+        chunk_size = min(chunk_size, GENERATE_CONFIG['max_chunk_size'])
 
+        try:
+            job = job_manager.submit('generate_random', run_generate_job, num_records, chunk_size, seed,
+                                     description=f'{num_records} records')
+        except JobQueueFullError:
+            return jsonify({'error': 'Too many pending jobs'}), 503
         return jsonify({
-            'status': 'success',
-            'message': f'成功生成并插入 {num_records} 条随机数据'
-        }), 200
+            'status': 'accepted',
+            'job_id': job.id,
+            'status_url': f'/api/v1/jobs/{job.id}'
+        }), 202
 
     except Exception as e:
         app.logger.error(f'Random data generation error: {str(e)}')
         return jsonify({'error': 'Internal server error'}), 500
-'''
+
+
+def run_generate_job(job, num_records, chunk_size, seed):
+    """后台任务：分块生成随机数据并并发插入Hive，每完成一块更新一次进度"""
+    def progress(summary):
+        job.update_progress(**{k: v for k, v in summary.items() if k != 'errors'})
+        for message in summary['errors'][len(job.errors):]:
+            job.add_error(message)
+
+    # 并发已在块之间展开，每块内部只用一个连接串行插入，
+    # 借用的连接总数不超过 max_workers，不会在连接池上排队超时
+    summary = load_batches_into_hive(
+        iter_rand_data(num_records, batch_size=chunk_size, seed=seed),
+        insert_fn=partial(insert_data, max_workers=1),
+        max_workers=min(GENERATE_CONFIG['max_workers'], HIVE_POOL_CONFIG['max_size']),
+        progress=progress
+    )
+    status = load_status(summary)
+    return {
+        'status': status,
+        'message': (f"全部 {summary['rows_failed']} 条随机数据插入失败" if status == 'error'
+                    else f"成功生成并插入 {summary['rows_inserted']} 条随机数据"),
+        'rows_generated': summary['rows_generated'],
+        'rows_inserted': summary['rows_inserted'],
+        'rows_failed': summary['rows_failed']
+    }
 
 # 品牌与车型深度分析API
 @app.route('/api/v1/brands', methods=['GET'])
+@etag_cached
+@response_cached
 def get_brands():
-    cars = fetch_car_data()
-    brands = list(set(car['brand'] for car in cars))
+    brands = list(fetch_car_snapshot().brands)
     return jsonify({'brands': brands}), 200
 
 
 @app.route('/api/v1/brands/<brand_name>/models', methods=['GET'])
+@etag_cached
+@response_cached
 def get_brand_models(brand_name):
-    cars = fetch_car_data()
-    models = [{'id': car['model_id'], 'name': car['model']}
-              for car in cars if car['brand'] == brand_name]
-    return jsonify({'models': models}), 200
+    models = fetch_car_snapshot().models_by_brand.get(brand_name, ())
+    if wants_ndjson():
+        return ndjson_response(models)
+    return jsonify({'models': list(models)}), 200
 
 
 @app.route('/api/v1/models/<model_id>', methods=['GET'])
+@etag_cached
+@response_cached
 def get_model_details(model_id):
-    cars = fetch_car_data()
-    car = next((car for car in cars if car['model_id'] == model_id), None)
+    car = fetch_car_snapshot().model_index.get(model_id)
     if not car:
         return jsonify({'error': 'Model not found'}), 404
 
@@ -309,29 +610,57 @@ def get_model_details(model_id):
 
 # 区域市场分析API
 @app.route('/api/v1/cities', methods=['GET'])
+@etag_cached
+@response_cached
 def get_cities():
     cities = fetch_city_data()
-    city_list = [{'id': city['id'], 'name': city['city']} for city in cities]
-    return jsonify({'cities': city_list}), 200
+    city_list = ({'id': city['id'], 'name': city['city']} for city in cities)
+    if wants_ndjson():
+        return ndjson_response(city_list)
+    return jsonify({'cities': list(city_list)}), 200
 
 
 @app.route('/api/v1/cities/rankings', methods=['GET'])
+@etag_cached
+@response_cached
 def get_city_rankings():
-    cities = fetch_city_data()
     metric = request.args.get('metric', 'registrations')
-
-    if metric not in ['registrations', 'attention']:
+    if metric not in RANKING_METRICS:
         return jsonify({'error': 'Invalid metric'}), 400
 
+    result = iter_city_rankings(fetch_city_data(), metric)
+    if wants_ndjson():
+        return ndjson_response(result)
+    return jsonify({'rankings': list(result)}), 200
+
+
+RANKING_METRICS = ['registrations', 'attention']
+
+
+def iter_city_rankings(cities, metric):
+    """按 metric 降序逐个产出城市排名"""
     sorted_cities = sorted(cities, key=lambda x: x.get(metric, 0), reverse=True)
-    result = [{'city': city['city'], metric: city.get(metric, 0)} for city in sorted_cities]
-    return jsonify({'rankings': result}), 200
+    return ({'city': city['city'], metric: city.get(metric, 0)} for city in sorted_cities)
+
+
+def recommendation_item(car):
+    """车型记录转换为推荐接口的输出格式"""
+    return {
+        'id': car['model_id'],
+        'brand': car['brand'],
+        'model': car['model'],
+        'min_price': car['min_price'],
+        'horsepower': car['horsepower'],
+        'car_type': car['car_type'],
+        'attention': car['attention']
+    }
 
 
 # 消费者建议API
 @app.route('/api/v1/recommendations', methods=['GET'])
+@etag_cached
+@response_cached
 def get_recommendations():
-    cars = fetch_car_data()
     filters = {
         'brand': request.args.get('brand'),
         'min_price': request.args.get('min_price', type=float),
@@ -340,115 +669,109 @@ def get_recommendations():
         'doors': request.args.get('doors', type=int),
         'car_type': request.args.get('car_type'),
     }
+    # 流式返回时不指定 limit 表示返回 max_limit 个车型，单次流式响应的行数同样受 max_limit 限制
+    stream = wants_ndjson()
+    limit = request.args.get('limit', RECOMMENDATION_CONFIG['max_limit' if stream else 'default_limit'], type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if not 1 <= limit <= RECOMMENDATION_CONFIG['max_limit']:
+        return jsonify({'error': f"Limit must be between 1 and {RECOMMENDATION_CONFIG['max_limit']}"}), 400
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            offset = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    if offset < 0:
+        return jsonify({'error': 'Offset must be non-negative'}), 400
 
-    filtered_cars = cars
-    if filters['brand']:
-        filtered_cars = [car for car in filtered_cars if car['brand'] == filters['brand']]
-
-    if filters['min_price'] is not None:
-        filtered_cars = [car for car in filtered_cars if car['min_price'] >= filters['min_price']]
-
-    if filters['max_price'] is not None:
-        filtered_cars = [car for car in filtered_cars if car['min_price'] <= filters['max_price']]
-
-    if filters['min_hp'] is not None:
-        filtered_cars = [car for car in filtered_cars if car['horsepower'] >= filters['min_hp']]
-
-    if filters['doors'] is not None:
-        filtered_cars = [car for car in filtered_cars if car['doors'] == filters['doors']]
-
-    if filters['car_type']:
-        filtered_cars = [car for car in filtered_cars if car['car_type'] == filters['car_type']]
+    # 流式返回时先读完本页车型再逐行输出，不查询总数
+    if stream:
+        return ndjson_response(recommendation_item(car) for car in select_recommended_cars(filters, limit, offset))
 
-    filtered_cars.sort(key=lambda x: x['attention'], reverse=True)
-    recommendations = [{
-        'id': car['model_id'],
-        'brand': car['brand'],
-        'model': car['model'],
-        'min_price': car['min_price'],
-        'horsepower': car['horsepower'],
-        'car_type': car['car_type'],
-        'attention': car['attention']
-    } for car in filtered_cars]
+    cars, total = fetch_recommended_cars(filters, limit, offset)
+    recommendations = [recommendation_item(car) for car in cars]
 
-    return jsonify({'recommendations': recommendations}), 200
+    next_offset = offset + len(recommendations)
+    return jsonify({
+        'recommendations': recommendations,
+        'total': total,
+        'limit': limit,
+        'offset': offset,
+        'next_cursor': encode_cursor(next_offset) if next_offset < total else None
+    }), 200
 
 
 # 市场分析API
 @app.route('/api/v1/market/overview', methods=['GET'])
+@etag_cached
+@response_cached
 def market_overview():
-    cities = fetch_city_data()
-    cars = fetch_car_data()
+    return jsonify(market_overview_payload(fetch_market_overview())), 200
 
-    total_registrations = sum(city['registrations'] for city in cities)
-    avg_attention = sum(car['attention'] for car in cars) / len(cars) if cars else 0
 
-    brand_counts = defaultdict(int)
-    for car in cars:
-        brand_counts[car['brand']] += 1
-
-    if cars:
-        top_car = max(cars, key=lambda x: x['attention'])
+def market_overview_payload(overview):
+    """市场概览转换为接口输出格式"""
+    top_car = overview['top_car']
+    if top_car is not None:
         top_car_info = f"{top_car['brand']} {top_car['model']} (关注度: {top_car['attention']})"
     else:
         top_car_info = "无数据"
 
-    return jsonify({
-        'total_registrations': total_registrations,
-        'avg_attention': avg_attention,
-        'popular_brands': dict(brand_counts),
+    return {
+        'total_registrations': overview['total_registrations'],
+        'avg_attention': overview['avg_attention'],
+        'popular_brands': overview['brand_counts'],
         'top_car': top_car_info
-    }), 200
+    }
 
 
 @app.route('/api/v1/market/trends', methods=['GET'])
+@etag_cached
+@response_cached
 def market_trends():
     metric = request.args.get('metric', 'registrations')
-    if metric not in ['registrations', 'attention', 'avg_price']:
+    if metric not in TREND_METRICS:
         return jsonify({'error': 'Invalid metric'}), 400
 
     # 获取真实市场趋势数据
-    market_trends_data = fetch_market_trends_data()
+    return jsonify(market_trends_payload(fetch_market_trends_data(), metric)), 200
 
-    data_points = [{'date': point['date'], 'value': point[metric]} for point in market_trends_data]
 
-    return jsonify({
+TREND_METRICS = ['registrations', 'attention', 'avg_price']
+
+
+def market_trends_payload(market_trends_data, metric):
+    """按年份的市场趋势转换为单一指标的接口输出格式"""
+    data_points = [{'date': point['date'], 'value': point[metric]} for point in market_trends_data]
+    return {
         'metric': metric,
         'granularity': 'yearly',
         'data': data_points
-    }), 200
+    }
 
 
 @app.route('/api/v1/market/price_distribution', methods=['GET'])
+@etag_cached
+@response_cached
 def price_distribution():
-    cars = fetch_car_data()
-    # 定义价格区间（单位：元）
-    price_ranges = [
-        (0, 100_000),  # 0-10万元
-        (100_000, 200_000),  # 10-20万元
-        (200_000, 300_000),  # 20-30万元
-        (300_000, 500_000),  # 30-50万元
-        (500_000, float('inf'))  # 50万元以上
-    ]
+    return jsonify(price_distribution_payload(fetch_price_distribution(PRICE_EDGES))), 200
 
+
+# 价格区间（单位：元），最后一个区间为 50万元以上
+PRICE_EDGES = [0, 100_000, 200_000, 300_000, 500_000]
+
+
+def price_distribution_payload(buckets, price_edges=PRICE_EDGES):
+    """价格分桶结果转换为接口输出格式"""
     distribution = []
-    for min_price, max_price in price_ranges:
+    for i, (count, avg_attention) in enumerate(buckets):
         # 转换价格区间为万元显示
-        min_wan = min_price // 10_000
-        if max_price == float('inf'):
+        min_wan = price_edges[i] // 10_000
+        if i == len(price_edges) - 1:
             range_str = f"{min_wan}万以上"
-            cars_in_range = [car for car in cars if car['min_price'] >= min_price]
         else:
-            max_wan = max_price // 10_000
+            max_wan = price_edges[i + 1] // 10_000
             range_str = f"{min_wan}万-{max_wan}万"
-            cars_in_range = [car for car in cars if min_price <= car['min_price'] < max_price]
-
-        count = len(cars_in_range)
-        # 计算平均关注度（避免除以零）
-        if count > 0:
-            avg_attention = sum(car['attention'] for car in cars_in_range) / count
-        else:
-            avg_attention = 0
 
         distribution.append({
             'range': range_str,
@@ -456,11 +779,13 @@ def price_distribution():
             'avg_attention': avg_attention
         })
 
-    return jsonify({'distribution': distribution}), 200
+    return {'distribution': distribution}
 
 
 # 消费者洞察API
 @app.route('/api/v1/consumer_insights/preferences', methods=['GET'])
+@etag_cached
+@response_cached
 def consumer_preferences():
     dimension = request.args.get('dimension', 'type')
 
@@ -481,5 +806,58 @@ def consumer_preferences():
         }]), 200
 
 
+# 仪表盘API：一次请求返回市场概览、趋势、价格分布、消费者偏好和城市排名
+@app.route('/api/v1/dashboard', methods=['GET'])
+@etag_cached
+@response_cached
+def dashboard():
+    trend_metric = request.args.get('trend_metric', 'registrations')
+    ranking_metric = request.args.get('ranking_metric', 'registrations')
+    if trend_metric not in TREND_METRICS or ranking_metric not in RANKING_METRICS:
+        return jsonify({'error': 'Invalid metric'}), 400
+
+    # 无论 ANALYTICS_SOURCE 为何，所有面板都基于同一份车型快照计算，保证各面板来自同一数据版本；
+    # 快照按数据版本号缓存，hive / summary 模式下也只在数据变化后扫描一次 car_data，
+    # 城市排名同样从该快照汇总，不再单独扫描城市数据
+    snapshot = fetch_car_snapshot()
+    columns = snapshot.columns
+    type_data = engine.type_registrations(columns, rename=PREFERENCE_TYPE_RENAME)
+    cities = city_records(engine.city_registrations(columns))
+
+    return jsonify({
+        'market_overview': market_overview_payload(snapshot_market_overview(snapshot)),
+        'market_trends': market_trends_payload(engine.market_trends(columns), trend_metric),
+        'price_distribution': price_distribution_payload(engine.price_distribution(columns, PRICE_EDGES)),
+        'consumer_preferences': preferences_payload(type_data),
+        'city_rankings': {'rankings': list(iter_city_rankings(cities, ranking_metric))},
+    }), 200
+
+
+# 运行状态API
+@app.route('/api/v1/system/stats', methods=['GET'])
+def system_stats():
+    return jsonify({
+        'data_version': get_data_version(),
+        'response_cache': response_cache.stats(),
+        'hive_pool': hive_pool.stats(),
+        'snapshot_cache': {
+            'car_data': car_data_cache.stats(),
+            'city_data': city_data_cache.stats(),
+        },
+        'running_aggregates': running_aggregates.stats()
+    }), 200
+
+
+@app.route('/api/v1/system/aggregates/rebuild', methods=['POST'])
+def rebuild_aggregates():
+    """从 car_data 全量重建进程内增量聚合"""
+    try:
+        running_aggregates.rebuild(lambda: iter_data_with_filters(name=', '.join(AGGREGATE_COLUMNS)))
+    except Exception as e:
+        app.logger.error(f'Aggregate rebuild error: {str(e)}')
+        return jsonify({'error': 'Internal server error'}), 500
+    return jsonify(running_aggregates.stats()), 200
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+基准测试数据集生成工具。
+
+按固定规模（10k / 1m / 50m 行）生成 car_data 随机数据，多进程并行写出分片文件：
+文本格式与 create_hive_table 声明的 TEXTFILE 分隔符一致，可直接 LOAD DATA；
+可选同时写出 Parquet（需要安装 pyarrow）。输出目录中的 manifest.json 记录
+每个分片的行数、字节数和 sha256，便于团队成员确认使用的是同一份基线数据。
+
+用法:
+    python bench_data.py --scale 1m --out bench/sf_1m
+    python bench_data.py --scale 50m --out bench/sf_50m --format both --workers 16
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import car_data_schema, BULK_LOAD_CONFIG
+from func import iter_rand_columns
+from utils import (format_delimited_columns, FIELD_DELIMITER, COLLECTION_DELIMITER,
+                   MAP_KEY_DELIMITER, NULL_MARKER)
+
+# 预定义的规模因子
+SCALE_FACTORS = {
+    '10k': 10_000,
+    '1m': 1_000_000,
+    '50m': 50_000_000,
+}
+FORMATS = ('text', 'parquet', 'both')
+# 每个分片内部按批生成，控制单个进程的内存占用
+GENERATE_BATCH_SIZE = 50_000
+
+
+def parse_scale(scale):
+    """解析规模：预定义名称（10k / 1m / 50m）或正整数行数"""
+    if scale.lower() in SCALE_FACTORS:
+        return SCALE_FACTORS[scale.lower()]
+    if not re.fullmatch(r'\d+', scale) or int(scale) <= 0:
+        raise argparse.ArgumentTypeError(
+            f"规模必须是 {', '.join(SCALE_FACTORS)} 之一或正整数: {scale}")
+    return int(scale)
+
+
+def file_sha256(path, block_size=1 << 20):
+    """计算文件的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _arrow_schema(schema):
+    """将 Hive 类型映射为 Arrow 类型"""
+    import pyarrow as pa
+
+    fields = []
+    for name, hive_type in schema.items():
+        hive_type = hive_type.upper()
+        decimal = re.search(r'DECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)', hive_type)
+        if decimal:
+            arrow_type = pa.decimal128(int(decimal.group(1)), int(decimal.group(2)))
+        elif hive_type.startswith('MAP'):
+            arrow_type = pa.map_(pa.string(), pa.int32())
+        elif hive_type == 'INT':
+            arrow_type = pa.int32()
+        elif hive_type == 'BIGINT':
+            arrow_type = pa.int64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def _arrow_table(columns, arrow_schema):
+    """将一批按列存放的数据转换为 Arrow 表，MAP 列转为键值对列表，DECIMAL 列由浮点数转换"""
+    import pyarrow as pa
+
+    arrays = []
+    for field in arrow_schema:
+        values = columns[field.name]
+        if pa.types.is_map(field.type):
+            values = [None if v is None else list(v.items()) for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        elif pa.types.is_decimal(field.type):
+            arrays.append(pa.array(values, type=pa.float64()).cast(field.type))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=arrow_schema)
+
+
+def write_shard(out_dir, shard, rows, seed, fmt):
+    """
+    生成并写出一个分片，在工作进程中执行。
+
+    Returns:
+        list: 每个输出文件的 {path, format, rows, bytes, sha256}。
+    """
+    schema = car_data_schema
+    paths = {}
+    if fmt in ('text', 'both'):
+        paths['text'] = os.path.join(out_dir, 'text', f'part-{shard:05d}.txt')
+    if fmt in ('parquet', 'both'):
+        paths['parquet'] = os.path.join(out_dir, 'parquet', f'part-{shard:05d}.parquet')
+
+    text_file = open(paths['text'], 'w', encoding='utf-8', newline='\n') if 'text' in paths else None
+    parquet_writer = None
+    if 'parquet' in paths:
+        import pyarrow.parquet as pq
+        arrow_schema = _arrow_schema(schema)
+        parquet_writer = pq.ParquetWriter(paths['parquet'], arrow_schema, compression='snappy')
+    try:
+        for columns in iter_rand_columns(rows, batch_size=GENERATE_BATCH_SIZE, seed=seed, schema=schema):
+            if text_file:
+                text_file.write(''.join(line + '\n' for line in format_delimited_columns(columns, schema)))
+            if parquet_writer:
+                parquet_writer.write_table(_arrow_table(columns, arrow_schema))
+    finally:
+        if text_file:
+            text_file.close()
+        if parquet_writer:
+            parquet_writer.close()
+
+    return [{
+        'path': os.path.relpath(path, out_dir),
+        'format': file_format,
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+        'sha256': file_sha256(path),
+    } for file_format, path in paths.items()]
+
+
+def build_dataset(out_dir, num_rows, rows_per_shard=None, workers=None, seed=0, fmt='text', scale=None):
+    """
+    生成分片数据集并写出 manifest.json。
+
+    每个分片使用由 seed 派生的独立随机流，因此相同的 (num_rows, rows_per_shard, seed)
+    总是生成逐字节相同的文件，与 workers 数无关。
+
+    Args:
+        out_dir (str): 输出目录，文本分片在 text/ 下，Parquet 分片在 parquet/ 下。
+        num_rows (int): 总行数。
+        rows_per_shard (int, optional): 每个分片的行数，默认取 BULK_LOAD_CONFIG['rows_per_file']。
+        workers (int, optional): 并行进程数，默认为 CPU 核数。
+        seed (int): 随机种子。
+        fmt (str): 'text'、'parquet' 或 'both'。
+        scale (str, optional): 规模名称，仅记录在 manifest 中。
+
+    Returns:
+        dict: manifest 内容。
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的输出格式: {fmt}，可选值: {', '.join(FORMATS)}")
+    if fmt in ('parquet', 'both'):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("写出 Parquet 需要安装 pyarrow")
+
+    rows_per_shard = rows_per_shard or BULK_LOAD_CONFIG['rows_per_file']
+    shard_rows = [min(rows_per_shard, num_rows - start) for start in range(0, num_rows, rows_per_shard)]
+    seeds = np.random.SeedSequence(seed).spawn(len(shard_rows))
+    for sub_dir in ('text', 'parquet'):
+        if fmt in (sub_dir, 'both'):
+            os.makedirs(os.path.join(out_dir, sub_dir), exist_ok=True)
+
+    started = time.time()
+    files = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(write_shard, out_dir, shard, rows, shard_seed, fmt)
+                   for shard, (rows, shard_seed) in enumerate(zip(shard_rows, seeds))]
+        for future in futures:
+            files.extend(future.result())
+    elapsed = time.time() - started
+
+    manifest = {
+        'scale': scale,
+        'rows': num_rows,
+        'seed': seed,
+        'shards': len(shard_rows),
+        'rows_per_shard': rows_per_shard,
+        'format': fmt,
+        'schema': car_data_schema,
+        'text_format': {
+            'field_delimiter': FIELD_DELIMITER,
+            'collection_delimiter': COLLECTION_DELIMITER,
+            'map_key_delimiter': MAP_KEY_DELIMITER,
+            'null_marker': NULL_MARKER,
+        },
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seconds': round(elapsed, 3),
+        'files': files,
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成 car_data 基准测试数据集')
+    parser.add_argument('--scale', required=True, help=f"规模: {' / '.join(SCALE_FACTORS)} 或行数")
+    parser.add_argument('--out', required=True, help='输出目录')
+    parser.add_argument('--format', default='text', choices=FORMATS, help='输出格式')
+    parser.add_argument('--rows-per-shard', type=int, default=None, help='每个分片的行数')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数，默认为 CPU 核数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    args = parser.parse_args(argv)
+
+    try:
+        num_rows = parse_scale(args.scale)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    manifest = build_dataset(args.out, num_rows, rows_per_shard=args.rows_per_shard,
+                             workers=args.workers, seed=args.seed, fmt=args.format, scale=args.scale)
+    print(f"已生成 {manifest['rows']} 行，{len(manifest['files'])} 个文件，"
+          f"用时 {manifest['seconds']} 秒: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import threading
+import time
+import logging
+
+# 数据版本号：每次成功写入 car_data 后递增，缓存据此判断快照是否过期
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+
+def get_data_version():
+    """返回当前进程内的数据版本号"""
+    return _data_version
+
+
+def bump_data_version():
+    """数据写入成功后调用，使所有快照在下次读取时刷新"""
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+        return _data_version
+
+
+class Snapshot:
+    """某一时刻加载的只读数据快照，所有并发读者共享同一个对象"""
+    __slots__ = ('data', 'version', 'loaded_at')
+
+    def __init__(self, data, version, loaded_at):
+        self.data = data
+        self.version = version
+        self.loaded_at = loaded_at
+
+
+class SnapshotCache:
+    """
+    进程级快照缓存。
+
+    快照在以下任一情况下失效：超过 ttl 秒，或数据版本号变化。
+    刷新时只有一个线程调用 loader，其余读者等待并共享新快照。
+    loader 返回的数据会被所有请求共享，调用方不得修改。
+
+    Args:
+        loader (callable): 无参函数，返回要缓存的数据。
+        ttl (float): 快照最长存活秒数。
+        name (str): 缓存名称，用于日志。
+    """
+
+    def __init__(self, loader, ttl=300, name='snapshot'):
+        self.loader = loader
+        self.ttl = ttl
+        self.name = name
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+            'refresh_time_total': 0.0,
+            'refresh_time_last': 0.0,
+        }
+
+    def _is_fresh(self, snapshot):
+        return (snapshot is not None
+                and snapshot.version == get_data_version()
+                and time.monotonic() - snapshot.loaded_at < self.ttl)
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def get_snapshot(self):
+        """返回当前有效的 Snapshot，必要时刷新"""
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            self._count('hits')
+            return snapshot
+
+        with self._refresh_lock:
+            # 等锁期间可能已有其他线程完成刷新
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot):
+                self._count('hits')
+                return snapshot
+
+            self._count('misses')
+            version = get_data_version()
+            start = time.monotonic()
+            try:
+                data = self.loader()
+            except Exception as e:
+                self._count('refresh_errors')
+                if snapshot is None:
+                    raise
+                # 刷新失败时继续提供旧快照，下次请求再重试
+                logging.warning(f"刷新缓存 '{self.name}' 失败，继续使用旧快照: {e}")
+                return snapshot
+            elapsed = time.monotonic() - start
+            with self._stats_lock:
+                self._stats['refreshes'] += 1
+                self._stats['refresh_time_total'] += elapsed
+                self._stats['refresh_time_last'] = elapsed
+            # 记录加载开始前的版本号，加载期间发生的写入会触发下一次刷新
+            snapshot = Snapshot(data, version, time.monotonic())
+            self._snapshot = snapshot
+            return snapshot
+
+    def get(self):
+        """返回当前有效快照中的数据"""
+        return self.get_snapshot().data
+
+    def invalidate(self):
+        """丢弃当前快照"""
+        with self._refresh_lock:
+            self._snapshot = None
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        snapshot = self._snapshot
+        stats['ttl'] = self.ttl
+        stats['version'] = snapshot.version if snapshot else None
+        stats['age'] = time.monotonic() - snapshot.loaded_at if snapshot else None
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
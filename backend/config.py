@@ -5,6 +5,123 @@ HIVE_CONFIG = {
     "database": "default"           # 默认数据库
 }
 
+# HiveServer2 连接池配置
+HIVE_POOL_CONFIG = {
+    "min_size": 1,                  # 空闲回收时至少保留的连接数
+    "max_size": 8,                  # 最大连接数（含借出中的连接）
+    "idle_timeout": 300,            # 空闲超过该秒数的连接将被关闭
+    "wait_timeout": 30,             # 连接池耗尽时借用连接的最长等待秒数
+    "validate_on_checkout": True,   # 借出前 ping 一次，剔除已失效的连接
+}
+
+# car_data 表的存储选项
+CAR_DATA_STORAGE = {
+    "storage_format": "TEXTFILE",   # "TEXTFILE"、"ORC" 或 "PARQUET"
+    "compression": None,            # 列式格式的压缩算法，例如 "SNAPPY"、"ZLIB"
+    "partition_by": [],             # 分区列，例如 ["city", "manufacture_year"]
+}
+
+# 批量插入配置
+HIVE_INSERT_CONFIG = {
+    "batch_size": 1000,             # 每条 INSERT ... VALUES 语句的最大行数
+    "max_workers": 4,               # 并发插入的批次数，不超过连接池的 max_size
+}
+
+# 批量导入配置：写入与建表声明一致的分隔符文本文件，再用 LOAD DATA 导入
+BULK_LOAD_CONFIG = {
+    "enabled": False,               # True 时 insert_data 走 LOAD DATA，而不是 INSERT ... VALUES
+    "staging_dir": "/tmp/car_data_staging",  # 本地暂存目录，也可以是挂载的 HDFS 兼容目录
+    "load_dir": None,               # HiveServer2 看到的暂存目录路径，None 表示与 staging_dir 相同
+    "local": True,                  # True: LOAD DATA LOCAL（暂存目录在 HiveServer2 主机上）；False: 从 HDFS 路径加载
+    "rows_per_file": 100000,        # 每个暂存文件的最大行数
+}
+
+# 流式读取配置
+HIVE_FETCH_CONFIG = {
+    "batch_size": 10000,            # 每次 fetchmany 的行数，决定流式读取时的内存峰值
+}
+
+# 进程内数据快照缓存配置
+SNAPSHOT_CACHE_CONFIG = {
+    "ttl": 300,                     # 快照最长存活秒数，写入数据后会立即失效
+}
+
+# 分析接口的数据来源
+ANALYTICS_CONFIG = {
+    "source": "hive",               # "hive": 在 HiveServer2 端筛选和聚合；"snapshot": 使用进程内列式快照；
+                                    # "summary": 城市/年份/类型统计读预计算汇总表，其余同 "hive"；
+                                    # "memory": 概览/趋势/城市/类型统计读进程内增量聚合，其余同 "snapshot"；
+                                    #   增量只来自本进程的写入，仅适用于单进程部署，
+                                    #   其他进程写入的数据要到下次重建（POST /api/v1/system/aggregates/rebuild）后才可见
+}
+
+# 预计算汇总表配置
+SUMMARY_TABLE_CONFIG = {
+    # insert_data 成功后是否维护汇总表（每次写入额外执行 Hive 作业）；只有 "summary" 来源会读取汇总表
+    "enabled": ANALYTICS_CONFIG["source"] == "summary",
+    "compact_every": 100,           # 每追加多少次增量后合并一次汇总表中同一键的多行
+}
+
+# Excel 上传配置
+UPLOAD_CONFIG = {
+    "chunk_size": 5000,             # 每次解析并插入的行数
+    "queue_size": 4,                # 解析与插入之间的队列长度，内存峰值约为 (queue_size + 2) 个块
+}
+
+# 随机数据生成配置（/api/v1/generate/random）
+GENERATE_CONFIG = {
+    "max_records": 10000000,        # 单次请求允许生成的最大记录数
+    "chunk_size": 10000,            # 每块生成并插入的记录数
+    "max_chunk_size": 50000,        # 请求中 chunk_size 的上限，超出时按上限处理
+    "max_workers": 4,               # 并发插入的线程数，每个线程同时只借用一个连接，不应超过连接池的 max_size
+}
+
+# 推荐接口分页配置（/api/v1/recommendations）
+RECOMMENDATION_CONFIG = {
+    "default_limit": 20,            # 未指定 limit 时每页返回的车型数
+    "max_limit": 1000,              # 单页允许的最大 limit
+}
+
+# 分析接口响应缓存配置：缓存序列化后的响应字节，写入数据后清空
+RESPONSE_CACHE_CONFIG = {
+    "enabled": True,                # 是否缓存分析接口的响应
+    "max_entries": 256,             # 最多缓存的响应数，超出时按 LRU 淘汰
+    "max_bytes": 64 * 1024 * 1024,  # 所有缓存响应（含压缩结果）的总字节数上限
+    "min_compress_size": 1024,      # 小于该字节数的响应不压缩
+    "gzip_level": 6,                # gzip 压缩级别
+    "brotli_quality": 5,            # brotli 压缩质量（安装 brotli 后才会使用）
+}
+
+# 后台任务配置
+# 任务只保存在进程内存中，GET /api/v1/jobs/<id> 只能查到本进程提交的任务，
+# 因此服务必须以单个工作进程运行（可多线程），多进程部署时查询会随机返回 404
+JOB_CONFIG = {
+    "max_workers": 2,               # 同时运行的后台任务数
+    "max_jobs": 200,                # 内存中保留的任务数，超出时丢弃最早结束的任务
+    "max_queued": 20,               # 排队等待执行的任务上限，达到上限时新任务返回 503
+}
+
+# 字段映射字典（数据库字段 -> 前端字段）
+FIELD_MAPPING = {
+    'car_brand': 'brand',
+    'car_model': 'model',
+    'manufacturer_suggested_price': 'guide_price',
+    'engine_horsepower': 'horsepower',
+    'num_doors': 'doors',
+    'min_reference_price': 'min_price',
+    'popularity': 'attention',
+    'discount_percentage': 'discount',
+    'car_type': 'car_type',
+    #'manufacture_year': 'manufacture_year'
+}
+
+# 反转映射（前端字段 -> 数据库字段）
+REVERSE_MAPPING = {v: k for k, v in FIELD_MAPPING.items()}
+
+# 上传文件中直接使用数据库字段名的列（非映射字段）
+NON_MAPPED_FIELDS = ['city', 'manufacture_year', 'fuel_capacity',
+                     'historical_price', 'city_license_plates']
+
 car_data_schema = {
     'car_brand': 'STRING',
     'city': 'STRING',
@@ -20,4 +137,23 @@ car_data_schema = {
     'discount_percentage': 'DECIMAL(5, 2)',
     'historical_price': 'MAP<STRING, INT>', # 注意 ARRAY 类型
     'city_license_plates': 'MAP<STRING, INT>',   # 注意 MAP 类型
+}
+
+# 汇总表结构：insert_data 每次追加一批增量行，读取时按键求和
+summary_table_schemas = {
+    'car_summary_city': {
+        'city': 'STRING',
+        'registrations': 'BIGINT',
+    },
+    'car_summary_year': {
+        'manufacture_year': 'INT',
+        'row_count': 'BIGINT',
+        'attention': 'BIGINT',
+        'price_sum': 'DECIMAL(20, 2)',
+        'registrations': 'BIGINT',
+    },
+    'car_summary_type': {
+        'car_type': 'STRING',
+        'registrations': 'BIGINT',
+    },
 }
\ No newline at end of file
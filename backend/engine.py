@@ -0,0 +1,305 @@
+import numpy as np
+import pandas as pd
+
+# 以分类编码存储的字符串列（前端字段名）
+CATEGORICAL_FIELDS = ['brand', 'model', 'car_type']
+# 以 float64 存储的数值列，缺失值为 NaN
+NUMERIC_FIELDS = ['guide_price', 'min_price', 'horsepower', 'doors',
+                  'attention', 'discount', 'manufacture_year']
+
+
+def _readonly(array):
+    array.setflags(write=False)
+    return array
+
+
+def _label(categorical, code):
+    """分类编码转回原始值，缺失值（编码 -1）返回 None"""
+    return None if code < 0 else categorical.categories[code]
+
+
+def _int_or_float(value):
+    """整数值的浮点数转换为 int，保持与逐行累加时相同的 JSON 输出"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+# 建立有序索引的数值列
+INDEXED_FIELDS = ['min_price', 'horsepower', 'manufacture_year']
+
+
+class SortedIndex:
+    """
+    数值列的有序索引：非缺失值按升序排列（相同值保持行号顺序），
+    范围查询和分桶计数用二分查找完成。
+
+    Args:
+        values (ndarray): float64 数值列，缺失值为 NaN。
+    """
+
+    def __init__(self, values):
+        valid = np.flatnonzero(~np.isnan(values))
+        order = np.argsort(values[valid], kind='stable')
+        self.rows = _readonly(valid[order])
+        self.values = _readonly(values[self.rows])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def bounds(self, low=None, high=None):
+        """返回满足 low <= value <= high 的值在有序数组中的位置区间 [start, stop)"""
+        start = 0 if low is None else int(np.searchsorted(self.values, low, side='left'))
+        stop = len(self.rows) if high is None else int(np.searchsorted(self.values, high, side='right'))
+        return start, max(start, stop)
+
+    def select(self, low=None, high=None):
+        """返回满足 low <= value <= high 的行号（按值升序）"""
+        start, stop = self.bounds(low, high)
+        return self.rows[start:stop]
+
+    def bucket_positions(self, edges):
+        """返回各区间 [edges[i], edges[i+1]) 的起始位置，最后一个区间到末尾"""
+        return np.append(np.searchsorted(self.values, edges, side='left'), len(self.rows))
+
+
+class CarColumns:
+    """
+    车型快照的列式表示。
+
+    数值字段保存为只读的 NumPy 数组，brand/model/car_type 保存为 pandas 分类编码，
+    city_license_plates 展开为 (行号, 城市编码, 上牌量) 三个平行数组。
+    数组下标与快照中 cars 元组的下标一一对应。
+
+    Args:
+        cars (Sequence[dict]): fetch_car_data 格式的车型记录。
+    """
+
+    def __init__(self, cars):
+        self.size = len(cars)
+
+        for field in CATEGORICAL_FIELDS:
+            setattr(self, field, pd.Categorical([car.get(field) for car in cars]))
+
+        for field in NUMERIC_FIELDS:
+            values = [car.get(field) for car in cars]
+            setattr(self, field, _readonly(pd.to_numeric(
+                pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)))
+
+        plate_rows, plate_cities, plate_counts = [], [], []
+        for row, car in enumerate(cars):
+            plates = car.get('city_license_plates')
+            if isinstance(plates, dict):
+                for city, count in plates.items():
+                    plate_rows.append(row)
+                    plate_cities.append(city)
+                    plate_counts.append(count)
+        self.plate_row = _readonly(np.asarray(plate_rows, dtype=np.int64))
+        self.plate_city = pd.Categorical(plate_cities)
+        self.plate_count = _readonly(np.asarray(plate_counts, dtype=np.float64))
+        # 每个车型在所有城市的总上牌量
+        self.registrations = _readonly(np.bincount(
+            self.plate_row, weights=self.plate_count, minlength=self.size).astype(np.float64))
+        # 是否带有 city_license_plates 字典，与逐行实现中的 isinstance 判断一致
+        self.has_plates = _readonly(np.array(
+            [isinstance(car.get('city_license_plates'), dict) for car in cars], dtype=bool))
+
+        # 有序索引，供范围筛选、价格分桶和按年份分组使用
+        self.indexes = {field: SortedIndex(getattr(self, field)) for field in INDEXED_FIELDS}
+        # 按 min_price 升序排列的关注度前缀和，分桶求和只需两次查表
+        price_attention = np.nan_to_num(self.attention[self.indexes['min_price'].rows])
+        self.price_attention_cumsum = _readonly(np.concatenate(([0.0], np.cumsum(price_attention))))
+
+    def codes_of(self, field, value):
+        """返回分类列中 value 对应的编码，不存在时返回 None"""
+        categories = getattr(self, field).categories
+        if value not in categories:
+            return None
+        return categories.get_loc(value)
+
+
+def _filter_rows(columns, brand=None, car_type=None, min_price=None, max_price=None,
+                 min_hp=None, doors=None):
+    """按条件筛选车型，返回按行号升序排列的行号数组"""
+    # 价格或马力范围先用有序索引二分定位候选行，其余条件只在候选行上判断；
+    # 索引不包含缺失值，与 NaN 比较为 False 的逐行语义一致
+    rows = None
+    if min_price is not None or max_price is not None:
+        rows = columns.indexes['min_price'].select(min_price, max_price)
+    if min_hp is not None:
+        hp_rows = columns.indexes['horsepower'].select(min_hp)
+        rows = hp_rows if rows is None else np.intersect1d(rows, hp_rows)
+    # 候选行恢复为行号顺序，保证关注度相同时的先后与全表扫描一致
+    rows = np.arange(columns.size) if rows is None else np.sort(rows)
+
+    mask = np.ones(len(rows), dtype=bool)
+    for field, value in (('brand', brand), ('car_type', car_type)):
+        if value:
+            code = columns.codes_of(field, value)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= getattr(columns, field).codes[rows] == code
+    if doors is not None:
+        mask &= columns.doors[rows] == doors
+
+    return rows[mask]
+
+
+def _attention_key(columns, rows):
+    """关注度降序的排序键，缺失值排在最后（与 np.argsort 对 NaN 的处理一致）"""
+    attention = columns.attention[rows]
+    return np.where(np.isnan(attention), np.inf, -attention)
+
+
+def select_cars(columns, **filters):
+    """
+    按条件筛选车型，返回按关注度降序排列的行号数组（关注度相同时保持原有顺序）。
+    """
+    rows = _filter_rows(columns, **filters)
+    order = np.argsort(_attention_key(columns, rows), kind='stable')
+    return rows[order]
+
+
+def top_cars(columns, limit, offset=0, **filters):
+    """
+    按关注度降序分页选取车型，顺序与 select_cars 的结果切片 [offset:offset + limit] 完全相同。
+
+    只需要前 offset + limit 行时先用 np.partition 求出第 k 小的排序键，
+    再对不超过 k 个候选行排序，避免对全部命中行排序。
+
+    Returns:
+        tuple: (行号数组, 满足条件的总行数)。
+    """
+    rows = _filter_rows(columns, **filters)
+    total = len(rows)
+    k = offset + limit
+    key = _attention_key(columns, rows)
+    if k < total:
+        kth = np.partition(key, k - 1)[k - 1]
+        # 排序键小于第 k 小值的行全部入选，等于该值的行按行号顺序补足 k 行
+        ties = np.flatnonzero(key == kth)[:k - np.count_nonzero(key < kth)]
+        candidates = np.sort(np.concatenate((np.flatnonzero(key < kth), ties)))
+        rows, key = rows[candidates], key[candidates]
+    order = np.argsort(key, kind='stable')[offset:k]
+    return rows[order], total
+
+
+def price_distribution(columns, edges):
+    """
+    按 min_price 分桶统计车型数量与平均关注度。
+
+    Args:
+        columns (CarColumns): 列式快照。
+        edges (list): 递增的区间边界，最后一个区间为 [edges[-1], +inf)。
+
+    Returns:
+        list[tuple]: 每个区间的 (count, avg_attention)。
+    """
+    # 在 min_price 有序索引上二分出各区间边界，计数为位置差，关注度之和为前缀和之差
+    positions = columns.indexes['min_price'].bucket_positions(edges)
+    counts = np.diff(positions)
+    sums = np.diff(columns.price_attention_cumsum[positions])
+    return [(int(count), float(total / count) if count else 0)
+            for count, total in zip(counts, sums)]
+
+
+def _first_seen_order(codes):
+    """返回 codes 中出现过的编码，按首次出现的顺序排列（与逐行累加字典的键顺序一致）"""
+    unique, first_seen = np.unique(codes, return_index=True)
+    return unique[np.argsort(first_seen)]
+
+
+def city_registrations(columns):
+    """返回 {城市: 上牌量总和}，按城市首次出现的顺序排列"""
+    codes = columns.plate_city.codes
+    totals = np.bincount(codes, weights=columns.plate_count, minlength=len(columns.plate_city.categories))
+    return {columns.plate_city.categories[code]: _int_or_float(totals[code])
+            for code in _first_seen_order(codes)}
+
+
+def market_overview(columns):
+    """计算市场概览：总上牌量、平均关注度、品牌车型数和关注度最高的车型行号"""
+    if not columns.size:
+        return {
+            'total_registrations': 0,
+            'avg_attention': 0,
+            'brand_counts': {},
+            'top_row': None,
+        }
+    codes = columns.brand.codes.astype(np.int64) + 1
+    counts = np.bincount(codes)
+    brand_counts = {_label(columns.brand, code - 1): int(counts[code])
+                    for code in _first_seen_order(codes)}
+    attention = columns.attention
+    return {
+        'total_registrations': _int_or_float(columns.plate_count.sum()),
+        'avg_attention': float(np.nansum(attention) / columns.size),
+        'brand_counts': brand_counts,
+        'top_row': None if np.isnan(attention).all() else int(np.nanargmax(attention)),
+    }
+
+
+def market_trends(columns):
+    """按出厂年份聚合上牌量、关注度与平均指导价，年份为空或 0 的车型不参与统计"""
+    # 年份有序索引中相同年份连续排列（组内保持行号顺序），由分组起点直接得到分组编号，无需再排序；
+    # bincount 按行号顺序累加，浮点结果与逐行累加一致
+    index = columns.indexes['manufacture_year']
+    nonzero = index.values != 0
+    rows, years = index.rows[nonzero], index.values[nonzero]
+    if not len(rows):
+        return []
+    is_start = np.r_[True, years[1:] != years[:-1]]
+    unique_years = years[is_start]
+    group = np.cumsum(is_start) - 1
+    registrations = np.bincount(group, weights=columns.registrations[rows])
+    attention = np.bincount(group, weights=np.nan_to_num(columns.attention[rows]))
+    price_sum = np.bincount(group, weights=np.nan_to_num(columns.guide_price[rows]))
+    count = np.bincount(group)
+    return [{
+        'date': str(int(year)),
+        'registrations': _int_or_float(registrations[i]),
+        'attention': _int_or_float(attention[i]),
+        'avg_price': float(price_sum[i] / count[i])
+    } for i, year in enumerate(unique_years)]
+
+
+def type_registrations(columns, rename=None):
+    """
+    按车型类型汇总上牌量，返回 {car_type: 上牌量}，按类型首次出现的顺序排列。
+
+    Args:
+        rename (dict, optional): 类型名称替换，例如 {'新能源': '电动汽车'}。
+    """
+    rename = rename or {}
+    # 编码整体加 1，使缺失值（-1）也能参与 bincount
+    codes = columns.car_type.codes[columns.has_plates].astype(np.int64) + 1
+    totals = np.bincount(codes, weights=columns.registrations[columns.has_plates])
+    result = {}
+    for code in _first_seen_order(codes):
+        label = _label(columns.car_type, code - 1)
+        label = rename.get(label, label)
+        result[label] = result.get(label, 0) + _int_or_float(totals[code])
+    return result
+
+
+class CarSnapshot:
+    """
+    车型快照：行式记录与列式数组来自同一次加载，下标一一对应。
+
+    同时构建哈希索引，随快照一起刷新：
+    brands 为按首次出现顺序排列的品牌元组；models_by_brand 为 {品牌: ({id, name}, ...)}，
+    与逐条扫描的结果相同（包括重复车型）；model_index 为 {model_id: 第一条匹配的记录}。
+    """
+    __slots__ = ('cars', 'columns', 'brands', 'models_by_brand', 'model_index')
+
+    def __init__(self, cars):
+        self.cars = tuple(cars)
+        self.columns = CarColumns(self.cars)
+
+        models_by_brand = {}
+        model_index = {}
+        for car in self.cars:
+            models_by_brand.setdefault(car['brand'], []).append({'id': car['model_id'], 'name': car['model']})
+            model_index.setdefault(car['model_id'], car)
+        self.brands = tuple(models_by_brand)
+        self.models_by_brand = {brand: tuple(models) for brand, models in models_by_brand.items()}
+        self.model_index = model_index
@@ -1,155 +1,724 @@
 from typing import List
-import random
+from decimal import Decimal
+import logging
+import threading
+from itertools import islice
+import numpy as np
 from config import *
 from utils import *
+from cache import bump_data_version
+from aggregates import RunningAggregates
 
+# 进程级 Hive 连接池，所有读写操作共用
+hive_pool = get_hive_pool(HIVE_CONFIG, **HIVE_POOL_CONFIG)
+# 进程内增量聚合，insert_data 写入成功后累加增量
+running_aggregates = RunningAggregates()
 
-def setup_environment():
+
+def setup_environment(storage=None):
+    """
+    重建 car_data 表。
+    storage: 存储选项，键同 config.CAR_DATA_STORAGE，未提供的键使用其中的默认值
+    example:
+    setup_environment(storage={
+        'storage_format': 'ORC',
+        'compression': 'SNAPPY',
+        'partition_by': ['city', 'manufacture_year'],
+    })
+    insert_data 按表实际的分区列写入，建表后会清除分区列缓存
+    """
+    options = dict(CAR_DATA_STORAGE, **(storage or {}))
     create_table_result = create_hive_table(
         table_name='car_data',
         schema=car_data_schema,
-        config=HIVE_CONFIG
+        config=HIVE_CONFIG,
+        storage_format=options['storage_format'],
+        compression=options['compression'],
+        partition_by=options['partition_by']
     )
+    # 表结构已变化，下次读取时重新获取分区列
+    invalidate_partition_columns('car_data')
     print(create_table_result)
+    if SUMMARY_TABLE_CONFIG['enabled']:
+        print(build_summary_tables())
 
 
-def insert_data(car_data):
-    insert_result = insert_into_hive_table(
-        table_name='car_data',
-        data=car_data,
-        schema=car_data_schema,  # 传入 schema 以便处理复杂类型
-        config=HIVE_CONFIG
-    )
-    print(insert_result)
+def insert_data(car_data, max_workers=None):
+    """
+    max_workers: 并发执行的 INSERT 批次数，默认取 HIVE_INSERT_CONFIG['max_workers']；
+                 调用方自己已在多个线程中并发调用时应传 1，避免借用的连接数成倍增加
+    """
+    # 按表实际的分区列写入（结果已缓存），而不是 CAR_DATA_STORAGE 中建表时的默认值
+    try:
+        partition_by = [col for col, _ in get_partition_columns('car_data', HIVE_CONFIG)]
+    except Exception as e:
+        logging.error(f"获取 car_data 分区列失败: {e}")
+        return {'status': 'error', 'message': f'获取分区列失败: {e}'}
+    if BULK_LOAD_CONFIG['enabled']:
+        # 直接写成表的文本格式并 LOAD DATA，避免每条 INSERT 编译成一个作业
+        insert_result = bulk_load_into_hive_table(
+            table_name='car_data',
+            data=car_data,
+            schema=car_data_schema,
+            config=HIVE_CONFIG,
+            staging_dir=BULK_LOAD_CONFIG['staging_dir'],
+            load_dir=BULK_LOAD_CONFIG['load_dir'],
+            local=BULK_LOAD_CONFIG['local'],
+            rows_per_file=BULK_LOAD_CONFIG['rows_per_file'],
+            storage_format=CAR_DATA_STORAGE['storage_format'],
+            partition_by=partition_by
+        )
+    else:
+        insert_result = insert_into_hive_table(
+            table_name='car_data',
+            data=car_data,
+            schema=car_data_schema,  # 传入 schema 以便处理复杂类型
+            config=HIVE_CONFIG,
+            batch_size=HIVE_INSERT_CONFIG['batch_size'],
+            max_workers=max_workers or HIVE_INSERT_CONFIG['max_workers'],
+            partition_by=partition_by  # 按每行的分区列值动态写入
+        )
+    # 批次明细可能很长，只打印汇总信息
+    print({k: v for k, v in insert_result.items() if k != 'batches'})
+    if insert_result['status'] in ('success', 'partial'):
+        # 部分失败且没有批次明细时无法计算增量，只能全量重建
+        inserted = _inserted_records(car_data, insert_result)
+        if SUMMARY_TABLE_CONFIG['enabled']:
+            summary_result = build_summary_tables() if inserted is None else update_summary_tables(inserted)
+            if summary_result['status'] != 'success':
+                logging.error(f"汇总表维护失败: {summary_result['message']}")
+        if inserted is None:
+            running_aggregates.invalidate()
+        else:
+            running_aggregates.apply(inserted)
+        # 使进程内的数据快照在下次读取时刷新
+        bump_data_version()
+    return insert_result
 
 
-def read_data_with_filters(filters=None, name='*', is_distinct=False):
+def plan_filters(filters):
     """
-    filters: 筛选条件
+    按 car_data 的分区列规划筛选条件，返回 (筛选条件, 用到的分区列)。
+    分区列上的条件会转换为分区列类型并放在最前面，使 Hive 只扫描匹配的分区。
+    """
+    if not filters:
+        return filters, []
+    partition_columns = get_partition_columns('car_data', HIVE_CONFIG)
+    return plan_partition_filters(filters, partition_columns)
+
+
+def read_data_with_filters(filters=None, name='*', is_distinct=False, explain=False,
+                           order_by=None, limit=None, offset=None):
+    """
+    filters: 筛选条件，支持等值、范围、BETWEEN、IN 和 IS NULL（写法见 utils.FilterBuilder），
+             所有条件都在 Hive 端执行，分区列上的条件用于裁剪分区
+    explain: 为 True 时额外执行 EXPLAIN DEPENDENCY，在结果的 'partitions' 中返回实际读取的分区
+    order_by / limit / offset: 排序与分页下推到 Hive，例如 order_by='popularity DESC', limit=20
     example:
-    data = read_data(
+    output = read_data_with_filters(
         filters={
             'city': '成都',
-            'num_doors': 4,
+            'num_doors': [4, 5],
+            'min_reference_price': {'>=': 100000, '<=': 300000},
+            'car_type': {'is null': False},
         }
     )
+    data = output['data']
+    output['partition_filters']  # 用于裁剪分区的列，例如 ['city']
+
+    返回 read_from_hive_table 的结果字典，读取失败时 status 为 'error' 且没有 'data'
     """
     if is_distinct:
         assert name != '*'
         name = f'DISTINCT {name}'
+    try:
+        filters, partition_filters = plan_filters(filters)
+    except Exception as e:
+        return {"status": "error", "message": f"获取分区信息失败: {e}"}
     output = read_from_hive_table(
         table_name='car_data',
         config=HIVE_CONFIG,
         filters=filters,
-        name=name
+        name=name,
+        batch_size=HIVE_FETCH_CONFIG['batch_size'],
+        order_by=order_by,
+        limit=limit,
+        offset=offset
+    )
+    output['partition_filters'] = partition_filters
+    if explain and output['status'] == 'success':
+        try:
+            output['partitions'] = explain_partitions('car_data', HIVE_CONFIG, filters=filters, name=name)
+        except Exception as e:
+            logging.warning(f"EXPLAIN DEPENDENCY 失败: {e}")
+            output['partitions'] = None
+    return output
+
+
+def iter_data_with_filters(filters=None, name='*', is_distinct=False, batch_size=None,
+                           order_by=None, limit=None, offset=None):
+    """
+    read_data_with_filters 的流式版本，逐批产出行字典（list[dict]），
+    适合按批累加的聚合或导出，内存占用与结果集大小无关。
+    order_by / limit / offset 同 read_data_with_filters。
+    读取失败时抛出异常。
+
+    example:
+    registrations = 0
+    for batch in iter_data_with_filters(name='city_license_plates'):
+        for row in batch:
+            registrations += sum((row['city_license_plates'] or {}).values())
+    """
+    if is_distinct:
+        assert name != '*'
+        name = f'DISTINCT {name}'
+    filters, _ = plan_filters(filters)
+    return iter_from_hive_table(
+        table_name='car_data',
+        config=HIVE_CONFIG,
+        filters=filters,
+        name=name,
+        batch_size=batch_size or HIVE_FETCH_CONFIG['batch_size'],
+        order_by=order_by,
+        limit=limit,
+        offset=offset
     )
+
+
+def count_data_with_filters(filters=None):
+    """返回满足筛选条件的行数，筛选条件同 read_data_with_filters；失败时抛出异常"""
+    filters, _ = plan_filters(filters)
+    return _aggregate(select={'total': 'COUNT(*)'}, filters=filters)[0]['total']
+
+
+# 展开 city_license_plates，每个 (城市, 上牌量) 一行
+PLATES_LATERAL_VIEW = 'explode(city_license_plates) plates AS plate_city, plate_count'
+# 年份趋势只统计有出厂年份的记录
+YEAR_CONDITIONS = ['manufacture_year IS NOT NULL', 'manufacture_year <> 0']
+
+
+def _to_number(value):
+    """Hive 的 DECIMAL/BIGINT 聚合结果转换为 int 或 float，空值视为 0"""
+    if value is None:
+        return 0
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+def _aggregate(table_name='car_data', **kwargs):
+    """在 car_data（或指定的表）上执行聚合查询，失败时抛出异常"""
+    output = aggregate_from_hive_table(table_name=table_name, config=HIVE_CONFIG, **kwargs)
+    if output['status'] != 'success':
+        raise RuntimeError(output['message'])
     return output['data']
 
 
-def rand_data_generate(num_records):
+def aggregate_city_registrations():
+    """返回 {城市: 上牌量总和}"""
+    rows = _aggregate(
+        select={'city': 'plate_city', 'registrations': 'SUM(plate_count)'},
+        lateral_view=PLATES_LATERAL_VIEW,
+        group_by=['plate_city'],
+    )
+    return {row['city']: _to_number(row['registrations']) for row in rows}
+
+
+def aggregate_year_trends():
+    """按出厂年份聚合上牌量、关注度与平均指导价，格式与 engine.market_trends 相同"""
+    stats = _aggregate(
+        select={
+            'year': 'manufacture_year',
+            'attention': 'SUM(COALESCE(popularity, 0))',
+            'price_sum': 'SUM(COALESCE(manufacturer_suggested_price, 0))',
+            'count': 'COUNT(*)',
+        },
+        conditions=YEAR_CONDITIONS,
+        group_by=['manufacture_year'],
+    )
+    # 上牌量需要展开 MAP，单独聚合以免关注度和价格被重复累加
+    registrations = _aggregate(
+        select={'year': 'manufacture_year', 'registrations': 'SUM(plate_count)'},
+        lateral_view=PLATES_LATERAL_VIEW,
+        conditions=YEAR_CONDITIONS,
+        group_by=['manufacture_year'],
+    )
+    registrations = {row['year']: _to_number(row['registrations']) for row in registrations}
+
+    trends = []
+    for row in sorted(stats, key=lambda r: r['year']):
+        trends.append({
+            'date': str(row['year']),
+            'registrations': registrations.get(row['year'], 0),
+            'attention': _to_number(row['attention']),
+            'avg_price': float(_to_number(row['price_sum'])) / row['count']
+        })
+    return trends
+
+
+def aggregate_price_buckets(edges, column='min_reference_price'):
+    """
+    按价格区间统计车型数量与平均关注度，区间划分与 engine.price_distribution 相同。
+
+    Returns:
+        list[tuple]: 每个区间的 (count, avg_attention)。
+    """
+    # 从高到低匹配，最后一个区间为 [edges[-1], +inf)
+    whens = ' '.join(f"WHEN {column} >= {edge} THEN {i}" for i, edge in reversed(list(enumerate(edges))))
+    bucket_expr = f"CASE {whens} END"
+    rows = _aggregate(
+        select={
+            'bucket': bucket_expr,
+            'count': 'COUNT(*)',
+            'attention': 'SUM(COALESCE(popularity, 0))',
+        },
+        conditions=[f'{column} >= {edges[0]}'],
+        group_by=[bucket_expr],
+    )
+    by_bucket = {row['bucket']: row for row in rows}
+    buckets = []
+    for i in range(len(edges)):
+        row = by_bucket.get(i)
+        if row and row['count']:
+            buckets.append((row['count'], float(_to_number(row['attention'])) / row['count']))
+        else:
+            buckets.append((0, 0))
+    return buckets
+
+
+def aggregate_type_registrations():
+    """返回 {car_type: 上牌量总和}，没有上牌记录的类型计为 0"""
+    rows = _aggregate(
+        select={'car_type': 'car_type', 'registrations': 'SUM(plate_count)'},
+        lateral_view=f'OUTER {PLATES_LATERAL_VIEW}',
+        group_by=['car_type'],
+    )
+    return {row['car_type']: _to_number(row['registrations']) for row in rows}
+
+
+def aggregate_market_overview():
+    """
+    计算市场概览，格式与 engine.market_overview 相同，
+    但以 top_car（brand/model/attention 字典）代替快照行号。
     """
-    根据给定的数据结构模式生成随机数据。
+    totals = _aggregate(select={
+        'count': 'COUNT(*)',
+        'attention': 'SUM(COALESCE(popularity, 0))',
+    })[0]
+    if not totals['count']:
+        return {'total_registrations': 0, 'avg_attention': 0, 'brand_counts': {}, 'top_car': None}
+
+    registrations = _aggregate(
+        select={'registrations': 'SUM(plate_count)'},
+        lateral_view=PLATES_LATERAL_VIEW,
+    )[0]['registrations']
+    brands = _aggregate(
+        select={'brand': 'car_brand', 'count': 'COUNT(*)'},
+        group_by=['car_brand'],
+    )
+    top = _aggregate(
+        select={'brand': 'car_brand', 'model': 'car_model', 'attention': 'popularity'},
+        conditions=['popularity IS NOT NULL'],
+        # Hive 按 SELECT 列表的别名解析 ORDER BY，原列名 popularity 已被别名 attention 取代
+        order_by='attention DESC',
+        limit=1,
+    )
+    return {
+        'total_registrations': _to_number(registrations),
+        'avg_attention': float(_to_number(totals['attention'])) / totals['count'],
+        'brand_counts': {row['brand']: row['count'] for row in brands},
+        'top_car': top[0] if top else None,
+    }
+
+
+# 从 car_data 全量构建汇总表的查询，select 的顺序与 summary_table_schemas 中的列顺序一致；
+# 同一张表有多条查询时，第一条覆盖写入，其余追加
+SUMMARY_QUERIES = {
+    'car_summary_city': [{
+        'select': {'city': 'plate_city', 'registrations': 'SUM(plate_count)'},
+        'lateral_view': PLATES_LATERAL_VIEW,
+        'group_by': ['plate_city'],
+    }],
+    'car_summary_year': [{
+        'select': {
+            'manufacture_year': 'manufacture_year',
+            'row_count': 'COUNT(*)',
+            'attention': 'SUM(COALESCE(popularity, 0))',
+            'price_sum': 'SUM(COALESCE(manufacturer_suggested_price, 0))',
+            'registrations': 'CAST(0 AS BIGINT)',
+        },
+        'conditions': YEAR_CONDITIONS,
+        'group_by': ['manufacture_year'],
+    }, {
+        # 上牌量需要展开 MAP，单独聚合以免记录数、关注度和价格被重复累加
+        'select': {
+            'manufacture_year': 'manufacture_year',
+            'row_count': 'CAST(0 AS BIGINT)',
+            'attention': 'CAST(0 AS BIGINT)',
+            'price_sum': 'CAST(0 AS DECIMAL(20, 2))',
+            'registrations': 'SUM(plate_count)',
+        },
+        'lateral_view': PLATES_LATERAL_VIEW,
+        'conditions': YEAR_CONDITIONS,
+        'group_by': ['manufacture_year'],
+    }],
+    'car_summary_type': [{
+        'select': {'car_type': 'car_type', 'registrations': 'SUM(COALESCE(plate_count, 0))'},
+        'lateral_view': f'OUTER {PLATES_LATERAL_VIEW}',
+        'group_by': ['car_type'],
+    }],
+}
+
+# 同一进程内汇总表的维护操作（追加增量、合并、重建）由这把锁串行执行；重建和合并调用追加路径时可重入。
+# 锁只在进程内有效，合并因此用一条读取正式表自身的 INSERT OVERWRITE 语句完成，不依赖该锁保证跨进程安全
+_summary_lock = threading.RLock()
+# 自上次重建或合并以来追加增量的次数
+_summary_appends = 0
+# 重建先写入该后缀的暂存表，完成后再整体覆盖到正式表
+SUMMARY_STAGING_SUFFIX = '__staging'
+
+
+def _finish_maintenance(results, action):
+    failed = [name for name, result in results.items() if result['status'] != 'success']
+    if failed:
+        return {'status': 'error', 'message': f'汇总表{action}失败: {failed}', 'tables': results}
+    return {'status': 'success', 'message': f'汇总表{action}完成', 'tables': results}
+
+
+def _rebuild_summary_table(table_name, schema):
+    """
+    从 car_data 重建一张汇总表：先写入暂存表，再用 INSERT OVERWRITE 整体覆盖正式表。
+    INSERT OVERWRITE 对读者是原子的，读者只会看到旧数据或新数据；暂存表无论成败都会删除。
+    """
+    staging_table = table_name + SUMMARY_STAGING_SUFFIX
+    try:
+        result = create_hive_table(table_name=staging_table, schema=schema, config=HIVE_CONFIG)
+        for i, query in enumerate(SUMMARY_QUERIES[table_name]):
+            if result['status'] != 'success':
+                return result
+            result = insert_from_hive_aggregate(staging_table, 'car_data', HIVE_CONFIG,
+                                                overwrite=(i == 0), **query)
+        if result['status'] == 'success':
+            result = create_hive_table(table_name=table_name, schema=schema, config=HIVE_CONFIG, replace=False)
+        if result['status'] == 'success':
+            result = insert_from_hive_aggregate(table_name, staging_table, HIVE_CONFIG,
+                                                {col: col for col in schema}, overwrite=True)
+        return result
+    finally:
+        drop_result = drop_hive_table(staging_table, HIVE_CONFIG)
+        if drop_result['status'] != 'success':
+            logging.warning(f"暂存表 {staging_table} 删除失败: {drop_result['message']}")
+
+
+def build_summary_tables():
+    """从 car_data 全量重建所有汇总表"""
+    global _summary_appends
+    with _summary_lock:
+        results = {table_name: _rebuild_summary_table(table_name, schema)
+                   for table_name, schema in summary_table_schemas.items()}
+        _summary_appends = 0
+        return _finish_maintenance(results, '重建')
+
+
+def compact_summary_tables():
+    """
+    把汇总表中同一键的多行增量合并为一行。
+
+    每张表用一条 INSERT OVERWRITE ... SELECT ... FROM 同一张表 GROUP BY 完成：
+    Hive 在同一语句内先读完正式表再替换其数据，不需要暂存表，也不依赖进程内的锁。
+    """
+    global _summary_appends
+    with _summary_lock:
+        results = {}
+        for table_name, schema in summary_table_schemas.items():
+            key, *measures = schema
+            select = {key: key, **{col: f'SUM({col})' for col in measures}}
+            results[table_name] = insert_from_hive_aggregate(table_name, table_name, HIVE_CONFIG, select,
+                                                             overwrite=True, group_by=[key])
+        _summary_appends = 0
+        return _finish_maintenance(results, '合并')
+
+
+def summarize_records(records):
+    """
+    在应用端计算一批记录对各汇总表的增量，口径与 SUMMARY_QUERIES 相同。
+
+    Returns:
+        dict: {汇总表名: 要追加的行 list[dict]}。
+    """
+    cities, years, types = {}, {}, {}
+    for record in records:
+        plates = record.get('city_license_plates')
+        registrations = 0
+        if isinstance(plates, dict):
+            for city, count in plates.items():
+                count = count or 0
+                cities[city] = cities.get(city, 0) + count
+                registrations += count
+        car_type = record.get('car_type')
+        types[car_type] = types.get(car_type, 0) + registrations
+
+        year = record.get('manufacture_year')
+        if year:
+            row = years.setdefault(int(year), {'row_count': 0, 'attention': 0,
+                                               'price_sum': Decimal(0), 'registrations': 0})
+            row['row_count'] += 1
+            row['attention'] += record.get('popularity') or 0
+            row['price_sum'] += Decimal(str(record.get('manufacturer_suggested_price') or 0))
+            row['registrations'] += registrations
+
+    return {
+        'car_summary_city': [{'city': city, 'registrations': count} for city, count in cities.items()],
+        'car_summary_year': [{'manufacture_year': year, **row} for year, row in years.items()],
+        'car_summary_type': [{'car_type': car_type, 'registrations': count} for car_type, count in types.items()],
+    }
+
+
+def update_summary_tables(records):
+    """
+    把一批已成功写入 car_data 的记录的增量追加到汇总表；
+    追加失败时从 car_data 全量重建，避免汇总表与明细表不一致。
+    """
+    global _summary_appends
+    deltas = summarize_records(records)
+    with _summary_lock:
+        for table_name, rows in deltas.items():
+            if not rows:
+                continue
+            result = insert_into_hive_table(table_name=table_name, data=rows,
+                                            schema=summary_table_schemas[table_name], config=HIVE_CONFIG,
+                                            batch_size=HIVE_INSERT_CONFIG['batch_size'])
+            if result['status'] != 'success':
+                logging.warning(f"汇总表 {table_name} 增量写入失败，全量重建: {result['message']}")
+                return build_summary_tables()
+
+        _summary_appends += 1
+        if _summary_appends >= SUMMARY_TABLE_CONFIG['compact_every']:
+            return compact_summary_tables()
+    return {'status': 'success', 'message': '汇总表增量已写入'}
+
+
+def _inserted_records(car_data, insert_result):
+    """返回 insert_data 实际写入成功的记录，无法确定时返回 None"""
+    if insert_result['status'] == 'success':
+        return car_data
+    batches = insert_result.get('batches')
+    if not batches:
+        return None
+    return [record for batch in batches if batch['status'] == 'success'
+            for record in car_data[batch['offset']:batch['offset'] + batch['rows']]]
+
+
+def summary_city_registrations():
+    """从汇总表返回 {城市: 上牌量总和}，按城市名排序"""
+    rows = _aggregate(
+        table_name='car_summary_city',
+        select={'city': 'city', 'registrations': 'SUM(registrations)'},
+        group_by=['city'],
+        order_by='city',
+    )
+    return {row['city']: _to_number(row['registrations']) for row in rows}
+
+
+def summary_year_trends():
+    """从汇总表返回年份趋势，格式与 aggregate_year_trends 相同"""
+    rows = _aggregate(
+        table_name='car_summary_year',
+        select={
+            'year': 'manufacture_year',
+            'count': 'SUM(row_count)',
+            'attention': 'SUM(attention)',
+            'price_sum': 'SUM(price_sum)',
+            'registrations': 'SUM(registrations)',
+        },
+        group_by=['manufacture_year'],
+    )
+    trends = []
+    for row in sorted(rows, key=lambda r: r['year']):
+        count = _to_number(row['count'])
+        if not count:
+            continue
+        trends.append({
+            'date': str(row['year']),
+            'registrations': _to_number(row['registrations']),
+            'attention': _to_number(row['attention']),
+            'avg_price': float(_to_number(row['price_sum'])) / count
+        })
+    return trends
+
+
+def summary_type_registrations():
+    """从汇总表返回 {car_type: 上牌量总和}"""
+    rows = _aggregate(
+        table_name='car_summary_type',
+        select={'car_type': 'car_type', 'registrations': 'SUM(registrations)'},
+        group_by=['car_type'],
+    )
+    return {row['car_type']: _to_number(row['registrations']) for row in rows}
+
+
+# 预定义的模拟数据池，确保数据多样性
+CAR_BRANDS = ["丰田", "本田", "大众", "奔驰", "宝马", "奥迪", "特斯拉", "比亚迪"]
+CITIES = ["北京", "上海", "广州", "深圳", "成都", "杭州", "重庆", "武汉"]
+CAR_MODELS = {
+    "丰田": ["凯美瑞", "卡罗拉", "RAV4荣放"],
+    "本田": ["雅阁", "思域", "CR-V"],
+    "大众": ["朗逸", "速腾", "迈腾"],
+    "奔驰": ["C级", "E级", "S级"],
+    "宝马": ["3系", "5系", "X5"],
+    "奥迪": ["A4L", "A6L", "Q5L"],
+    "特斯拉": ["Model 3", "Model Y"],
+    "比亚迪": ["汉", "宋", "秦"],
+}
+CAR_TYPES = ["轿车", "SUV", "MPV", "跑车", "皮卡"]
+
+# 历史价格的键为 "年份-月份"，年份从当前年份往前递减
+HISTORY_YEAR = 2025
+_HISTORY_KEYS = np.array([[f"{HISTORY_YEAR - i}-{month:02d}" for month in range(1, 13)] for i in range(7)],
+                         dtype=object)
+
+
+def _pool(values):
+    """字符串池使用 object 数组，按下标取值和 tolist 都只复制引用"""
+    return np.array(values, dtype=object)
+
+
+def _rand_strings(rng, n, alphabet, min_len, max_len):
+    """生成 n 个长度在 [min_len, max_len] 之间的随机字符串"""
+    letters = _pool(list(alphabet))[rng.integers(0, len(alphabet), (n, max_len))]
+    lengths = rng.integers(min_len, max_len + 1, n)
+    return [''.join(row[:k]) for row, k in zip(letters.tolist(), lengths.tolist())]
+
+
+def _rand_maps(keys, values, counts):
+    """按行组装 dict：第 i 行取 keys/values 第 i 行的前 counts[i] 列"""
+    # 只展开需要的元素，再按每行个数依次切分
+    mask = np.arange(keys.shape[1]) < counts[:, None]
+    items = zip(keys[mask].tolist(), values[mask].tolist())
+    return [dict(islice(items, count)) for count in counts.tolist()]
+
+
+def _rand_columns(rng, n, schema):
+    """
+    按列生成 n 行随机数据，返回 {字段名: list}，值均为 Python 原生类型。
+
+    保持与逐行生成时相同的约束：车型属于所选品牌，最低参考价不高于建议价，
+    历史价格为连续年份，各城市车牌数的城市互不相同。
+    """
+    brands = _pool(CAR_BRANDS)
+    brand_idx = rng.integers(0, len(brands), n)
+    # 所有车型拼成一个数组，按品牌偏移量 + 品牌内序号取车型
+    model_counts = np.array([len(CAR_MODELS[brand]) for brand in CAR_BRANDS])
+    model_offsets = np.concatenate(([0], np.cumsum(model_counts)[:-1]))
+    models = _pool([model for brand in CAR_BRANDS for model in CAR_MODELS[brand]])
+    model_idx = model_offsets[brand_idx] + (rng.random(n) * model_counts[brand_idx]).astype(np.int64)
+
+    columns = {}
+    for field, data_type in schema.items():
+        if field == 'car_brand':
+            columns[field] = brands[brand_idx].tolist()
+        elif field == 'car_model':
+            columns[field] = models[model_idx].tolist()
+        elif field == 'city':
+            columns[field] = _pool(CITIES)[rng.integers(0, len(CITIES), n)].tolist()
+        elif data_type == 'STRING':
+            if field == 'car_type':
+                columns[field] = _pool(CAR_TYPES)[rng.integers(0, len(CAR_TYPES), n)].tolist()
+            else:
+                columns[field] = _rand_strings(rng, n, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 5, 10)
+        elif data_type.startswith('DECIMAL'):
+            if field == 'manufacturer_suggested_price':
+                values = np.round(rng.uniform(80000, 500000, n), 2)
+            elif field == 'min_reference_price':
+                # 确保参考价格低于或等于建议价格（建议价字段在 schema 中位于其前）
+                suggested = np.array(columns['manufacturer_suggested_price'])
+                values = np.minimum(np.round(rng.uniform(0.8 * suggested, suggested), 2), suggested)
+            elif field == 'fuel_capacity':
+                values = np.round(rng.uniform(30, 80, n), 2)
+            elif field == 'discount_percentage':
+                values = np.round(rng.uniform(0, 20, n), 2)
+            else:
+                values = np.round(rng.uniform(0, 10000, n), 2)
+            columns[field] = values.tolist()
+        elif data_type == 'INT':
+            if field == 'engine_horsepower':
+                values = rng.integers(80, 501, n)
+            elif field == 'num_doors':
+                values = np.array([2, 4, 5])[rng.integers(0, 3, n)]  # 常见门数
+            elif field == 'manufacture_year':
+                values = rng.integers(2010, 2026, n)
+            elif field == 'popularity':
+                values = rng.integers(1, 1001, n)
+            else:
+                values = rng.integers(0, 10001, n)
+            columns[field] = values.tolist()
+        elif data_type == 'MAP<STRING, INT>':
+            if field == 'historical_price':
+                # 第 i 项的年份为 HISTORY_YEAR - i，月份随机
+                months = rng.integers(0, 12, (n, 7))
+                keys = _HISTORY_KEYS[np.arange(7), months]
+                prices = rng.integers(50000, 400001, (n, 7))
+                columns[field] = _rand_maps(keys, prices, rng.integers(3, 8, n))
+            elif field == 'city_license_plates':
+                # 每行对城市做随机排列后取前若干个，保证城市互不相同
+                order = np.argsort(rng.random((n, len(CITIES))), axis=1)
+                keys = _pool(CITIES)[order]
+                plates = rng.integers(1000, 100001, (n, len(CITIES)))
+                columns[field] = _rand_maps(keys, plates, rng.integers(2, 6, n))
+            else:
+                counts = rng.integers(1, 6, n)
+                keys = _pool(_rand_strings(rng, n * 5, 'abcdefghijklmnopqrstuvwxyz', 5, 5)).reshape(n, 5)
+                values = rng.integers(1, 101, (n, 5))
+                columns[field] = _rand_maps(keys, values, counts)
+        else:
+            # 不支持的类型填充 None
+            columns[field] = [None] * n
+    return columns
+
+
+def iter_rand_columns(num_records, batch_size=10000, seed=None, schema=None):
+    """
+    分批按列生成随机数据，每批为 {字段名: list}，适合直接按列写文件。
+
+    Args:
+        num_records (int): 要生成的记录总数。
+        batch_size (int): 每批记录数。
+        seed (int | numpy.random.SeedSequence, optional): 随机种子，
+            相同的 seed 和 batch_size 生成相同的数据。
+        schema (dict, optional): 数据结构模式，默认为 car_data_schema。
+
+    Yields:
+        dict: 每批数据的列。
+    """
+    schema = schema or car_data_schema
+    rng = np.random.default_rng(seed)
+    for start in range(0, num_records, batch_size):
+        yield _rand_columns(rng, min(batch_size, num_records - start), schema)
+
+
+def iter_rand_data(num_records, batch_size=10000, seed=None, schema=None):
+    """
+    分批生成随机数据，每批最多 batch_size 条，适合流式写入。参数同 iter_rand_columns。
+
+    Yields:
+        list: 每批随机数据字典的列表。
+    """
+    fields = list(schema or car_data_schema)
+    for columns in iter_rand_columns(num_records, batch_size, seed, schema):
+        yield [dict(zip(fields, values)) for values in zip(*(columns[field] for field in fields))]
+
+
+def rand_data_generate(num_records, seed=None):
+    """
+    根据给定的数据结构模式生成随机数据，按列一次性生成。
 
     Args:
-        schema (dict): 定义数据字段及其类型的字典。
-                       支持的类型包括 'STRING', 'INT', 'DECIMAL(p, s)',
-                       'MAP<STRING, INT>'。
         num_records (int): 要生成的记录数量。
+        seed (int, optional): 随机种子，用于复现同一批数据。
 
     Returns:
         list: 包含生成的随机数据字典的列表。
     """
-    schema = car_data_schema
-    generated_data = []
-
-    # 预定义的模拟数据池，确保数据多样性
-    car_brands = ["丰田", "本田", "大众", "奔驰", "宝马", "奥迪", "特斯拉", "比亚迪"]
-    cities = ["北京", "上海", "广州", "深圳", "成都", "杭州", "重庆", "武汉"]
-    car_models = {
-        "丰田": ["凯美瑞", "卡罗拉", "RAV4荣放"],
-        "本田": ["雅阁", "思域", "CR-V"],
-        "大众": ["朗逸", "速腾", "迈腾"],
-        "奔驰": ["C级", "E级", "S级"],
-        "宝马": ["3系", "5系", "X5"],
-        "奥迪": ["A4L", "A6L", "Q5L"],
-        "特斯拉": ["Model 3", "Model Y"],
-        "比亚迪": ["汉", "宋", "秦"],
-    }
-    car_types = ["轿车", "SUV", "MPV", "跑车", "皮卡"]
-
-    for _ in range(num_records):
-        record = {}
-        # 随机选择一个品牌，确保模型与品牌匹配
-        brand = random.choice(car_brands)
-        model = random.choice(car_models.get(brand, ["未知车型"])) # 如果品牌没有匹配的模型，则使用“未知车型”
-
-        for field, data_type in schema.items():
-            if field == 'car_brand':
-                record[field] = brand
-            elif field == 'car_model':
-                record[field] = model
-            elif field == 'city':
-                record[field] = random.choice(cities)
-            elif data_type == 'STRING':
-                # 为其他字符串类型生成随机字符串或从预定义列表中选择
-                if field == 'car_type':
-                    record[field] = random.choice(car_types)
-                else:
-                    record[field] = ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=random.randint(5, 10)))
-            elif data_type.startswith('DECIMAL'):
-                # 修正：现在生成的是 float 类型，不再进行 Decimal 的精确量化
-                if field == 'manufacturer_suggested_price':
-                    record[field] = round(random.uniform(80000, 500000), 2) # 保留两位小数
-                elif field == 'min_reference_price':
-                    # 确保参考价格低于或等于建议价格
-                    record[field] = round(random.uniform(0.8 * record['manufacturer_suggested_price'], record['manufacturer_suggested_price']), 2)
-                elif field == 'fuel_capacity':
-                    record[field] = round(random.uniform(30, 80), 2)
-                elif field == 'discount_percentage':
-                    record[field] = round(random.uniform(0, 20), 2)
-                else:
-                    # 对于其他DECIMAL，生成通用浮点数
-                    record[field] = round(random.uniform(0, 10000), 2) # 默认保留两位小数
-            elif data_type == 'INT':
-                if field == 'engine_horsepower':
-                    record[field] = random.randint(80, 500)
-                elif field == 'num_doors':
-                    record[field] = random.choice([2, 4, 5]) # 常见门数
-                elif field == 'manufacture_year':
-                    record[field] = random.randint(2010, 2025)
-                elif field == 'popularity':
-                    record[field] = random.randint(1, 1000)
-                else:
-                    record[field] = random.randint(0, 10000)
-            elif data_type == 'MAP<STRING, INT>':
-                if field == 'historical_price':
-                    # 生成随机的历史价格，键可以是年份或月份
-                    num_entries = random.randint(3, 7)
-                    history = {}
-                    current_year = 2025
-                    for i in range(num_entries):
-                        year_month = f"{current_year - i}-{random.randint(1, 12):02d}"
-                        history[year_month] = random.randint(50000, 400000)
-                    record[field] = history
-                elif field == 'city_license_plates':
-                    # 生成随机的城市车牌数量，键是城市
-                    num_entries = random.randint(2, 5)
-                    license_plates = {}
-                    selected_cities = random.sample(cities, min(num_entries, len(cities)))
-                    for city_name in selected_cities:
-                        license_plates[city_name] = random.randint(1000, 100000)
-                    record[field] = license_plates
-                else:
-                    # 默认的 MAP<STRING, INT> 生成逻辑
-                    map_data = {}
-                    num_entries = random.randint(1, 5)
-                    for _ in range(num_entries):
-                        key = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz', k=5))
-                        value = random.randint(1, 100)
-                        map_data[key] = value
-                    record[field] = map_data
-            else:
-                # 如果遇到不支持的类型，可以返回None或抛出错误
-                record[field] = None
-        generated_data.append(record)
-    return generated_data
\ No newline at end of file
+    if num_records <= 0:
+        return []
+    return next(iter_rand_data(num_records, batch_size=num_records, seed=seed))
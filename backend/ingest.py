@@ -0,0 +1,374 @@
+import os
+import re
+import queue
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import pandas as pd
+from openpyxl import load_workbook
+from config import REVERSE_MAPPING, NON_MAPPED_FIELDS, car_data_schema
+
+# 解析线程结束的标记
+_DONE = object()
+
+
+class EmptyUploadError(ValueError):
+    """上传的文件没有任何数据行"""
+
+
+# 整数类 Hive 类型
+_INT_TYPES = ('TINYINT', 'SMALLINT', 'INT', 'BIGINT')
+# 整数类型的取值范围 [min, max]，超出范围的值 Hive 会写成 NULL 或使整批 INSERT 失败
+_INT_RANGES = {name: (-2 ** (bits - 1), 2 ** (bits - 1) - 1)
+               for name, bits in zip(_INT_TYPES, (8, 16, 32, 64))}
+_MAP_VALUE_PATTERN = re.compile(r'MAP\s*<[^,]+,\s*(\w+)\s*>')
+_DECIMAL_PATTERN = re.compile(r'DECIMAL\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)')
+# MAP<STRING, INT> 的文本形式，兼容 "北京:10,上海:20" 与 {"北京": 10, "上海": 20}
+_MAP_ITEM_PATTERN = r"['\"]?\s*([^,:{}'\"]+?)\s*['\"]?\s*:\s*(-?\d+)"
+# 最多保留的拒绝明细条数，被拒绝的总行数另行计数
+MAX_REJECTIONS = 100
+# .xls（OLE2 复合文档）的文件头
+_XLS_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+
+def _frame_chunks(frame, names, chunk_size, offset=0):
+    """按 chunk_size 切分 DataFrame，索引为从 0 开始的全局数据行号"""
+    frame.columns = names
+    for start in range(0, len(frame), chunk_size):
+        chunk = frame.iloc[start:start + chunk_size]
+        chunk.index = pd.RangeIndex(offset + start, offset + start + len(chunk))
+        yield chunk
+
+
+def iter_excel_frames(file_path, chunk_size=5000):
+    """
+    按行块读取 Excel 的第一个工作表，第一行为表头，逐块产出 DataFrame。
+
+    DataFrame 的索引为数据行号（从 0 开始，不含表头），用于在拒绝报告中定位原始行。
+    .xlsx 使用 openpyxl 只读模式逐行读取，内存占用与块大小有关而与文件大小无关；
+    .xls 无法流式读取，退化为 pandas 整表读取后分块产出。
+    """
+    if os.path.splitext(file_path)[1].lower() == '.xls':
+        df = pd.read_excel(file_path)
+        yield from _frame_chunks(df, [str(name).strip() for name in df.columns], chunk_size)
+        return
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        positions = [i for i, name in enumerate(header) if name is not None]
+        names = [str(header[i]).strip() for i in positions]
+        width = len(header)
+        offset = 0
+        while True:
+            block = list(islice(rows, chunk_size))
+            if not block:
+                break
+            frame = pd.DataFrame.from_records(block)
+            # 行尾的空单元格可能被省略，补齐到表头宽度
+            frame = frame.reindex(columns=range(width)).iloc[:, positions]
+            yield from _frame_chunks(frame, names, chunk_size, offset)
+            offset += len(block)
+    finally:
+        workbook.close()
+
+
+def check_excel(file_path):
+    """
+    快速校验上传文件，用于在提交后台任务前拒绝无效文件。
+
+    .xlsx 只读取表头和第一行数据；.xls 无法流式读取，只校验文件头，
+    空文件和单元格内容由后台任务解析时报告，上传请求中不整表解析。
+
+    Raises:
+        EmptyUploadError: 文件没有数据行。
+        Exception: 文件无法解析时原样抛出。
+    """
+    if os.path.splitext(file_path)[1].lower() == '.xls':
+        with open(file_path, 'rb') as f:
+            if f.read(len(_XLS_SIGNATURE)) != _XLS_SIGNATURE:
+                raise ValueError('Not an .xls workbook')
+        return
+
+    frames = iter_excel_frames(file_path, chunk_size=1)
+    try:
+        if next(frames, None) is None:
+            raise EmptyUploadError('Excel file is empty')
+    finally:
+        frames.close()
+
+
+def rename_upload_columns(df):
+    """
+    转换字段名：前端字段 -> 数据库字段，非映射字段直接使用数据库字段名，其余列丢弃。
+    同一数据库字段同时出现前端名和数据库名时，以数据库名一列为准。
+    """
+    renamed = {front_field: db_field for front_field, db_field in REVERSE_MAPPING.items()
+               if front_field in df.columns}
+    renamed.update({field: field for field in NON_MAPPED_FIELDS if field in df.columns})
+    frame = df[list(renamed)].rename(columns=renamed)
+    return frame.loc[:, ~frame.columns.duplicated(keep='last')]
+
+
+def _coerce_numeric(values, hive_type):
+    """
+    将一列转换为数值类型，返回 (转换后的列, 失败掩码, 失败原因)。
+    DECIMAL 按 scale 四舍五入并检查整数位是否超出 precision，整数类型检查是否超出取值范围。
+    """
+    numbers = pd.to_numeric(values, errors='coerce')
+    failed = values.notna() & numbers.isna()
+    reason = f'not a valid {hive_type}'
+
+    decimal = _DECIMAL_PATTERN.search(hive_type)
+    if decimal:
+        precision, scale = int(decimal.group(1)), int(decimal.group(2))
+        numbers = numbers.round(scale)
+        overflow = numbers.abs() >= 10 ** (precision - scale)
+        failed |= overflow
+        if overflow.any():
+            reason = f'not a valid {hive_type} or out of range'
+        return numbers.astype(object).where(numbers.notna() & ~failed, None), failed, reason
+
+    int_type = hive_type.split('(')[0]
+    if int_type in _INT_TYPES:
+        failed |= numbers.notna() & (numbers % 1 != 0)
+        low, high = _INT_RANGES[int_type]
+        overflow = (numbers < low) | (numbers > high)
+        failed |= overflow
+        if overflow.any():
+            reason = f'not a valid {hive_type} or out of range'
+        ints = numbers.where(~failed).astype('Int64')
+        return ints.astype(object).where(ints.notna(), None), failed, reason
+
+    return numbers.astype(object).where(numbers.notna(), None), failed, reason
+
+
+def _coerce_map(values, hive_type):
+    """
+    将 MAP<STRING, INT> 列的文本形式解析为 dict，返回 (转换后的列, 失败掩码, 失败原因)。
+    已经是 dict 的值保持不变；空文本与 "{}" 视为 NULL。整数值超出值类型取值范围的行整行拒绝。
+    """
+    value_type = _MAP_VALUE_PATTERN.search(hive_type)
+    low, high = _INT_RANGES.get(value_type.group(1) if value_type else None, (None, None))
+    reason = f'not a valid {hive_type}'
+    is_dict = values.map(lambda v: isinstance(v, dict))
+    is_text = values.map(lambda v: isinstance(v, str))
+    failed = values.notna() & ~is_dict & ~is_text
+    result = values.astype(object).where(is_dict, None)
+
+    text = values[is_text].str.strip()
+    text = text[~text.isin(['', '{}'])]
+    if not text.empty:
+        items = text.str.extractall(_MAP_ITEM_PATTERN)
+        counts = items.groupby(level=0).size().reindex(text.index, fill_value=0)
+        # 每个逗号分隔的键值对都必须能解析，否则整行拒绝
+        bad = text.index[counts != text.str.strip('{}').str.count(',') + 1]
+        failed[bad] = True
+        items = items[~items.index.get_level_values(0).isin(bad)]
+        items[1] = items[1].astype(int)
+        if low is not None:
+            overflow = items.index.get_level_values(0)[(items[1] < low) | (items[1] > high)].unique()
+            if len(overflow):
+                failed[overflow] = True
+                reason = f'not a valid {hive_type} or out of range'
+                items = items[~items.index.get_level_values(0).isin(overflow)]
+        for row, group in items.groupby(level=0):
+            result[row] = dict(zip(group[0], group[1]))
+    if low is not None and is_dict.any():
+        overflow = values[is_dict].map(lambda d: any(
+            isinstance(v, int) and not low <= v <= high for v in d.values()))
+        if overflow.any():
+            failed[overflow.index[overflow]] = True
+            result[overflow.index[overflow]] = None
+            reason = f'not a valid {hive_type} or out of range'
+    return result, failed, reason
+
+
+def prepare_upload_frame(df, schema=None):
+    """
+    对一个行块做字段名转换和类型转换，全部为按列的向量化操作。
+
+    Args:
+        df (DataFrame): iter_excel_frames 产出的原始行块。
+        schema (dict, optional): 目标表结构，默认为 car_data_schema。
+
+    Returns:
+        tuple: (可插入的记录 list[dict], 拒绝报告 list[dict])。拒绝报告每项为
+        {'row': Excel 行号, 'column': 字段名或 None, 'value': 原始值, 'reason': 原因}，
+        没有任何可识别非空字段的行以 column=None 报告。
+    """
+    schema = schema or car_data_schema
+    frame = rename_upload_columns(df)
+    empty = pd.Series(frame.isna().all(axis=1) if len(frame.columns) else True, index=frame.index)
+    rejected = empty.copy()
+    report = [(row, None, None, 'empty row') for row in frame.index[empty]]
+
+    columns = {}
+    for name in frame.columns:
+        values = frame[name]
+        hive_type = schema.get(name, 'STRING').upper()
+        if 'MAP' in hive_type:
+            coerced, failed, reason = _coerce_map(values, hive_type)
+        elif hive_type.split('(')[0] in _INT_TYPES + ('DECIMAL', 'DOUBLE', 'FLOAT'):
+            coerced, failed, reason = _coerce_numeric(values, hive_type)
+        else:
+            coerced = values.astype(object).where(values.notna(), None)
+            coerced = coerced.where(coerced.isna(), coerced.astype(str))
+            failed, reason = None, None
+        columns[name] = coerced
+        if failed is not None:
+            failed &= ~empty
+            report.extend((row, name, values[row], reason) for row in frame.index[failed])
+            rejected |= failed
+
+    prepared = pd.DataFrame(columns, index=frame.index, dtype=object)[~rejected]
+    report.sort(key=lambda item: item[0])
+    # numpy 标量转为 Python 类型，便于拒绝报告直接序列化为 JSON
+    rejections = [{'row': int(row) + 2, 'column': column,
+                   'value': value.item() if hasattr(value, 'item') else value, 'reason': reason}
+                  for row, column, value, reason in report]
+    return prepared.to_dict(orient='records'), rejections
+
+
+def stream_excel_to_hive(file_path, insert_fn, chunk_size=5000, queue_size=4, progress=None):
+    """
+    流式导入 Excel：解析线程逐块读取并转换，当前线程从有界队列取块插入 Hive。
+
+    队列满时解析线程阻塞，因此内存中最多同时存在约 queue_size + 2 个块。
+
+    Args:
+        file_path (str): Excel 文件路径。
+        insert_fn (callable): 接收 list[dict]，返回 insert_data 格式的结果字典。
+        chunk_size (int): 每块行数。
+        queue_size (int): 队列中最多缓存的块数。
+        progress (callable, optional): 每插入一块后以当前汇总字典调用一次。
+
+    Returns:
+        dict: rows_parsed / rows_rejected / rows_inserted / rows_failed / chunks / errors，
+        以及前 MAX_REJECTIONS 条拒绝明细 rejections。
+
+    Raises:
+        EmptyUploadError: 文件没有数据行。
+        Exception: 解析失败时原样抛出解析线程中的异常。
+    """
+    chunks = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    parse_error = []
+    summary = {
+        'rows_parsed': 0,
+        'rows_rejected': 0,
+        'rows_inserted': 0,
+        'rows_failed': 0,
+        'chunks': 0,
+        'errors': [],
+        'rejections': [],
+    }
+
+    def put(item):
+        # 插入端出错停止消费时，解析线程不能永远阻塞在 put 上
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def parse():
+        try:
+            for frame in iter_excel_frames(file_path, chunk_size):
+                records, rejections = prepare_upload_frame(frame)
+                if not put((len(frame), rejections, records)):
+                    return
+        except Exception as e:
+            parse_error.append(e)
+        finally:
+            put(_DONE)
+
+    parser = threading.Thread(target=parse, name='excel-parser', daemon=True)
+    parser.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                break
+            parsed, rejections, records = item
+            summary['rows_parsed'] += parsed
+            summary['rows_rejected'] += len({rejection['row'] for rejection in rejections})
+            summary['rejections'].extend(rejections[:MAX_REJECTIONS - len(summary['rejections'])])
+            if records:
+                result = insert_fn(records)
+                inserted = result.get('inserted_rows', len(records) if result['status'] == 'success' else 0)
+                summary['rows_inserted'] += inserted
+                summary['rows_failed'] += len(records) - inserted
+                if result['status'] != 'success':
+                    summary['errors'].append(result['message'])
+                    logging.warning(f"上传数据块 {summary['chunks']} 插入失败: {result['message']}")
+            summary['chunks'] += 1
+            if progress:
+                progress(dict(summary))
+    finally:
+        stop.set()
+        parser.join()
+
+    if parse_error:
+        raise parse_error[0]
+    if summary['rows_parsed'] == 0:
+        raise EmptyUploadError('Excel file is empty')
+    return summary
+
+
+def load_batches_into_hive(batches, insert_fn, max_workers=4, progress=None):
+    """
+    将批次并行插入 Hive：当前线程逐批产出数据，线程池并发执行插入。
+
+    同时在途的批次最多 max_workers * 2 个，产出端不会超前太多，内存占用有界。
+
+    Args:
+        batches (Iterable[list[dict]]): 待插入的批次，例如 iter_rand_data 的输出。
+        insert_fn (callable): 接收 list[dict]，返回 insert_data 格式的结果字典。
+        max_workers (int): 并发插入的线程数。
+        progress (callable, optional): 每完成一批后以当前汇总字典调用一次。
+
+    Returns:
+        dict: rows_generated / rows_inserted / rows_failed / chunks / errors。
+    """
+    summary = {
+        'rows_generated': 0,
+        'rows_inserted': 0,
+        'rows_failed': 0,
+        'chunks': 0,
+        'errors': [],
+    }
+
+    def finish(future, rows):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'status': 'error', 'message': str(e), 'inserted_rows': 0}
+        inserted = result.get('inserted_rows', rows if result['status'] == 'success' else 0)
+        summary['rows_inserted'] += inserted
+        summary['rows_failed'] += rows - inserted
+        summary['chunks'] += 1
+        if result['status'] != 'success':
+            summary['errors'].append(result['message'])
+            logging.warning(f"数据块 {summary['chunks']} 插入失败: {result['message']}")
+        if progress:
+            progress(dict(summary))
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hive-load') as executor:
+        for batch in batches:
+            summary['rows_generated'] += len(batch)
+            pending.append((executor.submit(insert_fn, batch), len(batch)))
+            # 按提交顺序回收结果，在途批次超过上限时等待最早的一批
+            while len(pending) >= max_workers * 2 or (pending and pending[0][0].done()):
+                finish(*pending.popleft())
+        while pending:
+            finish(*pending.popleft())
+    return summary
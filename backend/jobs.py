@@ -0,0 +1,150 @@
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueueFullError(Exception):
+    """排队等待执行的任务已达上限"""
+
+
+class Job:
+    """
+    一个后台任务的状态与进度。
+
+    status 依次为 'queued' -> 'running' -> 'succeeded' / 'failed'，
+    progress 中的计数由任务函数通过 update_progress 更新。
+    """
+
+    def __init__(self, kind, description=''):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {}
+        self.errors = []
+        self.result = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def update_progress(self, **counters):
+        with self._lock:
+            self.progress.update(counters)
+
+    def add_error(self, message, limit=20):
+        """记录错误信息，只保留前 limit 条以免单个任务占用过多内存"""
+        with self._lock:
+            if len(self.errors) < limit:
+                self.errors.append(message)
+
+    def _start(self):
+        with self._lock:
+            self.status = 'running'
+            self.started_at = time.time()
+
+    def _finish(self, status, result=None):
+        with self._lock:
+            self.status = status
+            self.result = result
+            self.finished_at = time.time()
+        self._done.set()
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束"""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        with self._lock:
+            progress = dict(self.progress)
+            elapsed = None
+            if self.started_at is not None:
+                elapsed = (self.finished_at or time.time()) - self.started_at
+            # 吞吐量按已插入行数计算
+            rows = progress.get('rows_inserted', 0)
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'description': self.description,
+                'status': self.status,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'elapsed': elapsed,
+                'progress': progress,
+                'rows_per_second': rows / elapsed if elapsed else 0.0,
+                'errors': list(self.errors),
+                'result': self.result,
+            }
+
+
+class JobManager:
+    """
+    在有界线程池中运行后台任务，并在内存中保留最近 max_jobs 个任务供查询。
+
+    任务状态只保存在当前进程中，多个工作进程之间不共享，服务需以单进程方式部署。
+
+    Args:
+        max_workers (int): 同时运行的任务数。
+        max_jobs (int): 保留的任务数，超出时丢弃最早结束的任务。
+        max_queued (int): 排队等待执行的任务上限，达到上限时拒绝新任务。
+    """
+
+    def __init__(self, max_workers=2, max_jobs=200, max_queued=20):
+        self.max_jobs = max_jobs
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _run(self, job, fn, args, kwargs):
+        job._start()
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            logging.exception(f"后台任务 {job.id}（{job.kind}）失败")
+            job.add_error(str(e))
+            job._finish('failed')
+        else:
+            # 任务函数返回 status 为 'error' 的结果字典时同样视为失败，保留结果供查询
+            failed = isinstance(result, dict) and result.get('status') == 'error'
+            job._finish('failed' if failed else 'succeeded', result)
+
+    def submit(self, kind, fn, *args, description='', **kwargs):
+        """
+        提交任务，fn 以 fn(job, *args, **kwargs) 的形式在后台线程中调用，
+        返回值记录为 job.result，抛出异常或返回 {'status': 'error', ...} 时任务状态为 'failed'。
+        排队中的任务达到 max_queued 个时抛出 JobQueueFullError。
+        """
+        job = Job(kind, description)
+        with self._lock:
+            queued = sum(1 for queued_job in self._jobs.values() if queued_job.status == 'queued')
+            if queued >= self.max_queued:
+                raise JobQueueFullError(f"排队中的任务已达上限 {self.max_queued}")
+            self._jobs[job.id] = job
+            self._evict_locked()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _evict_locked(self):
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:excess]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用 Flask 默认的 json 实现
+    orjson = None
+
+if orjson is not None:
+    # 与 Flask 默认行为一致按键排序；允许非字符串键；直接序列化 numpy 数组
+    ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj):
+    """orjson 不支持的类型：Decimal 转为字符串（与 Flask 默认一致），numpy 标量转为 Python 数值"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    使用 orjson 序列化的 Flask JSON provider，loads 沿用 Flask 默认实现。
+
+    输出为 UTF-8 编码（不转义非 ASCII 字符），NaN 输出为 null；其余与 Flask 默认输出等价。
+    """
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        """序列化为 UTF-8 字节串，省去 str 与 bytes 之间的转换"""
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def init_json_provider(app):
+    """orjson 可用时为 app 启用 OrjsonProvider"""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    return app.json
@@ -0,0 +1,146 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+from cache import get_data_version
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只提供 gzip 压缩
+    brotli = None
+
+
+def supported_encodings():
+    """按优先级返回可用的压缩编码"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class CachedResponse:
+    """
+    一个已序列化的响应体，压缩后的内容在第一次被请求时生成并保留。
+
+    Args:
+        key (str): 缓存键。
+        body (bytes): 未压缩的响应体。
+        mimetype (str): 响应的 MIME 类型。
+    """
+    __slots__ = ('key', 'body', 'mimetype', 'encoded')
+
+    def __init__(self, key, body, mimetype):
+        self.key = key
+        self.body = body
+        self.mimetype = mimetype
+        self.encoded = {}
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(data) for data in self.encoded.values())
+
+
+class ResponseCache:
+    """
+    按 (路由, 规范化查询参数) 缓存已序列化的响应字节，可选 gzip / brotli 压缩。
+
+    数据版本号变化（insert_data 写入数据）时清空全部条目；条目数或总字节数超出上限时
+    按 LRU 淘汰。压缩结果与原始字节存放在同一条目中，只计算一次。
+
+    Args:
+        max_entries (int): 最多缓存的响应数。
+        max_bytes (int): 所有条目（含压缩结果）的总字节数上限。
+        min_compress_size (int): 小于该字节数的响应不压缩。
+        gzip_level (int): gzip 压缩级别。
+        brotli_quality (int): brotli 压缩质量。
+        enabled (bool): 为 False 时不缓存。
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, min_compress_size=1024,
+                 gzip_level=6, brotli_quality=5, enabled=True):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.min_compress_size = min_compress_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = get_data_version()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _check_version_locked(self):
+        version = get_data_version()
+        if version != self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+            self._stats['invalidations'] += 1
+
+    def get(self, key):
+        """返回 key 对应的 CachedResponse，不存在时返回 None"""
+        with self._lock:
+            self._check_version_locked()
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def put(self, key, body, mimetype, version):
+        """
+        缓存一个响应体。version 为开始计算响应前的数据版本号，
+        计算期间发生写入时不缓存，避免把旧数据存到新版本下。
+        """
+        entry = CachedResponse(key, body, mimetype)
+        with self._lock:
+            self._check_version_locked()
+            if version != self._version or entry.size > self.max_bytes:
+                return entry
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict_locked()
+        return entry
+
+    def _evict_locked(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._stats['evictions'] += 1
+
+    def encode(self, entry, encoding):
+        """返回 entry 按 encoding 压缩后的字节，'identity' 或响应过小时返回原始字节"""
+        if encoding == 'identity' or len(entry.body) < self.min_compress_size:
+            return entry.body
+        data = entry.encoded.get(encoding)
+        if data is None:
+            if encoding == 'br':
+                data = brotli.compress(entry.body, quality=self.brotli_quality)
+            else:
+                data = gzip.compress(entry.body, compresslevel=self.gzip_level)
+            with self._lock:
+                # 并发请求可能同时压缩，只计一次
+                if encoding not in entry.encoded:
+                    entry.encoded[encoding] = data
+                    if self._entries.get(entry.key) is entry:
+                        self._bytes += len(data)
+                        self._evict_locked()
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['encodings'] = list(supported_encodings())
+        return stats
@@ -2,21 +2,27 @@
 import sys
 import os
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, DEFAULT
 import json
 import pandas as pd
+from decimal import Decimal
 
 # 添加当前目录到 Python 路径
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 # 现在可以导入 app
-from app import app
+from app import app, car_data_cache, city_data_cache, job_manager, running_aggregates, response_cache
+from aggregates import AGGREGATE_COLUMNS
+from config import RECOMMENDATION_CONFIG, HIVE_CONFIG
 
 
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
-    with app.test_client() as client:
+    # 默认在进程内快照上计算，Hive 下推路径由单独的用例覆盖
+    app.config['ANALYTICS_SOURCE'] = 'snapshot'
+    # insert_data 按表实际的分区列写入，测试中 car_data 视为未分区
+    with patch('func.get_partition_columns', return_value=[]), app.test_client() as client:
         yield client
 
 
@@ -94,13 +100,28 @@ def mock_read_data_with_filters(**kwargs):
         return {'status': 'success', 'data': MOCK_CAR_DATA}
     elif 'name' in kwargs and kwargs['name'] == 'city, city_license_plates':
         return {'status': 'success', 'data': MOCK_CITY_DATA}
+    elif 'name' in kwargs and kwargs['name'] == ', '.join(AGGREGATE_COLUMNS):
+        return {'status': 'success', 'data': MOCK_CAR_DATA}
     return {'status': 'success', 'data': []}
 
 
+def mock_iter_data_with_filters(**kwargs):
+    # 模拟 iter_data_with_filters：按每批 2 行产出 read_data_with_filters 的结果
+    rows = mock_read_data_with_filters(**kwargs)['data']
+    for start in range(0, len(rows), 2):
+        yield rows[start:start + 2]
+
+
 @pytest.fixture(autouse=True)
 def mock_dependencies():
-    # 模拟 func.py 中的 read_data_with_filters 函数
-    with patch('app.read_data_with_filters', new=mock_read_data_with_filters):
+    # 模拟 func.py 中的 read_data_with_filters / iter_data_with_filters 函数
+    with patch('app.read_data_with_filters', new=mock_read_data_with_filters), \
+            patch('app.iter_data_with_filters', new=mock_iter_data_with_filters):
+        # 每个用例从空缓存开始
+        car_data_cache.invalidate()
+        city_data_cache.invalidate()
+        running_aggregates.invalidate()
+        response_cache.clear()
         yield
 
 
@@ -144,6 +165,41 @@ def test_get_model_details(client):
     assert len(data['history_prices']) == 2
 
 
+def test_snapshot_indexes_keep_scan_semantics():
+    """测试快照索引与逐条扫描结果一致：重复车型保留，详情取第一条"""
+    from app import convert_car_record
+    import engine
+    rows = MOCK_CAR_DATA + [dict(MOCK_CAR_DATA[0], popularity=1)]
+    snapshot = engine.CarSnapshot([convert_car_record(row) for row in rows])
+    assert snapshot.brands == ('Brand1', 'Brand2', 'Brand3')
+    assert [m['id'] for m in snapshot.models_by_brand['Brand1']] == [
+        'Brand1_Model1', 'Brand1_Model2', 'Brand1_Model1']
+    assert snapshot.model_index['Brand1_Model1'] is snapshot.cars[0]
+    assert 'Brand9' not in snapshot.models_by_brand
+
+
+def test_sorted_indexes_range_queries():
+    """测试有序索引的范围筛选与分桶：缺失值被排除，关注度相同时保持行号顺序"""
+    from app import convert_car_record
+    import engine
+    rows = MOCK_CAR_DATA + [dict(MOCK_CAR_DATA[0], car_model='Model7', min_reference_price=None),
+                            dict(MOCK_CAR_DATA[1], car_model='Model8', popularity=75)]
+    columns = engine.CarColumns([convert_car_record(row) for row in rows])
+    index = columns.indexes['min_price']
+    assert len(index) == 5
+    assert index.select(80000, 220000).tolist() == [0, 1, 5]
+    assert engine.select_cars(columns, min_price=80000, max_price=250000).tolist() == [1, 0, 5]
+    assert engine.select_cars(columns, min_price=200000, min_hp=300).tolist() == [3, 2]
+    assert engine.price_distribution(columns, [0, 100000, 300000]) == [(1, 75.0), (2, 82.5), (2, 90.0)]
+
+
+def test_get_brand_models_unknown_brand(client):
+    """测试不存在的品牌返回空车型列表"""
+    response = client.get('/api/v1/brands/Unknown/models')
+    assert response.status_code == 200
+    assert json.loads(response.data) == {'models': []}
+
+
 def test_get_cities(client):
     """测试获取城市列表"""
     response = client.get('/api/v1/cities')
@@ -254,24 +310,34 @@ def test_upload_excel_success(client, tmp_path):
 
     # 使用 openpyxl 引擎（无需指定，pandas 会自动选择）
     df = pd.DataFrame({
-        'car_brand': ['Toyota', 'Honda'],
-        'car_model': ['Camry', 'Accord'],
-        'manufacturer_suggested_price': [250000, 220000]
+        'brand': ['Toyota', 'Honda'],
+        'model': ['Camry', 'Accord'],
+        'guide_price': [250000, 220000]
     })
     df.to_excel(test_file, index=False)  # 移除 engine='xlwt'
 
-    # 模拟上传（使用 .xlsx 扩展名）
-    with open(test_file, 'rb') as f:
-        response = client.post(
-            '/api/v1/upload/excel',
-            data={'excelFile': (f, 'test.xlsx')},  # 改为 .xlsx
-            content_type='multipart/form-data'
-        )
+    # 模拟上传（使用 .xlsx 扩展名），上传接口立即返回任务ID
+    with patch('app.insert_data', return_value={'status': 'success', 'message': 'ok', 'inserted_rows': 2}):
+        with open(test_file, 'rb') as f:
+            response = client.post(
+                '/api/v1/upload/excel',
+                data={'excelFile': (f, 'test.xlsx')},  # 改为 .xlsx
+                content_type='multipart/form-data'
+            )
 
+        assert response.status_code == 202
+        data = json.loads(response.data)
+        assert data['status'] == 'accepted'
+        assert data['status_url'] == f"/api/v1/jobs/{data['job_id']}"
+        assert job_manager.get(data['job_id']).wait(timeout=10)
+
+    response = client.get(data['status_url'])
     assert response.status_code == 200
-    data = json.loads(response.data)
-    assert data['status'] == 'success'
-    assert data['message'] == 'Processed 2 rows'
+    job = json.loads(response.data)
+    assert job['status'] == 'succeeded'
+    assert job['progress']['rows_parsed'] == 2
+    assert job['progress']['rows_inserted'] == 2
+    assert job['result']['message'] == '成功插入2 行数到表'
 
 
 def test_upload_excel_no_file(client):
@@ -323,6 +389,26 @@ def test_upload_excel_invalid_content(client, tmp_path):
     assert 'Invalid Excel file content' in data['error']
 
 
+def test_upload_xls_checks_only_file_header(client, tmp_path):
+    """测试 .xls 上传时请求内只校验文件头，不整表解析"""
+    invalid = tmp_path / "invalid.xls"
+    invalid.write_text("This is not a valid Excel file")
+    with open(invalid, 'rb') as f:
+        response = client.post('/api/v1/upload/excel', data={'excelFile': (f, 'invalid.xls')},
+                               content_type='multipart/form-data')
+    assert response.status_code == 400
+
+    workbook = tmp_path / "cars.xls"
+    workbook.write_bytes(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\0' * 512)
+    with patch('ingest.pd.read_excel', side_effect=AssertionError('parsed in request')), \
+            patch('app.job_manager.submit', return_value=MagicMock(id='job-1')) as mock_submit:
+        with open(workbook, 'rb') as f:
+            response = client.post('/api/v1/upload/excel', data={'excelFile': (f, 'cars.xls')},
+                                   content_type='multipart/form-data')
+    assert response.status_code == 202
+    os.remove(mock_submit.call_args.args[2])
+
+
 def test_upload_excel_empty_file(client, tmp_path):
     """测试空Excel文件上传"""
     # 使用 .xlsx 格式
@@ -343,4 +429,876 @@ def test_upload_excel_empty_file(client, tmp_path):
     assert response.status_code == 400
     data = json.loads(response.data)
     assert 'error' in data
-    assert 'Excel file is empty' in data['error']
\ No newline at end of file
+    assert 'Excel file is empty' in data['error']
+
+def test_car_data_cache_hit(client):
+    """测试多次请求共享同一份车型数据快照"""
+    before = car_data_cache.stats()
+    with patch('app.iter_data_with_filters', side_effect=mock_iter_data_with_filters) as mock_read:
+        client.get('/api/v1/brands')
+        client.get('/api/v1/market/price_distribution')
+        client.get('/api/v1/models/Brand1_Model1')
+    assert mock_read.call_count == 1
+    stats = car_data_cache.stats()
+    assert stats['misses'] - before['misses'] == 1
+    assert stats['hits'] - before['hits'] == 2
+
+
+def test_car_data_cache_invalidated_on_insert(client):
+    """测试写入数据后快照在下次读取时刷新"""
+    with patch('app.iter_data_with_filters', side_effect=mock_iter_data_with_filters) as mock_read:
+        client.get('/api/v1/brands')
+        with patch('func.insert_into_hive_table', return_value={'status': 'success', 'message': 'ok'}):
+            from func import insert_data
+            insert_data(MOCK_CAR_DATA[:1])
+        client.get('/api/v1/brands')
+    assert mock_read.call_count == 2
+
+
+def test_system_stats(client):
+    """测试运行状态接口"""
+    client.get('/api/v1/brands')
+    response = client.get('/api/v1/system/stats')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['snapshot_cache']['car_data']['version'] == data['data_version']
+    assert 'checkouts' in data['hive_pool']
+
+
+def test_recommendations_sorted_by_attention(client):
+    """测试推荐结果按关注度降序排列"""
+    response = client.get('/api/v1/recommendations?min_hp=200')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    attention = [rec['attention'] for rec in data['recommendations']]
+    assert attention == [95, 90, 85]
+    assert data['recommendations'][0]['id'] == 'Brand3_Model1'
+
+
+def test_market_overview_top_car(client):
+    """测试市场概览中的关注度最高车型"""
+    response = client.get('/api/v1/market/overview')
+    data = json.loads(response.data)
+    assert data['top_car'] == 'Brand3 Model1 (关注度: 95)'
+    assert data['avg_attention'] == (75 + 90 + 85 + 95) / 4
+
+
+def test_aggregate_market_overview_sql():
+    """测试市场概览下推的 SQL，关注度最高车型按 SELECT 别名排序"""
+    import func
+    from utils import _build_aggregate_sql
+    statements = []
+
+    def fake_aggregate(table_name, config, select, **query):
+        statements.append(_build_aggregate_sql(table_name, config, select, **query)[0])
+        if query.get('group_by') or query.get('limit'):
+            return {'status': 'success', 'data': []}
+        return {'status': 'success', 'data': [{'count': 1, 'attention': 95, 'registrations': 10}]}
+
+    with patch('func.aggregate_from_hive_table', side_effect=fake_aggregate):
+        func.aggregate_market_overview()
+    assert statements[-1] == (
+        "SELECT car_brand AS brand, car_model AS model, popularity AS attention "
+        "FROM default.car_data WHERE popularity IS NOT NULL ORDER BY attention DESC LIMIT 1")
+
+
+def test_market_endpoints_push_down_to_hive(client):
+    """测试 hive 模式下市场接口只读取聚合结果，不拉取整表"""
+    app.config['ANALYTICS_SOURCE'] = 'hive'
+    overview = {
+        'total_registrations': 265,
+        'avg_attention': 86.25,
+        'brand_counts': {'Brand1': 2, 'Brand2': 1, 'Brand3': 1},
+        'top_car': {'brand': 'Brand3', 'model': 'Model1', 'attention': 95},
+    }
+    with patch('app.read_data_with_filters', side_effect=AssertionError('full scan')), \
+            patch('app.aggregate_market_overview', return_value=overview), \
+            patch('app.aggregate_year_trends', return_value=[
+                {'date': '2020', 'registrations': 75, 'attention': 75, 'avg_price': 85000.0}]), \
+            patch('app.aggregate_price_buckets', return_value=[(1, 75.0), (0, 0), (1, 90.0), (1, 85.0), (1, 95.0)]), \
+            patch('app.aggregate_type_registrations', return_value={'Sedan': 75, '新能源': 25}):
+        data = json.loads(client.get('/api/v1/market/overview').data)
+        assert data['top_car'] == 'Brand3 Model1 (关注度: 95)'
+        assert data['total_registrations'] == 265
+
+        data = json.loads(client.get('/api/v1/market/trends?metric=avg_price').data)
+        assert data['data'] == [{'date': '2020', 'value': 85000.0}]
+
+        data = json.loads(client.get('/api/v1/market/price_distribution').data)
+        assert [item['count'] for item in data['distribution']] == [1, 0, 1, 1, 1]
+
+        data = json.loads(client.get('/api/v1/consumer_insights/preferences').data)
+        assert {item['type']: item['preference'] for item in data} == {'Sedan': 0.75, '电动汽车': 0.25}
+
+
+def test_city_endpoints_push_down_to_hive(client):
+    """测试 hive 模式下城市列表和排名在 Hive 端聚合，不扫描 city_license_plates 明细"""
+    app.config['ANALYTICS_SOURCE'] = 'hive'
+    with patch('app.iter_data_with_filters', side_effect=AssertionError('full scan')), \
+            patch('app.aggregate_city_registrations', return_value={'CityB': 85, 'CityA': 90}):
+        data = json.loads(client.get('/api/v1/cities/rankings').data)
+        assert data['rankings'] == [{'city': 'CityA', 'registrations': 90}, {'city': 'CityB', 'registrations': 85}]
+        data = json.loads(client.get('/api/v1/cities').data)
+        assert data['cities'] == [{'id': 0, 'name': 'CityB'}, {'id': 1, 'name': 'CityA'}]
+
+
+def test_recommendations_push_filters_to_hive(client):
+    """测试 hive 模式下推荐筛选条件下推到 Hive"""
+    app.config['ANALYTICS_SOURCE'] = 'hive'
+    captured = {}
+
+    def mock_filtered_read(**kwargs):
+        captured.update(kwargs)
+        # Hive 按 ORDER BY 返回已排序的结果
+        return {'status': 'success', 'data': MOCK_CAR_DATA[1::-1]}
+
+    with patch('app.read_data_with_filters', new=mock_filtered_read), \
+            patch('app.count_data_with_filters', side_effect=AssertionError('count')):
+        response = client.get('/api/v1/recommendations?brand=Brand1&min_price=80000&max_price=250000&doors=5')
+    assert response.status_code == 200
+    assert captured['filters'] == {
+        'car_brand': 'Brand1',
+        'min_reference_price': {'>=': 80000.0, '<=': 250000.0},
+        'num_doors': 5,
+    }
+    assert '*' not in captured['name']
+    assert captured['order_by'].startswith('popularity DESC')
+    assert (captured['limit'], captured['offset']) == (20, 0)
+    data = json.loads(response.data)
+    assert [rec['model'] for rec in data['recommendations']] == ['Model2', 'Model1']
+    assert data['total'] == 2
+    assert data['next_cursor'] is None
+
+
+def test_recommendations_hive_pagination_counts_total(client):
+    """测试 hive 模式下分页参数下推到 Hive，并单独查询总数"""
+    app.config['ANALYTICS_SOURCE'] = 'hive'
+    captured = {}
+
+    def mock_filtered_read(**kwargs):
+        captured.update(kwargs)
+        return {'status': 'success', 'data': MOCK_CAR_DATA[3:4]}
+
+    with patch('app.read_data_with_filters', new=mock_filtered_read), \
+            patch('app.count_data_with_filters', return_value=4) as mock_count:
+        response = client.get('/api/v1/recommendations?limit=1&offset=1&min_hp=200')
+    data = json.loads(response.data)
+    assert (captured['limit'], captured['offset']) == (1, 1)
+    mock_count.assert_called_once_with({'engine_horsepower': {'>=': 200}})
+    assert data['total'] == 4
+    assert data['offset'] == 1
+    assert data['next_cursor'] is not None
+
+
+def test_recommendations_pagination(client):
+    """测试推荐分页：limit/offset 与游标翻页结果与完整排序一致"""
+    app.config['ANALYTICS_SOURCE'] = 'snapshot'
+    full = json.loads(client.get('/api/v1/recommendations').data)
+    assert full['total'] == 4
+    assert full['next_cursor'] is None
+
+    ids = []
+    url = '/api/v1/recommendations?limit=3'
+    while url:
+        page = json.loads(client.get(url).data)
+        assert page['total'] == 4
+        ids.extend(rec['id'] for rec in page['recommendations'])
+        url = page['next_cursor'] and f"/api/v1/recommendations?limit=3&cursor={page['next_cursor']}"
+    assert ids == [rec['id'] for rec in full['recommendations']]
+
+    page = json.loads(client.get('/api/v1/recommendations?limit=2&offset=1').data)
+    assert page['recommendations'] == full['recommendations'][1:3]
+
+
+def test_recommendations_invalid_pagination(client):
+    """测试非法的分页参数"""
+    assert client.get('/api/v1/recommendations?limit=0').status_code == 400
+    assert client.get('/api/v1/recommendations?limit=100000').status_code == 400
+    assert client.get('/api/v1/recommendations?offset=-1').status_code == 400
+    response = client.get('/api/v1/recommendations?cursor=not-a-cursor')
+    assert response.status_code == 400
+    assert json.loads(response.data)['error'] == 'Invalid cursor'
+
+
+def test_engine_top_cars_matches_full_sort():
+    """测试 top_cars 的分页结果与 select_cars 完整排序后的切片一致"""
+    import engine
+    cars = [{'brand': 'B%d' % (i % 3), 'attention': [None, 5, 5, 7, 1][i % 5], 'min_price': i * 1000}
+            for i in range(40)]
+    columns = engine.CarColumns(cars)
+    full = engine.select_cars(columns, brand='B1')
+    for limit, offset in [(1, 0), (3, 2), (5, 10), (50, 0)]:
+        rows, total = engine.top_cars(columns, limit, offset, brand='B1')
+        assert total == len(full)
+        assert rows.tolist() == full[offset:offset + limit].tolist()
+
+
+def _capture_inserts(car_data_result):
+    """返回假的 insert_into_hive_table 及其记录的 {表名: 插入的行}"""
+    inserted = {}
+
+    def fake_insert(table_name, data, **kwargs):
+        inserted.setdefault(table_name, []).extend(data)
+        if table_name == 'car_data':
+            return car_data_result
+        return {'status': 'success', 'message': 'ok'}
+    return fake_insert, inserted
+
+
+@patch.dict('config.SUMMARY_TABLE_CONFIG', {'enabled': True})
+def test_summary_tables_updated_on_insert(client):
+    """测试写入成功后把增量追加到汇总表"""
+    from func import insert_data
+    fake_insert, inserted = _capture_inserts({'status': 'success', 'message': 'ok'})
+    with patch('func.insert_into_hive_table', side_effect=fake_insert):
+        insert_data(MOCK_CAR_DATA)
+
+    cities = {row['city']: row['registrations'] for row in inserted['car_summary_city']}
+    assert cities == {'CityA': 90, 'CityB': 85, 'CityC': 60, 'CityD': 30}
+    years = {row['manufacture_year']: row for row in inserted['car_summary_year']}
+    assert years[2021]['row_count'] == 1
+    assert years[2021]['attention'] == 90
+    assert years[2021]['price_sum'] == Decimal('250000.0')
+    assert years[2021]['registrations'] == 70
+    types = {row['car_type']: row['registrations'] for row in inserted['car_summary_type']}
+    assert types == {'Sedan': 75, 'SUV': 70, 'Sports': 80, 'Luxury': 40}
+
+
+@patch.dict('config.SUMMARY_TABLE_CONFIG', {'enabled': True})
+def test_summary_tables_skip_failed_batches(client):
+    """测试部分批次失败时只累加成功批次的增量"""
+    from func import insert_data
+    fake_insert, inserted = _capture_inserts({
+        'status': 'partial',
+        'message': '部分批次失败',
+        'batches': [
+            {'batch': 0, 'offset': 0, 'rows': 2, 'status': 'success', 'message': 'ok'},
+            {'batch': 1, 'offset': 2, 'rows': 2, 'status': 'error', 'message': 'boom'},
+        ],
+    })
+    with patch('func.insert_into_hive_table', side_effect=fake_insert):
+        insert_data(MOCK_CAR_DATA)
+
+    cities = {row['city']: row['registrations'] for row in inserted['car_summary_city']}
+    assert cities == {'CityA': 80, 'CityB': 25, 'CityC': 40}
+    assert sorted(row['manufacture_year'] for row in inserted['car_summary_year']) == [2020, 2021]
+
+
+def test_summary_rebuild_swaps_in_staging_tables(client):
+    """测试重建汇总表时只重建暂存表，正式表不被删除，最后用 INSERT OVERWRITE 整体替换并删除暂存表"""
+    import func
+    calls = []
+
+    def fake_create(table_name, schema, config, replace=True, **kwargs):
+        calls.append(('create', table_name, replace))
+        return {'status': 'success', 'message': 'ok'}
+
+    def fake_aggregate(target, source, config, select=None, overwrite=False, **query):
+        calls.append(('insert', target, source, overwrite))
+        return {'status': 'success', 'message': 'ok'}
+
+    def fake_drop(table_name, config):
+        calls.append(('drop', table_name))
+        return {'status': 'success', 'message': 'ok'}
+
+    with patch('func.create_hive_table', side_effect=fake_create), \
+            patch('func.insert_from_hive_aggregate', side_effect=fake_aggregate), \
+            patch('func.drop_hive_table', side_effect=fake_drop):
+        assert func.build_summary_tables()['status'] == 'success'
+
+    live_creates = [call for call in calls if call[0] == 'create' and not call[1].endswith('__staging')]
+    assert live_creates and all(replace is False for _, _, replace in live_creates)
+    assert ('insert', 'car_summary_city', 'car_summary_city__staging', True) in calls
+    assert calls.index(('drop', 'car_summary_city__staging')) > \
+        calls.index(('insert', 'car_summary_city', 'car_summary_city__staging', True))
+
+
+def test_summary_rebuild_drops_staging_table_on_failure(client):
+    """测试重建汇总表失败时同样删除暂存表，且不覆盖正式表"""
+    import func
+    dropped = []
+
+    def fake_aggregate(target, source, config, select=None, overwrite=False, **query):
+        return {'status': 'error', 'message': 'boom'}
+
+    def fake_drop(table_name, config):
+        dropped.append(table_name)
+        return {'status': 'success', 'message': 'ok'}
+
+    with patch('func.create_hive_table', return_value={'status': 'success', 'message': 'ok'}), \
+            patch('func.insert_from_hive_aggregate', side_effect=fake_aggregate) as mock_aggregate, \
+            patch('func.drop_hive_table', side_effect=fake_drop):
+        assert func.build_summary_tables()['status'] == 'error'
+
+    assert sorted(dropped) == sorted(name + '__staging' for name in func.summary_table_schemas)
+    assert all(call.args[1] == 'car_data' for call in mock_aggregate.call_args_list)
+
+
+def test_summary_compaction_is_a_single_statement(client):
+    """测试合并汇总表时每张表只执行一条读取自身的 INSERT OVERWRITE，不使用暂存表"""
+    import func
+    with patch('func.insert_from_hive_aggregate',
+               return_value={'status': 'success', 'message': 'ok'}) as mock_aggregate, \
+            patch('func.create_hive_table', side_effect=AssertionError('staging table')):
+        assert func.compact_summary_tables()['status'] == 'success'
+
+    assert len(mock_aggregate.call_args_list) == len(func.summary_table_schemas)
+    for call in mock_aggregate.call_args_list:
+        target, source, _, select = call.args
+        assert target == source and call.kwargs['overwrite'] is True
+        key = next(iter(select))
+        assert call.kwargs['group_by'] == [key]
+        assert all(expr == f'SUM({col})' for col, expr in select.items() if col != key)
+
+
+@patch.dict('config.SUMMARY_TABLE_CONFIG', {'enabled': True})
+def test_summary_maintenance_is_serialized(client):
+    """测试并发写入时汇总表的追加与合并串行执行"""
+    import threading
+    import time
+    import func
+    active, overlaps = [], []
+
+    def slow_insert(table_name, data, **kwargs):
+        if table_name != 'car_data':
+            active.append(table_name)
+            if len(active) > 1:
+                overlaps.append(list(active))
+            time.sleep(0.01)
+            active.remove(table_name)
+        return {'status': 'success', 'message': 'ok'}
+
+    with patch('func.insert_into_hive_table', side_effect=slow_insert):
+        threads = [threading.Thread(target=func.insert_data, args=(MOCK_CAR_DATA,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert overlaps == []
+
+
+def test_summary_tables_disabled_by_default(client):
+    """测试默认的 hive 来源不读取汇总表，写入时也不维护汇总表"""
+    from config import SUMMARY_TABLE_CONFIG
+    from func import insert_data
+    assert SUMMARY_TABLE_CONFIG['enabled'] is False
+    fake_insert, inserted = _capture_inserts({'status': 'success', 'message': 'ok'})
+    with patch('func.insert_into_hive_table', side_effect=fake_insert):
+        insert_data(MOCK_CAR_DATA)
+    assert list(inserted) == ['car_data']
+
+
+@patch.dict('config.BULK_LOAD_CONFIG', {'enabled': False})
+def test_insert_data_uses_table_partition_columns(client):
+    """测试 insert_data 按 car_data 实际的分区列写入，而不是建表配置中的默认值"""
+    from func import insert_data
+    with patch('func.get_partition_columns', return_value=[('manufacture_year', 'int')]) as mock_columns, \
+            patch('func.insert_into_hive_table',
+                  return_value={'status': 'error', 'message': 'boom'}) as mock_insert:
+        insert_data(MOCK_CAR_DATA[:1])
+    mock_columns.assert_called_once_with('car_data', HIVE_CONFIG)
+    assert mock_insert.call_args.kwargs['partition_by'] == ['manufacture_year']
+
+    with patch('func.get_partition_columns', side_effect=RuntimeError('DESCRIBE failed')), \
+            patch('func.insert_into_hive_table', side_effect=AssertionError('insert')):
+        assert insert_data(MOCK_CAR_DATA[:1])['status'] == 'error'
+
+
+def test_summary_source_reads_summary_tables(client):
+    """测试 summary 模式下城市、趋势和偏好接口读取汇总表"""
+    app.config['ANALYTICS_SOURCE'] = 'summary'
+    with patch('app.iter_data_with_filters', side_effect=AssertionError('full scan')), \
+            patch('app.aggregate_year_trends', side_effect=AssertionError('raw aggregate')), \
+            patch('app.aggregate_type_registrations', side_effect=AssertionError('raw aggregate')), \
+            patch('app.summary_city_registrations', return_value={'CityA': 90, 'CityB': 85}), \
+            patch('app.summary_year_trends', return_value=[
+                {'date': '2020', 'registrations': 75, 'attention': 75, 'avg_price': 85000.0}]), \
+            patch('app.summary_type_registrations', return_value={'Sedan': 75, 'SUV': 25}):
+        data = json.loads(client.get('/api/v1/cities/rankings').data)
+        assert data['rankings'] == [{'city': 'CityA', 'registrations': 90}, {'city': 'CityB', 'registrations': 85}]
+
+        data = json.loads(client.get('/api/v1/market/trends?metric=registrations').data)
+        assert data['data'] == [{'date': '2020', 'value': 75}]
+
+        data = json.loads(client.get('/api/v1/consumer_insights/preferences').data)
+        assert {item['type']: item['preference'] for item in data} == {'Sedan': 0.75, 'SUV': 0.25}
+
+
+def test_memory_source_matches_snapshot(client):
+    """测试 memory 模式下各统计接口与快照计算结果一致"""
+    urls = ['/api/v1/market/overview', '/api/v1/market/trends?metric=registrations',
+            '/api/v1/market/trends?metric=avg_price', '/api/v1/cities/rankings',
+            '/api/v1/consumer_insights/preferences']
+    expected = [json.loads(client.get(url).data) for url in urls]
+    app.config['ANALYTICS_SOURCE'] = 'memory'
+    assert [json.loads(client.get(url).data) for url in urls] == expected
+    assert running_aggregates.stats()['rebuilds'] >= 1
+
+
+def test_running_aggregates_apply_inserts(client):
+    """测试写入成功后增量更新进程内聚合，不重新扫描 car_data"""
+    from func import insert_data
+    app.config['ANALYTICS_SOURCE'] = 'memory'
+    before = json.loads(client.get('/api/v1/market/overview').data)
+    new_car = dict(MOCK_CAR_DATA[0], car_model='Model9', popularity=99, city_license_plates={'CityE': 5})
+    with patch('app.iter_data_with_filters', side_effect=AssertionError('full scan')), \
+            patch('func.insert_into_hive_table', return_value={'status': 'success', 'message': 'ok'}):
+        insert_data([new_car])
+        data = json.loads(client.get('/api/v1/market/overview').data)
+        rankings = json.loads(client.get('/api/v1/cities/rankings').data)['rankings']
+    assert data['total_registrations'] == before['total_registrations'] + 5
+    assert data['top_car'] == 'Brand1 Model9 (关注度: 99)'
+    assert {'city': 'CityE', 'registrations': 5} in rankings
+
+
+def test_rebuild_aggregates_endpoint(client):
+    """测试按需全量重建进程内聚合"""
+    response = client.post('/api/v1/system/aggregates/rebuild')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['built'] is True
+    assert data['rows'] == len(MOCK_CAR_DATA)
+
+
+def test_running_aggregates_rebuild_does_not_double_count():
+    """测试重建扫描期间有写入时丢弃扫描结果重新扫描，扫描期间读取不被阻塞"""
+    from aggregates import RunningAggregates
+    aggregates = RunningAggregates()
+    aggregates.rebuild(lambda: [MOCK_CAR_DATA[:1]])
+    new_car = dict(MOCK_CAR_DATA[1], city_license_plates={'CityE': 5})
+    table = [MOCK_CAR_DATA[:1]]
+    scans = []
+
+    def load_batches():
+        scans.append(len(scans))
+        # 读取不需要等待扫描结束
+        assert aggregates.city_totals()
+        yield from list(table)
+        if len(scans) == 1:
+            # 第一次扫描期间写入一批：扫描可能已包含它，也可能没有
+            table.append([new_car])
+            aggregates.apply([new_car])
+
+    aggregates.rebuild(load_batches)
+    assert len(scans) == 2
+    assert aggregates.city_totals()['CityE'] == 5
+    assert aggregates.stats()['rows'] == 2
+    assert aggregates.stats()['rebuild_conflicts'] == 1
+
+
+def test_upload_excel_streams_chunks(client, tmp_path):
+    """测试Excel按块流式解析、转换字段名并逐块插入"""
+    test_file = tmp_path / "cars.xlsx"
+    pd.DataFrame({
+        'brand': ['Toyota', 'Honda', None],
+        'model': ['Camry', 'Accord', None],
+        'min_price': [180000, 160000, None],
+        'city': ['北京', '上海', None],
+        'remark': [None, None, 'not a car'],
+    }).to_excel(test_file, index=False)
+
+    inserted = []
+
+    def mock_insert(records):
+        inserted.append(records)
+        return {'status': 'success', 'message': 'ok', 'inserted_rows': len(records)}
+
+    with patch('app.insert_data', side_effect=mock_insert), \
+            patch.dict('app.UPLOAD_CONFIG', {'chunk_size': 1}):
+        with open(test_file, 'rb') as f:
+            response = client.post(
+                '/api/v1/upload/excel',
+                data={'excelFile': (f, 'cars.xlsx')},
+                content_type='multipart/form-data'
+            )
+
+        assert response.status_code == 202
+        job = job_manager.get(json.loads(response.data)['job_id'])
+        assert job.wait(timeout=10)
+
+    data = job.to_dict()['result']
+    assert data['rows_parsed'] == 3
+    assert data['rows_inserted'] == 2
+    assert data['rows_rejected'] == 1
+    assert inserted == [
+        [{'car_brand': 'Toyota', 'car_model': 'Camry', 'min_reference_price': 180000, 'city': '北京'}],
+        [{'car_brand': 'Honda', 'car_model': 'Accord', 'min_reference_price': 160000, 'city': '上海'}],
+    ]
+
+
+def test_upload_excel_coerces_types(client, tmp_path):
+    """测试上传数据按表结构转换类型，转换失败的行进入拒绝报告而不影响其他行"""
+    test_file = tmp_path / "cars.xlsx"
+    pd.DataFrame({
+        'brand': ['Toyota', 'Honda', 'BYD'],
+        'min_price': ['180000.456', 'cheap', 99000],
+        'doors': [4, 4, 4.5],
+        'city_license_plates': ['北京:10,上海:20', '{"广州": 3}', None],
+    }).to_excel(test_file, index=False)
+
+    inserted = []
+
+    def mock_insert(records):
+        inserted.extend(records)
+        return {'status': 'success', 'message': 'ok', 'inserted_rows': len(records)}
+
+    with patch('app.insert_data', side_effect=mock_insert):
+        with open(test_file, 'rb') as f:
+            response = client.post(
+                '/api/v1/upload/excel',
+                data={'excelFile': (f, 'cars.xlsx')},
+                content_type='multipart/form-data'
+            )
+        job = job_manager.get(json.loads(response.data)['job_id'])
+        assert job.wait(timeout=10)
+
+    assert inserted == [{
+        'car_brand': 'Toyota',
+        'num_doors': 4,
+        'min_reference_price': 180000.46,
+        'city_license_plates': {'北京': 10, '上海': 20},
+    }]
+    result = job.to_dict()['result']
+    assert result['rows_rejected'] == 2
+    assert [(r['row'], r['column']) for r in result['rejections']] == [
+        (3, 'min_reference_price'), (4, 'num_doors')]
+
+
+def test_prepare_upload_frame_rejects_out_of_range_ints():
+    """测试 INT 列和 MAP<STRING, INT> 的值超出 32 位整数范围时整行拒绝"""
+    from ingest import prepare_upload_frame
+    df = pd.DataFrame({
+        'brand': ['A', 'B', 'C', 'D'],
+        'doors': [4, 10 ** 12, -2 ** 31, 4],
+        'city_license_plates': ['北京:10', None, None, '北京:99999999999'],
+    })
+    records, rejections = prepare_upload_frame(df)
+    assert [record['car_brand'] for record in records] == ['A', 'C']
+    assert records[1]['num_doors'] == -2 ** 31
+    assert [(r['row'], r['column']) for r in rejections] == [(3, 'num_doors'), (5, 'city_license_plates')]
+    assert all('out of range' in r['reason'] for r in rejections)
+
+
+def test_upload_job_reports_failure(client, tmp_path):
+    """测试后台上传任务插入异常时状态为failed并记录错误"""
+    test_file = tmp_path / "cars.xlsx"
+    pd.DataFrame({'brand': ['Toyota'], 'model': ['Camry']}).to_excel(test_file, index=False)
+
+    with patch('app.insert_data', side_effect=RuntimeError('hive down')):
+        with open(test_file, 'rb') as f:
+            response = client.post(
+                '/api/v1/upload/excel',
+                data={'excelFile': (f, 'cars.xlsx')},
+                content_type='multipart/form-data'
+            )
+        job_id = json.loads(response.data)['job_id']
+        assert job_manager.get(job_id).wait(timeout=10)
+
+    job = json.loads(client.get(f'/api/v1/jobs/{job_id}').data)
+    assert job['status'] == 'failed'
+    assert job['errors'] == ['hive down']
+
+
+def test_upload_job_fails_when_no_rows_inserted(client, tmp_path):
+    """测试所有块都插入失败时任务状态为failed，结果状态为error"""
+    test_file = tmp_path / "cars.xlsx"
+    pd.DataFrame({'brand': ['Toyota'], 'model': ['Camry']}).to_excel(test_file, index=False)
+
+    with patch('app.insert_data', return_value={'status': 'error', 'message': 'hive down'}):
+        with open(test_file, 'rb') as f:
+            response = client.post(
+                '/api/v1/upload/excel',
+                data={'excelFile': (f, 'cars.xlsx')},
+                content_type='multipart/form-data'
+            )
+        job_id = json.loads(response.data)['job_id']
+        assert job_manager.get(job_id).wait(timeout=10)
+
+    job = json.loads(client.get(f'/api/v1/jobs/{job_id}').data)
+    assert job['status'] == 'failed'
+    assert job['result']['status'] == 'error'
+    assert job['result']['rows_inserted'] == 0
+    assert job['errors'] == ['hive down']
+
+
+def test_job_manager_rejects_when_queue_full():
+    """测试排队任务达到上限时拒绝新任务"""
+    import threading
+    from jobs import JobManager, JobQueueFullError
+    manager = JobManager(max_workers=1, max_jobs=10, max_queued=2)
+    release = threading.Event()
+    started = threading.Event()
+    running = manager.submit('block', lambda job: started.set() or release.wait(10))
+    assert started.wait(timeout=10)
+    queued = [manager.submit('noop', lambda job: None) for _ in range(2)]
+    with pytest.raises(JobQueueFullError):
+        manager.submit('noop', lambda job: None)
+    release.set()
+    for job in [running] + queued:
+        assert job.wait(timeout=10)
+    assert manager.submit('noop', lambda job: None).wait(timeout=10)
+
+
+def test_upload_rejected_when_job_queue_full(client, tmp_path):
+    """测试任务队列已满时上传返回503并删除已保存的文件"""
+    from jobs import JobQueueFullError
+    test_file = tmp_path / "cars.xlsx"
+    pd.DataFrame({'brand': ['Toyota'], 'model': ['Camry']}).to_excel(test_file, index=False)
+    before = set(os.listdir(app.config['UPLOAD_FOLDER']))
+    with patch.object(job_manager, 'submit', side_effect=JobQueueFullError('full')):
+        with open(test_file, 'rb') as f:
+            response = client.post(
+                '/api/v1/upload/excel',
+                data={'excelFile': (f, 'cars.xlsx')},
+                content_type='multipart/form-data'
+            )
+    assert response.status_code == 503
+    assert set(os.listdir(app.config['UPLOAD_FOLDER'])) == before
+
+
+def test_get_job_not_found(client):
+    """测试查询不存在的任务"""
+    response = client.get('/api/v1/jobs/unknown')
+    assert response.status_code == 404
+
+
+def test_rand_data_generate_invariants():
+    """测试随机数据生成：车型属于品牌、参考价不高于建议价、相同种子结果一致"""
+    from func import rand_data_generate, iter_rand_data, CAR_MODELS, CITIES
+    data = rand_data_generate(2000, seed=7)
+    assert len(data) == 2000
+    for record in data:
+        assert record['car_model'] in CAR_MODELS[record['car_brand']]
+        assert record['min_reference_price'] <= record['manufacturer_suggested_price']
+        assert 3 <= len(record['historical_price']) <= 7
+        assert 2 <= len(record['city_license_plates']) <= 5
+        assert set(record['city_license_plates']) <= set(CITIES)
+    assert rand_data_generate(50, seed=7) == rand_data_generate(50, seed=7)
+    assert rand_data_generate(50, seed=7) != rand_data_generate(50, seed=8)
+    assert [len(batch) for batch in iter_rand_data(25, batch_size=10, seed=1)] == [10, 10, 5]
+
+
+def test_generate_random_runs_chunked_job(client):
+    """测试随机数据生成按块并发插入并报告进度"""
+    inserted = []
+
+    def mock_insert(records, max_workers=None):
+        # 块之间已经并发，每块内部不再并发插入
+        assert max_workers == 1
+        inserted.append(len(records))
+        return {'status': 'success', 'message': 'ok', 'inserted_rows': len(records)}
+
+    with patch('app.insert_data', side_effect=mock_insert), \
+            patch.dict('app.GENERATE_CONFIG', {'max_chunk_size': 10}):
+        # chunk_size 超过上限时按上限分块
+        response = client.post('/api/v1/generate/random', json={'num_records': 25, 'chunk_size': 10 ** 9, 'seed': 1})
+        assert response.status_code == 202
+        job_id = json.loads(response.data)['job_id']
+        assert job_manager.get(job_id).wait(timeout=10)
+
+    job = json.loads(client.get(f'/api/v1/jobs/{job_id}').data)
+    assert job['status'] == 'succeeded'
+    assert sorted(inserted) == [5, 10, 10]
+    assert job['progress']['rows_inserted'] == 25
+    assert job['progress']['chunks'] == 3
+    assert job['result']['rows_generated'] == 25
+
+
+def test_generate_random_validation(client):
+    """测试随机数据生成的参数校验"""
+    response = client.post('/api/v1/generate/random', json={'num_records': 0})
+    assert response.status_code == 400
+    assert 'must be positive' in json.loads(response.data)['error']
+    response = client.post('/api/v1/generate/random', json={'num_records': 10 ** 12})
+    assert response.status_code == 400
+    assert 'cannot exceed' in json.loads(response.data)['error']
+    response = client.post('/api/v1/generate/random', json={'num_records': 'many'})
+    assert response.status_code == 400
+
+
+def _ndjson(response):
+    """解析 NDJSON 响应体"""
+    return [json.loads(line) for line in response.data.decode().splitlines()]
+
+
+def test_recommendations_ndjson_stream(client):
+    """测试 Accept: application/x-ndjson 或 stream=1 时逐行返回全部推荐结果"""
+    app.config['ANALYTICS_SOURCE'] = 'snapshot'
+    full = json.loads(client.get('/api/v1/recommendations').data)['recommendations']
+
+    response = client.get('/api/v1/recommendations', headers={'Accept': 'application/x-ndjson'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    assert _ndjson(response) == full
+
+    response = client.get('/api/v1/recommendations?stream=1&limit=2&offset=1')
+    assert _ndjson(response) == full[1:3]
+
+
+def test_recommendations_ndjson_stream_hive_mode(client):
+    """测试 hive 模式下流式推荐以 max_limit 为上限一次读完本页再输出，排序下推且不查询总数"""
+    app.config['ANALYTICS_SOURCE'] = 'hive'
+    captured = {}
+
+    def mock_read(**kwargs):
+        captured.update(kwargs)
+        return {'status': 'success', 'data': MOCK_CAR_DATA[1:3]}
+
+    with patch('app.read_data_with_filters', side_effect=mock_read), \
+            patch('app.iter_data_with_filters', side_effect=AssertionError('batched read')), \
+            patch('app.count_data_with_filters', side_effect=AssertionError('count')):
+        response = client.get('/api/v1/recommendations?stream=1&offset=1')
+        rows = _ndjson(response)
+    assert captured['order_by'].startswith('popularity DESC')
+    assert captured['limit'] == RECOMMENDATION_CONFIG['max_limit']
+    assert captured['offset'] == 1
+    assert [row['id'] for row in rows] == ['Brand1_Model2', 'Brand2_Model1']
+
+    limit = RECOMMENDATION_CONFIG['max_limit'] + 1
+    assert client.get(f'/api/v1/recommendations?stream=1&limit={limit}').status_code == 400
+
+
+def test_brand_models_and_cities_ndjson_stream(client):
+    """测试品牌车型、城市列表和城市排名的 NDJSON 流式返回"""
+    app.config['ANALYTICS_SOURCE'] = 'snapshot'
+    headers = {'Accept': 'application/x-ndjson'}
+    models = _ndjson(client.get('/api/v1/brands/Brand1/models', headers=headers))
+    assert models == json.loads(client.get('/api/v1/brands/Brand1/models').data)['models']
+
+    cities = _ndjson(client.get('/api/v1/cities?stream=true'))
+    assert cities == json.loads(client.get('/api/v1/cities').data)['cities']
+
+    rankings = _ndjson(client.get('/api/v1/cities/rankings', headers=headers))
+    assert rankings == json.loads(client.get('/api/v1/cities/rankings').data)['rankings']
+
+
+def test_analytics_etag_and_not_modified(client):
+    """测试分析接口返回 ETag，If-None-Match 命中时返回 304 且不重新计算"""
+    from cache import bump_data_version
+    app.config['ANALYTICS_SOURCE'] = 'snapshot'
+    response = client.get('/api/v1/market/overview')
+    etag = response.headers['ETag']
+    assert etag
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    with patch('app.fetch_market_overview', side_effect=AssertionError('recomputed')):
+        response = client.get('/api/v1/market/overview', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        assert response.data == b''
+
+    # 不同的查询参数使用不同的 ETag
+    trends = client.get('/api/v1/market/trends?metric=registrations').headers['ETag']
+    assert client.get('/api/v1/market/trends?metric=attention').headers['ETag'] != trends
+
+    # 写入数据后版本号变化，旧 ETag 不再命中
+    bump_data_version()
+    response = client.get('/api/v1/market/overview', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_etag_not_set_on_errors(client):
+    """测试错误响应不带 ETag"""
+    response = client.get('/api/v1/models/unknown')
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+
+def test_response_cache_serves_encoded_bytes(client):
+    """测试分析接口的响应字节缓存：命中时不重新计算，按 Accept-Encoding 返回 gzip"""
+    import gzip
+    app.config['ANALYTICS_SOURCE'] = 'snapshot'
+    first = client.get('/api/v1/cities/rankings')
+    assert 'Accept-Encoding' in first.headers['Vary']
+
+    with patch('app.fetch_city_data', side_effect=AssertionError('recomputed')), \
+            patch.object(response_cache, 'min_compress_size', 0):
+        second = client.get('/api/v1/cities/rankings')
+        assert second.data == first.data
+        compressed = client.get('/api/v1/cities/rankings', headers={'Accept-Encoding': 'gzip'})
+        assert compressed.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(compressed.data) == first.data
+    assert response_cache.stats()['hits'] == 2
+
+
+def test_response_cache_invalidated_on_insert(client):
+    """测试写入数据后响应缓存失效"""
+    app.config['ANALYTICS_SOURCE'] = 'memory'
+    before = json.loads(client.get('/api/v1/market/overview').data)
+    new_car = dict(MOCK_CAR_DATA[0], car_model='Model9', city_license_plates={'CityE': 5})
+    with patch('func.insert_into_hive_table', return_value={'status': 'success', 'message': 'ok'}):
+        from func import insert_data
+        insert_data([new_car])
+    after = json.loads(client.get('/api/v1/market/overview').data)
+    assert after['total_registrations'] == before['total_registrations'] + 5
+    assert response_cache.stats()['entries'] == 1
+
+
+def test_response_cache_lru_eviction():
+    """测试响应缓存按条目数和字节数做 LRU 淘汰"""
+    from cache import get_data_version
+    from response_cache import ResponseCache
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    version = get_data_version()
+    cache.put('a', b'aaa', 'application/json', version)
+    cache.put('b', b'bbb', 'application/json', version)
+    assert cache.get('a') is not None
+    cache.put('c', b'ccc', 'application/json', version)
+    assert cache.get('b') is None
+    cache.put('d', b'dddddddd', 'application/json', version)
+    assert cache.get('a') is None and cache.get('c') is None
+    assert cache.stats()['bytes'] == 8
+    # 计算期间数据版本已变化的响应不缓存
+    cache.put('e', b'e', 'application/json', version - 1)
+    assert cache.get('e') is None
+
+
+def test_json_provider_encodes_decimal_and_numpy(client):
+    """测试 JSON 序列化：Decimal 输出为字符串，numpy 数值和数组正常输出，键排序"""
+    import numpy as np
+    with app.app_context():
+        body = app.json.dumps({'b': Decimal('1.50'), 'a': np.int64(3), 'c': np.array([1.5, 2.0])})
+    assert body.replace(' ', '') == '{"a":3,"b":"1.50","c":[1.5,2.0]}'
+
+
+def test_dashboard_matches_individual_panels(client):
+    """测试仪表盘接口与各单独接口的结果一致，且只加载一次车型快照、不扫描城市数据"""
+    app.config['ANALYTICS_SOURCE'] = 'snapshot'
+    with patch('app.iter_data_with_filters', side_effect=mock_iter_data_with_filters) as mock_read:
+        data = json.loads(client.get('/api/v1/dashboard?trend_metric=avg_price').data)
+    assert mock_read.call_count == 1
+    assert city_data_cache.stats()['version'] is None
+
+    assert data['market_overview'] == json.loads(client.get('/api/v1/market/overview').data)
+    assert data['market_trends'] == json.loads(client.get('/api/v1/market/trends?metric=avg_price').data)
+    assert data['price_distribution'] == json.loads(client.get('/api/v1/market/price_distribution').data)
+    assert data['consumer_preferences'] == json.loads(client.get('/api/v1/consumer_insights/preferences').data)
+    assert data['city_rankings'] == json.loads(client.get('/api/v1/cities/rankings').data)
+
+
+def test_dashboard_hive_mode_uses_one_snapshot(client):
+    """测试 hive / summary 模式下仪表盘所有面板基于同一份车型快照计算，不逐个面板下推聚合"""
+    pushdown = patch.multiple('app', **{name: DEFAULT for name in (
+        'aggregate_market_overview', 'aggregate_year_trends', 'aggregate_price_buckets',
+        'aggregate_type_registrations', 'aggregate_city_registrations', 'summary_city_registrations',
+        'summary_year_trends', 'summary_type_registrations')})
+    app.config['ANALYTICS_SOURCE'] = 'snapshot'
+    with patch('app.iter_data_with_filters', side_effect=mock_iter_data_with_filters):
+        expected = json.loads(client.get('/api/v1/dashboard').data)
+
+    for source in ('hive', 'summary'):
+        app.config['ANALYTICS_SOURCE'] = source
+        response_cache.clear()
+        with patch('app.iter_data_with_filters', side_effect=AssertionError('snapshot already cached')), \
+                pushdown as mocks:
+            data = json.loads(client.get('/api/v1/dashboard').data)
+        assert data == expected
+        assert not any(mock.called for mock in mocks.values())
+
+
+def test_dashboard_invalid_metric(client):
+    """测试仪表盘接口的非法指标参数"""
+    assert client.get('/api/v1/dashboard?trend_metric=unknown').status_code == 400
+    assert client.get('/api/v1/dashboard?ranking_metric=unknown').status_code == 400
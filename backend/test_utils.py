@@ -0,0 +1,480 @@
+# test_utils.py
+import sys
+import os
+import pytest
+from unittest.mock import patch, MagicMock
+
+# 添加当前目录到 Python 路径
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+import utils
+from utils import (HiveConnectionPool, get_hive_pool, close_hive_pools, read_from_hive_table,
+                   aggregate_from_hive_table, FilterBuilder, iter_from_hive_table,
+                   insert_into_hive_table, write_delimited_file, bulk_load_into_hive_table,
+                   format_delimited_columns, format_delimited_row, insert_from_hive_aggregate,
+                   create_hive_table, drop_hive_table, DYNAMIC_PARTITION_CONFIG, get_partition_columns,
+                   invalidate_partition_columns, plan_partition_filters, explain_partitions)
+
+FAKE_ROWS = [('Brand1', 75), ('Brand2', 85), ('Brand3', 95)]
+TEST_CONFIG = {'host': 'hive-test', 'port': 10000, 'auth_mechanism': 'NOSASL', 'database': 'default'}
+
+
+def make_fake_connect():
+    """返回一个记录调用次数的假 connect，每次调用生成新的连接对象"""
+    def fake_connect(**kwargs):
+        conn = MagicMock(name='conn')
+        cursor = conn.cursor.return_value
+        cursor.description = [('car_brand',), ('popularity',)]
+        pending = []
+
+        def execute(sql, params=None, configuration=None):
+            pending[:] = FAKE_ROWS
+
+        def fetchmany(size):
+            batch = pending[:size]
+            del pending[:size]
+            return batch
+
+        cursor.execute.side_effect = execute
+        cursor.fetchmany.side_effect = fetchmany
+        cursor.fetchall.return_value = FAKE_ROWS
+        return conn
+    return MagicMock(side_effect=fake_connect)
+
+
+@pytest.fixture(autouse=True)
+def reset_pools():
+    close_hive_pools()
+    yield
+    close_hive_pools()
+
+
+@pytest.fixture
+def fake_connect():
+    mock_connect = make_fake_connect()
+    with patch('utils.connect', new=mock_connect):
+        yield mock_connect
+
+
+def test_pool_reuses_connection(fake_connect):
+    """测试连接归还后被复用，不会重复建立连接"""
+    pool = HiveConnectionPool(TEST_CONFIG, max_size=2)
+    with pool.cursor() as first:
+        pass
+    with pool.cursor() as second:
+        pass
+    assert first is second
+    assert fake_connect.call_count == 1
+    stats = pool.stats()
+    assert stats['checkouts'] == 2
+    assert stats['created'] == 1
+    assert stats['idle'] == 1
+
+
+def test_pool_wait_timeout(fake_connect):
+    """测试连接池耗尽时等待超时"""
+    pool = HiveConnectionPool(TEST_CONFIG, max_size=1, wait_timeout=0.05)
+    conn, cursor = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    pool.release(conn, cursor)
+    stats = pool.stats()
+    assert stats['timeouts'] == 1
+    assert stats['in_use'] == 0
+
+
+def test_pool_replaces_dead_connection(fake_connect):
+    """测试借出前的存活检查会替换已失效的连接"""
+    pool = HiveConnectionPool(TEST_CONFIG, max_size=1)
+    with pool.cursor() as cursor:
+        dead = cursor
+        cursor.ping.return_value = False
+    with pool.cursor() as cursor:
+        assert cursor is not dead
+    assert fake_connect.call_count == 2
+    assert pool.stats()['liveness_failures'] == 1
+
+
+def test_pool_replaces_connection_when_ping_raises(fake_connect):
+    """测试 ping 抛出异常时同样替换连接"""
+    pool = HiveConnectionPool(TEST_CONFIG, max_size=1)
+    with pool.cursor() as cursor:
+        cursor.ping.side_effect = Exception('broken pipe')
+    with pool.cursor() as cursor:
+        assert not cursor.ping.side_effect
+    assert fake_connect.call_count == 2
+
+
+def test_pool_evicts_idle_connections(fake_connect):
+    """测试空闲超时的连接会被回收"""
+    pool = HiveConnectionPool(TEST_CONFIG, min_size=0, max_size=2, idle_timeout=0)
+    with pool.cursor():
+        pass
+    with pool.cursor():
+        pass
+    assert fake_connect.call_count == 2
+    assert pool.stats()['evicted_idle'] == 1
+
+
+def test_pool_discards_connection_on_error(fake_connect):
+    """测试查询异常时连接被关闭而不是放回池中"""
+    pool = HiveConnectionPool(TEST_CONFIG, max_size=1)
+    with pytest.raises(RuntimeError):
+        with pool.cursor():
+            raise RuntimeError('query failed')
+    stats = pool.stats()
+    assert stats['discarded'] == 1
+    assert stats['size'] == 0
+
+
+def test_read_from_hive_table_borrows_from_pool(fake_connect):
+    """测试读取函数复用进程级连接池"""
+    for _ in range(3):
+        output = read_from_hive_table('car_data', TEST_CONFIG)
+        assert output['status'] == 'success'
+        assert output['data'] == [{'car_brand': 'Brand1', 'popularity': 75},
+                                  {'car_brand': 'Brand2', 'popularity': 85},
+                                  {'car_brand': 'Brand3', 'popularity': 95}]
+    assert fake_connect.call_count == 1
+    assert get_hive_pool(TEST_CONFIG).stats()['checkouts'] == 3
+
+
+def test_aggregate_from_hive_table_builds_group_by(fake_connect):
+    """测试聚合查询的 SQL 拼接与别名映射"""
+    output = aggregate_from_hive_table(
+        'car_data', TEST_CONFIG,
+        select={'city': 'plate_city', 'registrations': 'SUM(plate_count)'},
+        lateral_view='explode(city_license_plates) plates AS plate_city, plate_count',
+        conditions=['manufacture_year <> 0'],
+        group_by=['plate_city'],
+    )
+    assert output['status'] == 'success'
+    assert output['data'][0] == {'city': 'Brand1', 'registrations': 75}
+    cursor = get_hive_pool(TEST_CONFIG).acquire()[1]
+    sql = cursor.execute.call_args[0][0]
+    assert sql == ("SELECT plate_city AS city, SUM(plate_count) AS registrations FROM default.car_data "
+                   "LATERAL VIEW explode(city_license_plates) plates AS plate_city, plate_count "
+                   "WHERE manufacture_year <> 0 GROUP BY plate_city")
+
+
+def test_filter_builder_operators():
+    """测试篩选条件转换为参数化 SQL"""
+    builder = FilterBuilder()
+    builder.add('car_brand', "O'Brien")
+    builder.add('num_doors', [2, 4])
+    builder.add('car_type', None)
+    builder.add('min_reference_price', {'>=': 100000, '<=': 300000})
+    builder.add('manufacture_year', {'between': (2018, 2022)})
+    builder.add('popularity', {'is null': False})
+    assert builder.conditions == [
+        'car_brand = %(f0)s',
+        'num_doors IN (%(f1)s, %(f2)s)',
+        'car_type IS NULL',
+        'min_reference_price >= %(f3)s',
+        'min_reference_price <= %(f4)s',
+        'manufacture_year BETWEEN %(f5)s AND %(f6)s',
+        'popularity IS NOT NULL',
+    ]
+    assert builder.params == {'f0': "O'Brien", 'f1': 2, 'f2': 4, 'f3': 100000, 'f4': 300000,
+                              'f5': 2018, 'f6': 2022}
+
+
+def test_filter_builder_rejects_invalid_input():
+    """测试非法列名和运算符被拒绝"""
+    with pytest.raises(ValueError):
+        FilterBuilder().add('city; DROP TABLE car_data', '成都')
+    with pytest.raises(ValueError):
+        FilterBuilder().add('popularity', {'like': '%a%'})
+
+
+def test_read_from_hive_table_binds_parameters(fake_connect):
+    """测试读取时篩选值以参数形式传给 impyla"""
+    output = read_from_hive_table('car_data', TEST_CONFIG,
+                                  filters={'city': '成都', 'engine_horsepower': {'>=': 200}})
+    assert output['status'] == 'success'
+    cursor = get_hive_pool(TEST_CONFIG).acquire()[1]
+    sql, params = cursor.execute.call_args[0]
+    assert sql == ("SELECT * FROM default.car_data "
+                   "WHERE city = %(f0)s AND engine_horsepower >= %(f1)s")
+    assert params == {'f0': '成都', 'f1': 200}
+
+
+def test_read_from_hive_table_order_and_limit(fake_connect):
+    """测试排序与分页以 ORDER BY ... LIMIT offset, rows 下推"""
+    read_from_hive_table('car_data', TEST_CONFIG, filters={'car_type': 'SUV'}, name='car_brand',
+                         order_by='popularity DESC', limit=20, offset=40)
+    pool = get_hive_pool(TEST_CONFIG)
+    conn, cursor = pool.acquire()
+    assert cursor.execute.call_args[0][0] == (
+        "SELECT car_brand FROM default.car_data WHERE car_type = %(f0)s "
+        "ORDER BY popularity DESC LIMIT 40, 20")
+    pool.release(conn, cursor)
+    read_from_hive_table('car_data', TEST_CONFIG, order_by='popularity DESC', limit=5)
+    assert cursor.execute.call_args[0][0].endswith("ORDER BY popularity DESC LIMIT 5")
+
+
+def test_iter_from_hive_table_yields_batches(fake_connect):
+    """测试流式读取按批次产出数据"""
+    batches = list(iter_from_hive_table('car_data', TEST_CONFIG, batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert batches[1] == [{'car_brand': 'Brand3', 'popularity': 95}]
+    assert get_hive_pool(TEST_CONFIG).stats()['in_use'] == 0
+
+
+def test_iter_from_hive_table_early_close_keeps_connection(fake_connect):
+    """测试提前停止读取时关闭查询并归还连接"""
+    stream = iter_from_hive_table('car_data', TEST_CONFIG, batch_size=1)
+    next(stream)
+    stream.close()
+    stats = get_hive_pool(TEST_CONFIG).stats()
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+    assert stats['discarded'] == 0
+
+
+INSERT_SCHEMA = {'car_brand': 'STRING', 'popularity': 'INT', 'city_license_plates': 'MAP<STRING, INT>'}
+
+
+def test_insert_into_hive_table_batches(fake_connect):
+    """测试插入按批次切分并发执行"""
+    get_hive_pool(TEST_CONFIG, max_size=4)
+    data = [{'car_brand': f'Brand{i}', 'popularity': i, 'city_license_plates': {'CityA': i}} for i in range(5)]
+    result = insert_into_hive_table('car_data', data, INSERT_SCHEMA, TEST_CONFIG, batch_size=2, max_workers=3)
+    assert result['status'] == 'success'
+    assert result['inserted_rows'] == 5
+    assert [(r['offset'], r['rows']) for r in result['batches']] == [(0, 2), (2, 2), (4, 1)]
+    assert get_hive_pool(TEST_CONFIG).stats()['checkouts'] == 3
+
+
+def test_insert_into_hive_table_partial_failure(fake_connect):
+    """测试单个批次失败不影响其他批次"""
+    data = [{'car_brand': 'Brand1', 'popularity': 1}, {'car_brand': 'Brand2', 'popularity': 2}]
+
+    def flaky_execute(sql, params=None, configuration=None):
+        if 'Brand2' in sql:
+            raise RuntimeError('statement too long')
+
+    pool = get_hive_pool(TEST_CONFIG)
+    conn, cursor = pool.acquire()
+    cursor.execute.side_effect = flaky_execute
+    pool.release(conn, cursor)
+    result = insert_into_hive_table('car_data', data, INSERT_SCHEMA, TEST_CONFIG, batch_size=1)
+    assert result['status'] == 'partial'
+    assert result['inserted_rows'] == 1
+    assert result['failed_rows'] == 1
+    assert result['batches'][1]['status'] == 'error'
+    assert 'statement too long' in result['batches'][1]['message']
+
+
+def test_write_delimited_file_matches_table_format(tmp_path):
+    """测试文本文件格式与建表时声明的分隔符一致"""
+    path = tmp_path / 'part.txt'
+    data = [
+        {'car_brand': 'Brand\t1', 'popularity': 75, 'city_license_plates': {'CityA': 50, 'City,B': 25}},
+        {'car_brand': 'Brand2', 'popularity': None, 'city_license_plates': None},
+    ]
+    assert write_delimited_file(str(path), data, INSERT_SCHEMA) == 2
+    assert path.read_text(encoding='utf-8').split('\n') == [
+        'Brand 1\t75\tCityA:50,City B:25',
+        'Brand2\t\\N\t\\N',
+        '',
+    ]
+
+
+def test_format_delimited_columns_matches_rows():
+    """测试按列格式化与逐行格式化输出一致，包括分隔符替换和NULL"""
+    columns = {
+        'car_brand': ['Brand\t1', 'Brand2', None],
+        'popularity': [75, None, float('nan')],
+        'city_license_plates': [{'CityA': 50, 'City,B': 25}, None, {}],
+    }
+    rows = [{name: values[i] for name, values in columns.items()} for i in range(3)]
+    assert format_delimited_columns(columns, INSERT_SCHEMA) == [
+        format_delimited_row(row, list(INSERT_SCHEMA), INSERT_SCHEMA) for row in rows]
+
+
+def test_bench_dataset_manifest(tmp_path):
+    """测试基准数据集按分片写出并记录行数和校验和，相同种子结果一致"""
+    from bench_data import build_dataset, file_sha256
+    manifest = build_dataset(str(tmp_path / 'a'), 250, rows_per_shard=100, workers=1, seed=3)
+    assert [f['rows'] for f in manifest['files']] == [100, 100, 50]
+    first = manifest['files'][0]
+    path = tmp_path / 'a' / first['path']
+    assert len(path.read_text(encoding='utf-8').splitlines()) == 100
+    assert first['sha256'] == file_sha256(str(path))
+    again = build_dataset(str(tmp_path / 'b'), 250, rows_per_shard=100, workers=1, seed=3)
+    assert [f['sha256'] for f in again['files']] == [f['sha256'] for f in manifest['files']]
+
+
+def test_bulk_load_issues_single_load_data(fake_connect, tmp_path):
+    """测试批量导入写入暂存文件后执行一条 LOAD DATA 并清理暂存目录"""
+    data = [{'car_brand': f'Brand{i}', 'popularity': i} for i in range(5)]
+    result = bulk_load_into_hive_table('car_data', data, INSERT_SCHEMA, TEST_CONFIG,
+                                       staging_dir=str(tmp_path), load_dir='/mnt/staging', rows_per_file=2)
+    assert result['status'] == 'success'
+    assert result['inserted_rows'] == 5
+    assert [f['rows'] for f in result['files']] == [2, 2, 1]
+    cursor = get_hive_pool(TEST_CONFIG).acquire()[1]
+    sql = cursor.execute.call_args[0][0]
+    assert sql.startswith("LOAD DATA LOCAL INPATH '/mnt/staging/car_data_")
+    assert sql.endswith("' INTO TABLE default.car_data")
+    assert list(tmp_path.iterdir()) == []
+
+
+def executed_sql(config=TEST_CONFIG):
+    """返回池中（唯一）连接上执行过的全部 SQL"""
+    cursor = get_hive_pool(config).acquire()[1]
+    return [call[0][0] for call in cursor.execute.call_args_list]
+
+
+def test_create_hive_table_orc_partitioned(fake_connect):
+    """测试创建带分区的 ORC 压缩表"""
+    result = create_hive_table('car_data', INSERT_SCHEMA, TEST_CONFIG, storage_format='orc',
+                               compression='snappy', partition_by=['car_brand'])
+    assert result['status'] == 'success'
+    drop_sql, create_sql = executed_sql()
+    assert drop_sql == 'DROP TABLE IF EXISTS car_data'
+    create_sql = ' '.join(create_sql.split())
+    assert create_sql == ("CREATE TABLE IF NOT EXISTS car_data ( popularity INT, city_license_plates MAP<STRING, INT> ) "
+                          "PARTITIONED BY (car_brand STRING) STORED AS ORC "
+                          "TBLPROPERTIES ('orc.compress'='SNAPPY')")
+
+
+def test_create_hive_table_keeps_existing_table(fake_connect):
+    """测试 replace=False 时不删除已存在的表"""
+    assert create_hive_table('car_summary_city', {'city': 'STRING'}, TEST_CONFIG, replace=False)['status'] == 'success'
+    cursor = get_hive_pool(TEST_CONFIG).acquire()[1]
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert not any(sql.startswith('DROP') for sql in statements)
+    assert 'CREATE TABLE IF NOT EXISTS car_summary_city' in statements[-1]
+
+
+def test_drop_hive_table(fake_connect):
+    """测试删除表时带上数据库名，表不存在不报错"""
+    assert drop_hive_table('car_summary_city__staging', TEST_CONFIG)['status'] == 'success'
+    assert executed_sql() == ['DROP TABLE IF EXISTS default.car_summary_city__staging']
+
+
+def test_create_hive_table_rejects_unknown_partition(fake_connect):
+    """测试分区列必须存在于 schema 中"""
+    result = create_hive_table('car_data', INSERT_SCHEMA, TEST_CONFIG, partition_by=['city'])
+    assert result['status'] == 'error'
+
+
+def test_insert_into_partitioned_table(fake_connect):
+    """测试分区表按动态分区写入，分区列排在最后"""
+    data = [{'car_brand': 'Brand1', 'popularity': 1, 'city_license_plates': None}]
+    result = insert_into_hive_table('car_data', data, INSERT_SCHEMA, TEST_CONFIG, partition_by=['car_brand'])
+    assert result['status'] == 'success'
+    cursor = get_hive_pool(TEST_CONFIG).acquire()[1]
+    args, kwargs = cursor.execute.call_args
+    assert args[0] == "INSERT INTO TABLE default.car_data PARTITION (car_brand) VALUES (1, NULL, 'Brand1')"
+    assert kwargs['configuration'] == DYNAMIC_PARTITION_CONFIG
+
+
+def test_bulk_load_into_orc_uses_staging_table(fake_connect, tmp_path):
+    """测试列式表的批量导入先加载到临时文本表再转写"""
+    data = [{'car_brand': 'Brand1', 'popularity': 1}]
+    result = bulk_load_into_hive_table('car_data', data, INSERT_SCHEMA, TEST_CONFIG, staging_dir=str(tmp_path),
+                                       storage_format='ORC', partition_by=['car_brand'])
+    assert result['status'] == 'success'
+    statements = [' '.join(sql.split()) for sql in executed_sql()]
+    staging_table = statements[0].split()[-1]
+    assert staging_table.startswith('car_data_staging_')
+    assert statements[2].startswith(f"LOAD DATA LOCAL INPATH '{tmp_path}/car_data_")
+    assert statements[2].endswith(f"INTO TABLE default.{staging_table}")
+    assert statements[3] == (f"INSERT INTO TABLE default.car_data PARTITION (car_brand) "
+                             f"SELECT popularity, city_license_plates, car_brand FROM default.{staging_table}")
+    assert statements[4] == f"DROP TABLE IF EXISTS default.{staging_table}"
+
+
+def test_bulk_load_ignores_staging_drop_failure(fake_connect, tmp_path):
+    """测试转写成功后删除临时表失败时仍返回成功和导入行数"""
+    data = [{'car_brand': 'Brand1', 'popularity': 1}]
+    statements = []
+
+    def execute(sql, params=None, configuration=None):
+        statements.append(' '.join(sql.split()))
+        if sql.startswith('DROP TABLE IF EXISTS default.car_data_staging_'):
+            raise RuntimeError('metastore unavailable')
+
+    pool = get_hive_pool(TEST_CONFIG)
+    conn, cursor = pool.acquire()
+    cursor.execute.side_effect = execute
+    pool.release(conn, cursor)
+    result = bulk_load_into_hive_table('car_data', data, INSERT_SCHEMA, TEST_CONFIG, staging_dir=str(tmp_path),
+                                       storage_format='ORC', partition_by=['car_brand'])
+    assert result['status'] == 'success'
+    assert result['inserted_rows'] == 1
+    assert statements[-1].startswith('DROP TABLE IF EXISTS default.car_data_staging_')
+    assert statements[-2].startswith('INSERT INTO TABLE default.car_data PARTITION (car_brand)')
+
+
+DESCRIBE_ROWS = [
+    ('car_brand', 'string', ''),
+    ('popularity', 'int', ''),
+    ('city', 'string', ''),
+    ('manufacture_year', 'int', ''),
+    ('', None, None),
+    ('# Partition Information', None, None),
+    ('# col_name            ', 'data_type           ', 'comment             '),
+    ('', None, None),
+    ('city', 'string', ''),
+    ('manufacture_year', 'int', ''),
+]
+
+
+def test_get_partition_columns_parses_and_caches(fake_connect):
+    """测试从 DESCRIBE 输出解析分区列并缓存"""
+    invalidate_partition_columns()
+    pool = get_hive_pool(TEST_CONFIG)
+    conn, cursor = pool.acquire()
+    cursor.fetchall.return_value = DESCRIBE_ROWS
+    pool.release(conn, cursor)
+    for _ in range(2):
+        assert get_partition_columns('car_data', TEST_CONFIG) == [('city', 'STRING'), ('manufacture_year', 'INT')]
+    assert executed_sql() == ['DESCRIBE default.car_data']
+    invalidate_partition_columns()
+
+
+def test_plan_partition_filters():
+    """测试分区列条件前置并转换为分区列类型"""
+    filters = {'popularity': {'>=': 50}, 'manufacture_year': {'between': ('2018', '2020')}, 'city': '成都'}
+    planned, pruning = plan_partition_filters(filters, [('city', 'STRING'), ('manufacture_year', 'INT')])
+    assert list(planned) == ['city', 'manufacture_year', 'popularity']
+    assert planned['manufacture_year'] == {'between': (2018, 2020)}
+    assert pruning == ['city', 'manufacture_year']
+
+
+def test_explain_partitions(fake_connect):
+    """测试从 EXPLAIN DEPENDENCY 结果中解析读取的分区"""
+    pool = get_hive_pool(TEST_CONFIG)
+    conn, cursor = pool.acquire()
+    cursor.fetchall.return_value = [(
+        '{"input_tables":[{"tablename":"default@car_data","tabletype":"MANAGED_TABLE"}],'
+        '"input_partitions":[{"partitionName":"default@car_data@city=成都/manufacture_year=2020"}]}',
+    )]
+    pool.release(conn, cursor)
+    partitions = explain_partitions('car_data', TEST_CONFIG, filters={'city': '成都'})
+    assert partitions == ['city=成都/manufacture_year=2020']
+    sql, params = cursor.execute.call_args[0]
+    assert sql == 'EXPLAIN DEPENDENCY SELECT * FROM default.car_data WHERE city = %(f0)s'
+    assert params == {'f0': '成都'}
+
+
+def test_insert_from_hive_aggregate_sql(fake_connect):
+    """测试聚合结果直接写入汇总表"""
+    result = insert_from_hive_aggregate(
+        'car_summary_type', 'car_data', TEST_CONFIG,
+        select={'car_type': 'car_type', 'registrations': 'SUM(COALESCE(plate_count, 0))'},
+        overwrite=True,
+        lateral_view='OUTER explode(city_license_plates) plates AS plate_city, plate_count',
+        group_by=['car_type'],
+    )
+    assert result['status'] == 'success'
+    assert executed_sql() == [
+        'INSERT OVERWRITE TABLE default.car_summary_type '
+        'SELECT car_type AS car_type, SUM(COALESCE(plate_count, 0)) AS registrations '
+        'FROM default.car_data LATERAL VIEW OUTER explode(city_license_plates) plates AS plate_city, plate_count '
+        'GROUP BY car_type'
+    ]
@@ -1,5 +1,16 @@
 from impala.dbapi import connect
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import json
 import logging
+import numbers
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
 
 # 假設 HIVE_CONFIG 已經定義，例如：
 # HIVE_CONFIG = {
@@ -12,7 +23,271 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def create_hive_table(table_name, schema, config):
+class HiveConnectionPool:
+    """
+    線程安全的 HiveServer2 連接池。
+
+    impyla 的每個 cursor 都對應一個 HS2 會話，因此池中保存的是 (連接, cursor) 對，
+    借用方拿到的 cursor 可以直接複用已打開的 TCP 連接和會話。
+
+    Args:
+        config (dict): Hive 連接配置，直接傳給 impala.dbapi.connect。
+        min_size (int): 空閒回收時至少保留的連接數。
+        max_size (int): 最大連接數（含借出中的連接）。
+        idle_timeout (float): 空閒超過該秒數的連接會被關閉。
+        wait_timeout (float): 連接池耗盡時借用連接的最長等待秒數。
+        validate_on_checkout (bool): 借出前是否 ping 一次以剔除失效連接。
+    """
+
+    def __init__(self, config, min_size=1, max_size=8, idle_timeout=300,
+                 wait_timeout=30, validate_on_checkout=True):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"連接池大小配置無效: min_size={min_size}, max_size={max_size}")
+        self.config = dict(config)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.validate_on_checkout = validate_on_checkout
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # 元素為 (conn, cursor, last_used)
+        self._size = 0        # 已創建且未關閉的連接數（含借出中的連接）
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'evicted_idle': 0,
+            'liveness_failures': 0,
+        }
+
+    def _dial(self):
+        conn = connect(**self.config)
+        try:
+            cursor = conn.cursor()
+        except Exception:
+            conn.close()
+            raise
+        return conn, cursor
+
+    @staticmethod
+    def _close_quietly(conn, cursor):
+        for closable in (cursor, conn):
+            try:
+                closable.close()
+            except Exception as e:
+                logging.debug(f"關閉 Hive 連接時出錯（已忽略）: {e}")
+
+    @staticmethod
+    def _is_alive(cursor):
+        # impyla 的 ping() 在連接失效時返回 False，不一定拋出異常
+        try:
+            return bool(cursor.ping())
+        except Exception:
+            return False
+
+    def _evict_idle_locked(self, now):
+        """回收空閒過久的連接，返回需要在鎖外關閉的 (conn, cursor) 列表。"""
+        evicted = []
+        # 隊首是最久未使用的連接
+        while self._idle and self._size > self.min_size:
+            conn, cursor, last_used = self._idle[0]
+            if now - last_used < self.idle_timeout:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._stats['evicted_idle'] += 1
+            evicted.append((conn, cursor))
+        return evicted
+
+    def acquire(self):
+        """
+        借出一個 (conn, cursor)。連接池耗盡時最多等待 wait_timeout 秒。
+
+        Returns:
+            tuple: (conn, cursor)，使用完畢後必須調用 release 歸還。
+        """
+        start = time.monotonic()
+        deadline = start + self.wait_timeout
+        waited = False
+        entry = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Hive 連接池已關閉")
+                evicted = self._evict_idle_locked(time.monotonic())
+                if evicted:
+                    self._cond.notify_all()
+                if self._idle:
+                    # 後進先出：最近歸還的連接最有可能仍然存活
+                    conn, cursor, _ = self._idle.pop()
+                    entry = (conn, cursor)
+                    break
+                if self._size < self.max_size:
+                    # 先佔住名額，在鎖外建立連接
+                    self._size += 1
+                    break
+                waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise TimeoutError(f"等待 Hive 連接超時（{self.wait_timeout} 秒）")
+                self._cond.wait(remaining)
+
+        for conn, cursor in evicted:
+            self._close_quietly(conn, cursor)
+
+        if entry is not None and self.validate_on_checkout and not self._is_alive(entry[1]):
+            logging.warning("Hive 連接已失效，重新建立連接")
+            self._close_quietly(*entry)
+            with self._cond:
+                self._stats['liveness_failures'] += 1
+            entry = None
+
+        if entry is None:
+            try:
+                entry = self._dial()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats['created'] += 1
+
+        wait_time = time.monotonic() - start
+        with self._cond:
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+            self._stats['wait_time_total'] += wait_time
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+        return entry
+
+    def release(self, conn, cursor, discard=False):
+        """
+        歸還連接。discard=True 時直接關閉該連接（例如查詢過程中出現異常）。
+        """
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+                self._stats['discarded'] += 1
+                to_close = True
+            else:
+                self._idle.append((conn, cursor, time.monotonic()))
+                to_close = False
+            self._cond.notify()
+        if to_close:
+            self._close_quietly(conn, cursor)
+
+    @contextmanager
+    def cursor(self):
+        """
+        借用一個已連接的 cursor，退出 with 塊時自動歸還。
+
+        塊內拋出異常時無法確定會話狀態，該連接會被關閉而不是放回池中。
+        """
+        conn, cursor = self.acquire()
+        try:
+            yield cursor
+        except BaseException:
+            self.release(conn, cursor, discard=True)
+            raise
+        else:
+            self.release(conn, cursor)
+
+    def close(self):
+        """關閉所有空閒連接；借出中的連接在歸還時關閉。"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, cursor, _ in idle:
+            self._close_quietly(conn, cursor)
+
+    def stats(self):
+        """返回連接池的當前狀態與累計指標。"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._size - len(self._idle)
+            stats['max_size'] = self.max_size
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
+
+_hive_pools = {}
+_hive_pools_lock = threading.Lock()
+
+
+def _pool_key(config):
+    return tuple(sorted((k, repr(v)) for k, v in config.items()))
+
+
+def get_hive_pool(config, **pool_options):
+    """
+    返回 config 對應的進程級連接池，不存在時按 pool_options 創建。
+
+    同一份 config 在進程內只會有一個連接池，之後再傳入的 pool_options 會被忽略。
+    """
+    key = _pool_key(config)
+    with _hive_pools_lock:
+        pool = _hive_pools.get(key)
+        if pool is None:
+            pool = HiveConnectionPool(config, **pool_options)
+            _hive_pools[key] = pool
+        return pool
+
+
+def close_hive_pools():
+    """關閉並清空所有連接池。"""
+    with _hive_pools_lock:
+        pools = list(_hive_pools.values())
+        _hive_pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+# 文本表的分隔符，create_hive_table 建表與 write_delimited_file 寫文件共用
+FIELD_DELIMITER = '\t'
+COLLECTION_DELIMITER = ','
+MAP_KEY_DELIMITER = ':'
+# LazySimpleSerDe 默認的 NULL 表示
+NULL_MARKER = '\\N'
+
+# 支持的存儲格式及其壓縮屬性名；TEXTFILE 使用 ROW FORMAT DELIMITED，不支持表級壓縮屬性
+STORAGE_FORMATS = {
+    'TEXTFILE': None,
+    'ORC': 'orc.compress',
+    'PARQUET': 'parquet.compression',
+}
+
+# 動態分區寫入所需的會話配置
+DYNAMIC_PARTITION_CONFIG = {
+    'hive.exec.dynamic.partition': 'true',
+    'hive.exec.dynamic.partition.mode': 'nonstrict',
+}
+
+
+def partition_column_order(schema, partition_by=None):
+    """
+    返回分區表中列的物理順序：普通列在前，分區列按 partition_by 的順序在後。
+    INSERT ... PARTITION 與 SELECT * 都使用這個順序。
+    """
+    partition_by = list(partition_by or [])
+    return [col for col in schema if col not in partition_by] + partition_by
+
+
+def create_hive_table(table_name, schema, config, storage_format='TEXTFILE', compression=None,
+                      partition_by=None, replace=True):
     """
     在 Hive 中創建數據表，适配 car_data 表結構。
 
@@ -20,154 +295,762 @@ def create_hive_table(table_name, schema, config):
         table_name (str): 要創建的表名 (例如 'car_data')。
         schema (dict): 表的 schema 定義，鍵為列名，值為 Hive 數據類型字符串。
         config (dict): Hive 連接配置。
+        storage_format (str): 'TEXTFILE'、'ORC' 或 'PARQUET'。
+        compression (str, optional): 列式格式的壓縮算法，例如 'SNAPPY'、'ZLIB'。
+        partition_by (list[str], optional): 分區列，必須是 schema 中的列，例如 ['city', 'manufacture_year']。
+        replace (bool): 為 True 時先刪除同名表；為 False 時表已存在則保留原表及其數據。
 
     Returns:
         dict: 包含操作結果的字典。
     """
-    conn = None
     try:
-        conn = connect(**config)
-        cursor = conn.cursor()
-
-        drop_sql = 'DROP TABLE IF EXISTS car_data'
-
-        cursor.execute(drop_sql)
+        storage_format = storage_format.upper()
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f"不支持的存儲格式: {storage_format}")
+        if compression and STORAGE_FORMATS[storage_format] is None:
+            raise ValueError(f"{storage_format} 表不支持表級壓縮屬性")
+        partition_by = list(partition_by or [])
+        unknown = [col for col in partition_by if col not in schema]
+        if unknown:
+            raise ValueError(f"分區列不在 schema 中: {unknown}")
 
         columns_sql = []
         for col_name, col_type in schema.items():
-            columns_sql.append(f"{col_name} {col_type}")
+            if col_name not in partition_by:
+                columns_sql.append(f"{col_name} {col_type}")
 
         create_table_sql = f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            {', '.join(columns_sql)}
-        )
-        ROW FORMAT DELIMITED
-        FIELDS TERMINATED BY '\\t'
-        COLLECTION ITEMS TERMINATED BY ','
-        MAP KEYS TERMINATED BY ':'
-        """
-        logging.info(f"執行建表 SQL:\n{create_table_sql}")
-        cursor.execute(create_table_sql)
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                {', '.join(columns_sql)}
+            )"""
+        if partition_by:
+            partitions_sql = ', '.join(f"{col} {schema[col]}" for col in partition_by)
+            create_table_sql += f"""
+            PARTITIONED BY ({partitions_sql})"""
+        if storage_format == 'TEXTFILE':
+            create_table_sql += f"""
+            ROW FORMAT DELIMITED
+            FIELDS TERMINATED BY '{FIELD_DELIMITER.encode('unicode_escape').decode()}'
+            COLLECTION ITEMS TERMINATED BY '{COLLECTION_DELIMITER}'
+            MAP KEYS TERMINATED BY '{MAP_KEY_DELIMITER}'
+            """
+        else:
+            create_table_sql += f"""
+            STORED AS {storage_format}"""
+            if compression:
+                create_table_sql += f"""
+            TBLPROPERTIES ('{STORAGE_FORMATS[storage_format]}'='{compression.upper()}')"""
+
+        with get_hive_pool(config).cursor() as cursor:
+            if replace:
+                drop_sql = f'DROP TABLE IF EXISTS {table_name}'
+                cursor.execute(drop_sql)
+
+            logging.info(f"執行建表 SQL:\n{create_table_sql}")
+            cursor.execute(create_table_sql)
         return {"status": "success", "message": f"表 '{table_name}' 創建成功或已存在。"}
 
     except Exception as e:
         logging.error(f"創建表 '{table_name}' 失敗: {e}")
         return {"status": "error", "message": f"創建表失敗: {e}"}
-    finally:
-        if conn:
-            conn.close()
 
 
-def insert_into_hive_table(table_name, data, schema, config):
+def drop_hive_table(table_name, config):
+    """
+    刪除 Hive 數據表，表不存在時視為成功。
+
+    Args:
+        table_name (str): 要刪除的表名。
+        config (dict): Hive 連接配置。
+
+    Returns:
+        dict: 包含操作結果的字典。
+    """
+    try:
+        with get_hive_pool(config).cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {config['database']}.{table_name}")
+        return {"status": "success", "message": f"表 '{table_name}' 已刪除。"}
+
+    except Exception as e:
+        logging.error(f"刪除表 '{table_name}' 失敗: {e}")
+        return {"status": "error", "message": f"刪除表失敗: {e}"}
+
+
+def _format_row_values(row_dict, columns, schema):
+    """將一行數據格式化為 VALUES 子句中的 (v1, v2, ...)。"""
+    row_values_formatted = []
+    for col_name in columns:
+        value = row_dict.get(col_name)
+        hive_type = schema.get(col_name, 'STRING').upper()
+
+        if value is None:
+            row_values_formatted.append("NULL")
+        elif 'ARRAY' in hive_type and isinstance(value, list):
+            # 直接拼接数组元素，不进行转义
+            formatted_items = [str(item) for item in value]
+            row_values_formatted.append(f"'[{','.join(formatted_items)}]'")
+        elif 'MAP' in hive_type and isinstance(value, dict):
+            # 直接拼接Map键值对，不进行转义
+            formatted_items = []
+            for k, v in value.items():
+                # 对于字符串键值，加上单引号
+                formatted_k = f"'{k}'" if isinstance(k, str) else str(k)
+                formatted_v = f"'{v}'" if isinstance(v, str) else str(v)
+                formatted_items.append(f"{formatted_k}, {formatted_v}")
+            row_values_formatted.append(f"map({', '.join(formatted_items)})")
+        elif isinstance(value, str):
+            # 对于普通字符串，直接用单引号包裹，不进行内部转义
+            row_values_formatted.append(f"'{value}'")
+        else:
+            row_values_formatted.append(str(value))
+
+    return f"({', '.join(row_values_formatted)})"
+
+
+def _insert_batch(table_name, batch, batch_index, offset, schema, config, partition_by=None):
+    """
+    用一條 INSERT ... VALUES 語句插入一批數據，並返回該批次的報告。
+    格式化或執行失敗只影響本批次。
+    """
+    start = time.monotonic()
+    report = {"batch": batch_index, "offset": offset, "rows": len(batch)}
+    try:
+        columns = partition_column_order(schema, partition_by)
+        all_rows_values = [_format_row_values(row_dict, columns, schema) for row_dict in batch]
+        partition_sql = f" PARTITION ({', '.join(partition_by)})" if partition_by else ""
+        insert_sql = (f"INSERT INTO TABLE {config['database']}.{table_name}{partition_sql} "
+                      f"VALUES {', '.join(all_rows_values)}")
+
+        logging.info(f"執行插入 SQL (批次 {batch_index}，{len(batch)} 行，前500字符):\n{insert_sql[:500]}...")
+        with get_hive_pool(config).cursor() as cursor:
+            # 分區列的值來自每一行數據，需要打開動態分區
+            cursor.execute(insert_sql, configuration=dict(DYNAMIC_PARTITION_CONFIG) if partition_by else None)
+        report.update(status="success", message="")
+    except Exception as e:
+        logging.error(f"插入批次 {batch_index}（第 {offset} 行起，共 {len(batch)} 行）到表 '{table_name}' 失敗: {e}")
+        report.update(status="error", message=str(e))
+    report["seconds"] = time.monotonic() - start
+    return report
+
+
+def insert_into_hive_table(table_name, data, schema, config, batch_size=None, max_workers=1,
+                           partition_by=None):
     """
     將數據插入到 Hive 表中，适配 car_data 表結構，並處理 ARRAY 和 MAP 類型。
 
+    數據按 batch_size 切分為多條 INSERT 語句，以免單條語句超出 HiveServer2 的長度限制，
+    max_workers > 1 時各批次通過各自的池連接並發執行。某一批失敗不影響其他批次。
+
     Args:
         table_name (str): 目標表名 (例如 'car_data')。
         data (list[dict]): 要插入的數據列表，每個字典代表一行。
         schema (dict): 表的 schema 定義，用於判斷數據類型以便正確格式化。
         config (dict): Hive 連接配置。
+        batch_size (int, optional): 每條 INSERT 語句的最大行數，默認全部數據一條語句。
+        max_workers (int): 並發執行的批次數，實際並發不超過連接池的 max_size。
+        partition_by (list[str], optional): 表的分區列，按每行的值動態寫入對應分區。
 
     Returns:
-        dict: 包含操作結果的字典。
+        dict: 包含操作結果的字典。status 為 'success'、'partial'（部分批次失敗）或 'error'，
+            batches 為每個批次的 batch/offset/rows/seconds/status/message 報告。
     """
     if not data:
         return {"status": "warning", "message": "沒有提供數據，跳過插入。"}
 
-    conn = None
-    try:
-        conn = connect(**config)
-        cursor = conn.cursor()
+    batch_size = batch_size or len(data)
+    batches = [(i, offset, data[offset:offset + batch_size])
+               for i, offset in enumerate(range(0, len(data), batch_size))]
+    workers = max(1, min(max_workers, len(batches), get_hive_pool(config).max_size))
+
+    start = time.monotonic()
+    if workers == 1:
+        reports = [_insert_batch(table_name, batch, i, offset, schema, config, partition_by)
+                   for i, offset, batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hive-insert') as executor:
+            futures = [executor.submit(_insert_batch, table_name, batch, i, offset, schema, config, partition_by)
+                       for i, offset, batch in batches]
+            reports = [future.result() for future in futures]
+    elapsed = time.monotonic() - start
+
+    inserted_rows = sum(r["rows"] for r in reports if r["status"] == "success")
+    failed_batches = [r for r in reports if r["status"] != "success"]
+    result = {
+        "batches": reports,
+        "inserted_rows": inserted_rows,
+        "failed_rows": len(data) - inserted_rows,
+        "seconds": elapsed,
+    }
+    if not failed_batches:
+        result.update(status="success",
+                      message=f"成功插入 {len(data)} 行數據到表 '{table_name}'（{len(batches)} 個批次）。")
+    elif inserted_rows:
+        result.update(status="partial",
+                      message=f"插入 {inserted_rows} 行數據到表 '{table_name}'，"
+                              f"{len(failed_batches)}/{len(batches)} 個批次失敗: {failed_batches[0]['message']}")
+    else:
+        result.update(status="error", message=f"插入數據失敗: {failed_batches[0]['message']}")
+    return result
+
 
-        columns = list(schema.keys())
+_FIELD_SANITIZE = str.maketrans({FIELD_DELIMITER: ' ', '\n': ' ', '\r': ' '})
+_ITEM_SANITIZE = str.maketrans({FIELD_DELIMITER: ' ', '\n': ' ', '\r': ' ',
+                                COLLECTION_DELIMITER: ' ', MAP_KEY_DELIMITER: ' '})
 
-        all_rows_values = []
+
+def _format_delimited_value(value, hive_type):
+    """將單個值格式化為文本表中的字段；分隔符會被替換為空格以免破壞行結構。"""
+    if value is None or (isinstance(value, float) and value != value):
+        return NULL_MARKER
+    if 'MAP' in hive_type and isinstance(value, dict):
+        return COLLECTION_DELIMITER.join(
+            f"{str(k).translate(_ITEM_SANITIZE)}{MAP_KEY_DELIMITER}{str(v).translate(_ITEM_SANITIZE)}"
+            for k, v in value.items())
+    if 'ARRAY' in hive_type and isinstance(value, (list, tuple)):
+        return COLLECTION_DELIMITER.join(str(item).translate(_ITEM_SANITIZE) for item in value)
+    return str(value).translate(_FIELD_SANITIZE)
+
+
+def format_delimited_row(row_dict, columns, schema):
+    """將一行數據格式化為文本表中的一行（不含換行符）。"""
+    return FIELD_DELIMITER.join(
+        _format_delimited_value(row_dict.get(col_name), schema.get(col_name, 'STRING').upper())
+        for col_name in columns)
+
+
+def _format_delimited_map(value):
+    """快速格式化 MAP：先直接拼接，只有鍵值中含有分隔符時才逐項替換。"""
+    if not isinstance(value, dict):
+        return _format_delimited_value(value, 'MAP')
+    text = COLLECTION_DELIMITER.join([f"{k}{MAP_KEY_DELIMITER}{v}" for k, v in value.items()])
+    if (text.count(COLLECTION_DELIMITER) != max(len(value) - 1, 0)
+            or text.count(MAP_KEY_DELIMITER) != len(value)
+            or '\t' in text or '\n' in text or '\r' in text):
+        return _format_delimited_value(value, 'MAP')
+    return text
+
+
+def _format_delimited_column(values, hive_type):
+    """按列格式化：數值列直接 str，字符串和集合列才做分隔符替換。"""
+    if 'MAP' in hive_type:
+        return [_format_delimited_map(value) for value in values]
+    if 'ARRAY' in hive_type:
+        return [_format_delimited_value(value, hive_type) for value in values]
+    if hive_type == 'STRING' or hive_type.startswith(('VARCHAR', 'CHAR')):
+        return [NULL_MARKER if value is None else str(value).translate(_FIELD_SANITIZE)
+                for value in values]
+    return [NULL_MARKER if value is None or value != value else str(value) for value in values]
+
+
+def format_delimited_columns(columns, schema):
+    """
+    將按列存放的數據（{列名: list}）格式化為文本表中的行（不含換行符）。
+
+    與逐行調用 format_delimited_row 的輸出相同，但每列只判斷一次類型，
+    適合批量生成的數據；缺少的列寫為 NULL。
+    """
+    num_rows = len(next(iter(columns.values()), []))
+    formatted = [_format_delimited_column(columns.get(col_name, [None] * num_rows),
+                                          schema.get(col_name, 'STRING').upper())
+                 for col_name in schema]
+    return [FIELD_DELIMITER.join(row) for row in zip(*formatted)]
+
+
+def write_delimited_file(path, data, schema):
+    """
+    按 create_hive_table 聲明的文本格式把數據寫入文件，MAP 列寫成 k:v,k:v。
+
+    Args:
+        path (str): 輸出文件路徑。
+        data (Iterable[dict]): 要寫入的行。
+        schema (dict): 表的 schema 定義，列順序即文件中的字段順序。
+
+    Returns:
+        int: 寫入的行數。
+    """
+    columns = list(schema.keys())
+    rows = 0
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
         for row_dict in data:
-            row_values_formatted = []
-            for col_name in columns:
-                value = row_dict.get(col_name)
-                hive_type = schema.get(col_name, 'STRING').upper()
-
-                if value is None:
-                    row_values_formatted.append("NULL")
-                elif 'ARRAY' in hive_type and isinstance(value, list):
-                    # 直接拼接数组元素，不进行转义
-                    formatted_items = [str(item) for item in value]
-                    row_values_formatted.append(f"'[{','.join(formatted_items)}]'")
-                elif 'MAP' in hive_type and isinstance(value, dict):
-                    # 直接拼接Map键值对，不进行转义
-                    formatted_items = []
-                    for k, v in value.items():
-                        # 对于字符串键值，加上单引号
-                        formatted_k = f"'{k}'" if isinstance(k, str) else str(k)
-                        formatted_v = f"'{v}'" if isinstance(v, str) else str(v)
-                        formatted_items.append(f"{formatted_k}, {formatted_v}")
-                    row_values_formatted.append(f"map({', '.join(formatted_items)})")
-                elif isinstance(value, str):
-                    # 对于普通字符串，直接用单引号包裹，不进行内部转义
-                    row_values_formatted.append(f"'{value}'")
-                else:
-                    row_values_formatted.append(str(value))
-
-            all_rows_values.append(f"({', '.join(row_values_formatted)})")
-
-        insert_sql = f"INSERT INTO TABLE {config['database']}.{table_name} VALUES {', '.join(all_rows_values)}"
-
-        logging.info(f"執行插入 SQL (前500字符):\n{insert_sql[:500]}...")
-        cursor.execute(insert_sql)
-        return {"status": "success", "message": f"成功插入 {len(data)} 行數據到表 '{table_name}'。"}
+            f.write(format_delimited_row(row_dict, columns, schema))
+            f.write('\n')
+            rows += 1
+    return rows
+
+
+def load_data_into_hive_table(table_name, path, config, local=True, overwrite=False):
+    """
+    執行 LOAD DATA，把已按表格式寫好的文件（或目錄）直接移入表中，不經過 MapReduce/Tez 作業。
+
+    Args:
+        table_name (str): 目標表名。
+        path (str): HiveServer2 可見的文件或目錄路徑。
+        config (dict): Hive 連接配置。
+        local (bool): True 時使用 LOAD DATA LOCAL，路徑位於 HiveServer2 所在主機；
+            False 時路徑為 HDFS（或兼容文件系統）路徑，文件會被移動到表目錄下。
+        overwrite (bool): 是否覆蓋表中已有數據。
+    """
+    load_sql = (f"LOAD DATA {'LOCAL ' if local else ''}INPATH '{path}' "
+                f"{'OVERWRITE ' if overwrite else ''}INTO TABLE {config['database']}.{table_name}")
+    logging.info(f"執行導入 SQL:\n{load_sql}")
+    with get_hive_pool(config).cursor() as cursor:
+        cursor.execute(load_sql)
+
+
+def _load_via_staging_table(table_name, hive_dir, schema, config, local, partition_by):
+    """LOAD DATA 到臨時文本表，再由 Hive 轉寫為目標表的存儲格式和分區。"""
+    staging_table = f"{table_name}_staging_{uuid.uuid4().hex[:8]}"
+    result = create_hive_table(staging_table, schema, config)
+    if result['status'] != 'success':
+        raise RuntimeError(result['message'])
+    try:
+        load_data_into_hive_table(staging_table, hive_dir, config, local=local)
+        partition_sql = f" PARTITION ({', '.join(partition_by)})" if partition_by else ""
+        insert_sql = (f"INSERT INTO TABLE {config['database']}.{table_name}{partition_sql} "
+                      f"SELECT {', '.join(partition_column_order(schema, partition_by))} "
+                      f"FROM {config['database']}.{staging_table}")
+        logging.info(f"執行轉寫 SQL:\n{insert_sql}")
+        with get_hive_pool(config).cursor() as cursor:
+            cursor.execute(insert_sql, configuration=dict(DYNAMIC_PARTITION_CONFIG) if partition_by else None)
+    finally:
+        # 刪除臨時表失敗不影響已完成的轉寫結果，只記錄警告，殘留的臨時表需手動清理
+        drop_result = drop_hive_table(staging_table, config)
+        if drop_result['status'] != 'success':
+            logging.warning(f"臨時表 '{staging_table}' 刪除失敗: {drop_result['message']}")
+
+
+def bulk_load_into_hive_table(table_name, data, schema, config, staging_dir, load_dir=None,
+                              local=True, rows_per_file=100000, storage_format='TEXTFILE',
+                              partition_by=None):
+    """
+    批量導入：把數據序列化為文本表格式的文件，暫存後用一條 LOAD DATA 導入整個目錄。
+
+    Args:
+        table_name (str): 目標表名。
+        data (list[dict]): 要導入的數據。
+        schema (dict): 表的 schema 定義。
+        config (dict): Hive 連接配置。
+        staging_dir (str): 本地可寫的暫存目錄，可以是掛載的 HDFS 兼容目錄。
+        load_dir (str, optional): HiveServer2 看到的 staging_dir 路徑，默認與 staging_dir 相同。
+        local (bool): 是否使用 LOAD DATA LOCAL。
+        rows_per_file (int): 每個暫存文件的最大行數。
+        storage_format (str): 目標表的存儲格式。
+        partition_by (list[str], optional): 目標表的分區列。
+            目標表不是無分區的文本表時，文件先導入臨時文本表，再 INSERT ... SELECT 轉換格式並動態分區。
+
+    Returns:
+        dict: 包含操作結果的字典，格式與 insert_into_hive_table 相同（含 files 而非 batches）。
+    """
+    if not data:
+        return {"status": "warning", "message": "沒有提供數據，跳過插入。"}
+
+    start = time.monotonic()
+    # 每次導入使用獨立的子目錄，LOAD DATA 會加載目錄下的全部文件
+    batch_name = f"{table_name}_{uuid.uuid4().hex}"
+    local_dir = os.path.join(staging_dir, batch_name)
+    hive_dir = f"{(load_dir or staging_dir).rstrip('/')}/{batch_name}"
+    try:
+        os.makedirs(local_dir)
+        files = []
+        for i, offset in enumerate(range(0, len(data), rows_per_file)):
+            path = os.path.join(local_dir, f"part-{i:05d}.txt")
+            rows = write_delimited_file(path, data[offset:offset + rows_per_file], schema)
+            files.append({"file": os.path.basename(path), "rows": rows})
+
+        if storage_format.upper() == 'TEXTFILE' and not partition_by:
+            load_data_into_hive_table(table_name, hive_dir, config, local=local)
+        else:
+            _load_via_staging_table(table_name, hive_dir, schema, config, local, partition_by)
+        return {
+            "status": "success",
+            "message": f"成功導入 {len(data)} 行數據到表 '{table_name}'（{len(files)} 個文件）。",
+            "inserted_rows": len(data),
+            "failed_rows": 0,
+            "files": files,
+            "seconds": time.monotonic() - start,
+        }
 
     except Exception as e:
-        logging.error(f"插入數據到表 '{table_name}' 失敗: {e}")
-        return {"status": "error", "message": f"插入數據失敗: {e}"}
+        logging.error(f"批量導入數據到表 '{table_name}' 失敗: {e}")
+        return {
+            "status": "error",
+            "message": f"批量導入失敗: {e}",
+            "inserted_rows": 0,
+            "failed_rows": len(data),
+            "seconds": time.monotonic() - start,
+        }
     finally:
-        if conn:
-            conn.close()
+        # LOAD DATA LOCAL 是複製，非 LOCAL 時文件已被移走，這裡只清理剩餘的暫存文件
+        shutil.rmtree(local_dir, ignore_errors=True)
+
+
+# 篩選條件支持的比較運算符
+COMPARISON_OPERATORS = ('=', '!=', '<>', '>', '>=', '<', '<=')
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class FilterBuilder:
+    """
+    將篩選條件轉換為帶命名參數的 SQL 條件，參數值由 impyla 負責轉義。
+
+    支持的篩選條件寫法（可在同一個 filters 字典中混用）：
+        {'city': '成都'}                                  -> city = '成都'
+        {'num_doors': [2, 4]}                             -> num_doors IN (2, 4)
+        {'car_type': None}                                -> car_type IS NULL
+        {'min_reference_price': {'>=': 1e5, '<=': 3e5}}   -> 範圍比較
+        {'manufacture_year': {'between': (2018, 2022)}}   -> BETWEEN
+        {'car_brand': {'in': ['宝马', '奥迪']}}             -> IN 列表，'not in' 同理
+        {'popularity': {'is null': False}}                -> IS NOT NULL
+    """
+
+    def __init__(self):
+        self.conditions = []
+        self.params = {}
+
+    def _param(self, value):
+        name = f"f{len(self.params)}"
+        self.params[name] = value
+        return f"%({name})s"
+
+    def _in_list(self, col, values, negate=False):
+        values = list(values)
+        if not values:
+            # 空 IN 列表在 SQL 中不合法：IN () 恆為假，NOT IN () 恆為真
+            return "1 = 1" if negate else "1 = 0"
+        placeholders = ', '.join(self._param(v) for v in values)
+        return f"{col} {'NOT IN' if negate else 'IN'} ({placeholders})"
+
+    def _operator_condition(self, col, op, operand):
+        op = op.strip().lower()
+        if op in COMPARISON_OPERATORS:
+            if operand is None:
+                raise ValueError(f"列 '{col}' 的 '{op}' 比較值不能為 None，請使用 'is null'")
+            return f"{col} {op} {self._param(operand)}"
+        if op == 'between':
+            low, high = operand
+            return f"{col} BETWEEN {self._param(low)} AND {self._param(high)}"
+        if op in ('in', 'not in'):
+            return self._in_list(col, operand, negate=(op == 'not in'))
+        if op == 'is null':
+            return f"{col} IS NULL" if operand else f"{col} IS NOT NULL"
+        if op == 'is not null':
+            return f"{col} IS NOT NULL" if operand else f"{col} IS NULL"
+        raise ValueError(f"不支持的篩選運算符: '{op}'")
+
+    def add(self, col, spec):
+        if not _IDENTIFIER_RE.match(col):
+            raise ValueError(f"非法的列名: '{col}'")
+        if spec is None:
+            self.conditions.append(f"{col} IS NULL")
+        elif isinstance(spec, dict):
+            for op, operand in spec.items():
+                self.conditions.append(self._operator_condition(col, op, operand))
+        elif isinstance(spec, (list, tuple, set, frozenset)):
+            self.conditions.append(self._in_list(col, spec))
+        elif isinstance(spec, (str, numbers.Number)):
+            self.conditions.append(f"{col} = {self._param(spec)}")
+        else:
+            raise ValueError(f"列 '{col}' 的篩選值類型不受支持: {type(spec).__name__}")
+        return self
+
+
+def _build_where_clause(filters=None, conditions=None):
+    """
+    將篩選條件轉換為 WHERE 子句。
+
+    Args:
+        filters (dict, optional): 列名 -> 篩選條件，寫法見 FilterBuilder。
+        conditions (list[str], optional): 額外的 SQL 條件，僅供內部拼接可信的表達式。
+
+    Returns:
+        tuple: (以空格開頭的 WHERE 子句, 參數字典)。沒有條件時返回 ("", {})。
+    """
+    builder = FilterBuilder()
+    builder.conditions.extend(conditions or [])
+    for col, spec in (filters or {}).items():
+        builder.add(col, spec)
+    if builder.conditions:
+        return " WHERE " + " AND ".join(builder.conditions), builder.params
+    return "", {}
+
+
+def _build_select_sql(table_name, config, filters=None, name='*', order_by=None, limit=None, offset=None):
+    """返回 (SELECT 語句, 參數字典)；offset 需與 limit 一起使用（Hive 2.0 的 LIMIT offset, rows 語法）。"""
+    where_clause, params = _build_where_clause(filters)
+    select_sql = f"SELECT {name} FROM {config['database']}.{table_name}{where_clause}"
+    if order_by:
+        select_sql += f" ORDER BY {order_by}"
+    if limit is not None:
+        select_sql += f" LIMIT {int(offset)}, {int(limit)}" if offset else f" LIMIT {int(limit)}"
+    return select_sql, params
+
+
+_INTEGER_TYPES = ('TINYINT', 'SMALLINT', 'INT', 'BIGINT')
+_partition_columns_cache = {}
+_partition_columns_lock = threading.Lock()
+
+
+def _parse_partition_columns(describe_rows):
+    """從 DESCRIBE 的輸出中解析 '# Partition Information' 段落，返回 [(列名, 類型)]。"""
+    columns = []
+    in_section = False
+    for row in describe_rows:
+        col_name = (row[0] or '').strip()
+        col_type = (row[1] or '').strip().upper() if len(row) > 1 else ''
+        if col_name == '# Partition Information':
+            in_section = True
+            continue
+        if not in_section:
+            continue
+        if not col_name or col_name.startswith('#'):
+            # 段落內的表頭和空行；已經讀到分區列後再遇到則表示段落結束
+            if columns:
+                break
+            continue
+        columns.append((col_name, col_type))
+    return columns
+
+
+def get_partition_columns(table_name, config, refresh=False):
+    """
+    返回表的分區列 [(列名, Hive 類型)]，無分區時返回空列表。
+    結果按 (連接配置, 表名) 緩存在進程內，表結構變化後需調用 invalidate_partition_columns。
+    """
+    key = (_pool_key(config), table_name)
+    with _partition_columns_lock:
+        if not refresh and key in _partition_columns_cache:
+            return _partition_columns_cache[key]
+    with get_hive_pool(config).cursor() as cursor:
+        cursor.execute(f"DESCRIBE {config['database']}.{table_name}")
+        columns = _parse_partition_columns(cursor.fetchall())
+    with _partition_columns_lock:
+        _partition_columns_cache[key] = columns
+    return columns
+
+
+def invalidate_partition_columns(table_name=None):
+    """清除分區列緩存；table_name 為 None 時清除全部。"""
+    with _partition_columns_lock:
+        for key in list(_partition_columns_cache):
+            if table_name is None or key[1] == table_name:
+                del _partition_columns_cache[key]
+
+
+def _coerce_partition_value(value, hive_type):
+    """把篩選值轉換為分區列的類型，類型一致時 Hive 才能在元數據層直接裁剪分區。"""
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return {op: _coerce_partition_value(operand, hive_type) for op, operand in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return type(value)(_coerce_partition_value(v, hive_type) for v in value)
+    if isinstance(value, bool):
+        # 'is null' 等運算符的布爾參數
+        return value
+    if hive_type in _INTEGER_TYPES:
+        return int(value)
+    if hive_type == 'STRING' or hive_type.startswith(('VARCHAR', 'CHAR')):
+        return str(value)
+    return value
+
+
+def plan_partition_filters(filters, partition_columns):
+    """
+    把篩選條件拆分為分區列條件和普通列條件。
+
+    分區列上的條件會轉換為分區列的類型並排在 WHERE 子句最前面，
+    Hive 據此只掃描匹配的分區目錄。
+
+    Args:
+        filters (dict): 篩選條件，寫法見 FilterBuilder。
+        partition_columns (list[tuple]): get_partition_columns 的返回值。
+
+    Returns:
+        tuple: (重新排序後的篩選條件, 用到的分區列名列表)。
+    """
+    partition_types = dict(partition_columns)
+    filters = filters or {}
+    pruning = [col for col in partition_types if col in filters]
+    planned = {col: _coerce_partition_value(filters[col], partition_types[col]) for col in pruning}
+    planned.update((col, spec) for col, spec in filters.items() if col not in partition_types)
+    return planned, pruning
 
 
-def read_from_hive_table(table_name, config, filters=None, name='*'):
+def explain_partitions(table_name, config, filters=None, name='*'):
+    """
+    用 EXPLAIN DEPENDENCY 查詢語句實際會讀取的分區，用於確認分區裁剪是否生效。
+
+    Returns:
+        list[str]: 分區規格，例如 ['city=成都/manufacture_year=2020']；無分區表返回空列表。
+    """
+    select_sql, params = _build_select_sql(table_name, config, filters, name)
+    with get_hive_pool(config).cursor() as cursor:
+        cursor.execute(f"EXPLAIN DEPENDENCY {select_sql}", params or None)
+        rows = cursor.fetchall()
+    dependency = json.loads(''.join(row[0] for row in rows))
+    partitions = []
+    for partition in dependency.get('input_partitions', []):
+        # partitionName 形如 'default@car_data@city=成都/manufacture_year=2020'
+        partitions.append(partition['partitionName'].split('@', 2)[-1])
+    return partitions
+
+
+def iter_from_hive_table(table_name, config, filters=None, name='*', batch_size=10000,
+                         order_by=None, limit=None, offset=None):
+    """
+    以流式方式從 Hive 表中讀取數據，每次 fetchmany(batch_size) 並產出一批字典，
+    內存佔用只與批大小有關，與結果集大小無關。
+
+    生成器在耗盡或被關閉前一直佔用一個池中的連接；讀取失敗時直接拋出異常。
+
+    Args:
+        table_name (str): 要讀取的表名。
+        config (dict): Hive 連接配置。
+        filters (dict, optional): 篩選條件，寫法見 FilterBuilder。
+        name (str): 要查詢的列。
+        batch_size (int): 每批讀取的行數。
+        order_by (str, optional): ORDER BY 子句內容。
+        limit (int, optional): 返回的最大行數，與 order_by 一起實現 Top-K。
+        offset (int, optional): 跳過的行數，需與 limit 一起使用。
+
+    Yields:
+        list[dict]: 一批行數據。
+    """
+    select_sql, params = _build_select_sql(table_name, config, filters, name, order_by, limit, offset)
+    logging.info(f"执行查询 SQL:\n{select_sql}\n参数: {params}")
+
+    pool = get_hive_pool(config)
+    conn, cursor = pool.acquire()
+    discard = True
+    try:
+        cursor.execute(select_sql, params or None)
+        columns = [col[0] for col in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield [dict(zip(columns, row)) for row in rows]
+        discard = False
+    except GeneratorExit:
+        # 調用方提前停止讀取：關閉未讀完的查詢後連接仍可複用
+        cursor.close_operation()
+        discard = False
+        raise
+    finally:
+        pool.release(conn, cursor, discard=discard)
+
+
+def read_from_hive_table(table_name, config, filters=None, name='*', batch_size=10000,
+                         order_by=None, limit=None, offset=None):
     """
     從 Hive 表中讀取數據。
 
     Args:
         table_name (str): 要讀取的表名。
-        filters (dict, optional): 篩選條件。
+        filters (dict, optional): 篩選條件，支持等值、範圍、BETWEEN、IN 和 IS NULL，
+            寫法見 FilterBuilder。所有值都以參數形式綁定並轉義。
         config (dict): Hive 連接配置。
+        batch_size (int): 每次 fetchmany 的行數。
+        order_by / limit / offset: 含義同 iter_from_hive_table。
 
     Returns:
         dict: 包含操作結果的字典。
     """
-    conn = None
     try:
-        conn = connect(**config)
-        cursor = conn.cursor()
-
-        where_clause = ""
-        if filters:
-            filter_conditions = []
-            for col, val in filters.items():
-                if isinstance(val, str):
-                    filter_conditions.append(f"{col} = '{val}'")
-                elif isinstance(val, (int, float)):
-                    filter_conditions.append(f"{col} = {val}")
-            if filter_conditions:
-                where_clause = " WHERE " + " AND ".join(filter_conditions)
-
-        select_sql = f"SELECT {name} FROM {config['database']}.{table_name}{where_clause}"
-        logging.info(f"执行查询 SQL:\n{select_sql}")
-        cursor.execute(select_sql)
-
-        columns = [col[0] for col in cursor.description]
-        rows = cursor.fetchall()
         results = []
-        for row in rows:
-            results.append(dict(zip(columns, row)))
+        for batch in iter_from_hive_table(table_name, config, filters=filters, name=name,
+                                          batch_size=batch_size, order_by=order_by,
+                                          limit=limit, offset=offset):
+            results.extend(batch)
 
         return {"status": "success", "data": results, "message": f"成功从表 '{table_name}' 读取 {len(results)} 行数据"}
 
     except Exception as e:
         logging.error(f"从表 '{table_name}' 读取数据失败: {e}")
         return {"status": "error", "message": f"读取数据失败: {e}"}
-    finally:
-        if conn:
-            conn.close()
+
+
+def _build_aggregate_sql(table_name, config, select, group_by=None, filters=None,
+                         conditions=None, lateral_view=None, order_by=None, limit=None):
+    """構造聚合查詢 SQL，返回 (sql, params)，參數含義同 aggregate_from_hive_table。"""
+    select_sql = ", ".join(f"{expr} AS {alias}" for alias, expr in select.items())
+    query_sql = f"SELECT {select_sql} FROM {config['database']}.{table_name}"
+    if lateral_view:
+        query_sql += f" LATERAL VIEW {lateral_view}"
+    where_clause, params = _build_where_clause(filters, conditions)
+    query_sql += where_clause
+    if group_by:
+        query_sql += f" GROUP BY {', '.join(group_by)}"
+    if order_by:
+        query_sql += f" ORDER BY {order_by}"
+    if limit is not None:
+        query_sql += f" LIMIT {int(limit)}"
+    return query_sql, params
+
+
+def aggregate_from_hive_table(table_name, config, select, group_by=None, filters=None,
+                              conditions=None, lateral_view=None, order_by=None, limit=None):
+    """
+    在 Hive 端執行聚合查詢，只把聚合後的小結果集傳回應用。
+
+    Args:
+        table_name (str): 要查詢的表名。
+        config (dict): Hive 連接配置。
+        select (dict): 輸出列別名 -> SQL 表達式，例如 {'total': 'SUM(popularity)'}。
+        group_by (list[str], optional): GROUP BY 表達式，Hive 不支持在 GROUP BY 中引用別名。
+        filters (dict, optional): 與 read_from_hive_table 相同的篩選條件。
+        conditions (list[str], optional): 額外的 SQL 條件。
+        lateral_view (str, optional): LATERAL VIEW 子句內容，
+            例如 "explode(city_license_plates) plates AS plate_city, plate_count"。
+        order_by (str, optional): ORDER BY 子句內容。
+        limit (int, optional): 返回的最大行數。
+
+    Returns:
+        dict: 包含操作結果的字典，data 中每行的鍵為 select 的別名。
+    """
+    try:
+        query_sql, params = _build_aggregate_sql(table_name, config, select, group_by, filters,
+                                                 conditions, lateral_view, order_by, limit)
+
+        logging.info(f"执行聚合 SQL:\n{query_sql}\n参数: {params}")
+        with get_hive_pool(config).cursor() as cursor:
+            cursor.execute(query_sql, params or None)
+            rows = cursor.fetchall()
+        aliases = list(select.keys())
+        results = [dict(zip(aliases, row)) for row in rows]
+
+        return {"status": "success", "data": results, "message": f"聚合查询返回 {len(results)} 行"}
+
+    except Exception as e:
+        logging.error(f"对表 '{table_name}' 执行聚合查询失败: {e}")
+        return {"status": "error", "message": f"聚合查询失败: {e}"}
+
+
+def insert_from_hive_aggregate(target_table, source_table, config, select, overwrite=False, **query):
+    """
+    把聚合查詢的結果寫入另一張表（INSERT INTO/OVERWRITE ... SELECT），數據不經過應用。
+
+    Args:
+        target_table (str): 目標表名，select 的順序必須與目標表的列順序一致。
+        source_table (str): 被聚合的表名，可以與目標表相同（例如合併明細行）。
+        config (dict): Hive 連接配置。
+        select (dict): 輸出列別名 -> SQL 表達式。
+        overwrite (bool): 為 True 時覆蓋目標表原有數據。
+        **query: group_by / filters / conditions / lateral_view，含義同 aggregate_from_hive_table。
+
+    Returns:
+        dict: 包含操作結果的字典。
+    """
+    try:
+        select_sql, params = _build_aggregate_sql(source_table, config, select, **query)
+        mode = 'OVERWRITE' if overwrite else 'INTO'
+        insert_sql = f"INSERT {mode} TABLE {config['database']}.{target_table} {select_sql}"
+
+        logging.info(f"執行聚合寫入 SQL:\n{insert_sql}\n參數: {params}")
+        with get_hive_pool(config).cursor() as cursor:
+            cursor.execute(insert_sql, params or None)
+        return {"status": "success", "message": f"聚合結果已寫入表 '{target_table}'"}
+
+    except Exception as e:
+        logging.error(f"將 '{source_table}' 的聚合結果寫入 '{target_table}' 失敗: {e}")
+        return {"status": "error", "message": f"聚合寫入失敗: {e}"}